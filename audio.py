@@ -1,63 +1,159 @@
-import sounddevice as sd
 import numpy as np
-import scipy.io.wavfile as wavfile
-import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from processing import SamplePipeline, gain_to_db
+from tones import ToneCache
+from engine import AudioEngine
+from devices import DeviceRegistry
+import wavio
+from encoding import write_sample, output_path
+from workqueue import WorkQueue
+from preview import PreviewCache
+from library import channel_path, record_loudness
+import runthrough
+from tuning import get_tuning
+import calibration
+from instrument import tracer, traced, report_error
 
 class AudioManager:
-    def __init__(self, sample_rate=48000):
+    def __init__(self, sample_rate=48000, engine=None, devices=None):
         self.sample_rate = sample_rate
-        self.notes = {
-            'C': 0, 'C#': 1, 'D': 2, 'D#': 3, 'E': 4, 'F': 5,
-            'F#': 6, 'G': 7, 'G#': 8, 'A': 9, 'A#': 10, 'B': 11
-        }
+        self.engine = engine or AudioEngine()
+        # sounddevice is imported (and PortAudio initialized) on first use, normally by probe_devices()
+        self.devices = devices or DeviceRegistry()
+        # tuning.TEMPERAMENTS name and its root pitch class, or a Scala file that replaces it
+        self.temperament = 'equal'
+        self.temperament_root = 0
+        self.scale_file = None
+        self.tone_cache = ToneCache(self.render_tone)
+        # Takes at least this long (seconds) are streamed to disk instead of held in memory
+        self.stream_to_disk_after = 20.0
+        # Keyword arguments for processing.SamplePipeline
+        self.pipeline_settings = {}
+        # One of encoding.ENCODINGS; PCM encodings are TPDF-dithered unless output_dither is False
+        self.output_encoding = 'float32'
+        self.output_dither = True
+        # Inputs recorded at once; each channel is saved as its own take (<note>_<n>_ch<k>)
+        self.input_channels = 1
+        # Round-trip latency (frames) of the current device pair, from the calibration cache
+        self.latency_frames = 0
+        # Takes are processed, encoded and written here, off the interaction path
+        self.work_queue = WorkQueue(dispatch=self.engine.dispatch)
+        # Decoded takes for Play Back, seeded with each take's processed buffer as it is saved
+        self.previews = PreviewCache()
+
+    @property
+    def sd(self):
+        return self.devices.sd
+
+    def in_background(self, job, *args, on_done=None, name="device-probe"):
+        # Runs job on its own thread; on_done receives its result (None on failure) through the engine's dispatcher
+        def run():
+            try:
+                result = job(*args)
+            except Exception:
+                report_error(name)
+                result = None
+            if on_done:
+                self.engine.dispatch(on_done, result)
+
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def probe_devices(self, on_done=None, refresh=False):
+        # Enumerates the devices, picks the defaults and probes their sample rates off the UI thread;
+        # with many interfaces the first enumeration alone can take seconds. refresh re-initializes
+        # PortAudio first to pick up hot-plugged hardware.
+        return self.in_background(self.scan_devices, refresh, on_done=on_done)
+
+    @traced('scan_devices')
+    def scan_devices(self, refresh=False):
+        if refresh:
+            self.devices.invalidate()
+        self.devices.query()
         self.set_default_devices()
+        self.sample_rates_for(self.devices.name(self.sd.default.device[0]), self.devices.default_output_name())
+        return True
+
+    def sample_rates_for(self, input_name, output_name):
+        # (sample rates both devices support, input channels available); probes are cached per device
+        input_id = self.devices.index(input_name, 'input')
+        output_id = self.devices.index(output_name, 'output')
+        rates = set(self.devices.supported_rates(input_id, 'input', 1))
+        rates.update(self.devices.supported_rates(output_id, 'output', 2))
+        return sorted(rates) or [44100, 48000, 96000], max(1, self.devices.max_channels(input_id, 'input'))
+
+    def probe_sample_rates(self, input_name, output_name, on_done=None):
+        return self.in_background(self.sample_rates_for, input_name, output_name, on_done=on_done)
 
     def set_default_devices(self):
-        devices = sd.query_devices()
-        output_devices = [d for d in devices if d['max_output_channels'] > 0]
-        input_devices = [d for d in devices if d['max_input_channels'] > 0]
-        if output_devices:
-            default_output = sd.query_devices(kind='output')
-            sd.default.device[1] = devices.index(default_output) if default_output else devices.index(output_devices[0])
-        if input_devices:
-            sd.default.device[0] = devices.index(input_devices[0])
+        output_names = self.devices.output_names()
+        input_names = self.devices.input_names()
+        if output_names:
+            default_output = self.devices.default_output
+            self.sd.default.device[1] = default_output if default_output is not None else self.devices.index(output_names[0], 'output')
+        if input_names:
+            self.sd.default.device[0] = self.devices.index(input_names[0], 'input')
 
     def set_sample_rate(self, sample_rate):
         self.sample_rate = sample_rate
-        sd.default.samplerate = sample_rate
+        self.sd.default.samplerate = sample_rate
+        self.load_latency()
+
+    def load_latency(self):
+        self.latency_frames = self.devices.latency(self.sd.default.device[0], self.sd.default.device[1], self.sample_rate) or 0
+        return self.latency_frames
+
+    def calibrate_latency(self, on_done=None):
+        # Needs the output patched (or a speaker near the mic) into the input; on_done receives the
+        # measured latency in frames, or None if the test signal was not heard clearly
+        input_device, output_device = self.sd.default.device[0], self.sd.default.device[1]
+
+        def measured(frames):
+            if frames is not None:
+                self.latency_frames = frames
+                try:
+                    self.devices.set_latency(input_device, output_device, self.sample_rate, frames)
+                except Exception:
+                    pass
+            if on_done:
+                on_done(frames)
+
+        calibration.measure_latency(self.engine, self.sample_rate, input_device, output_device, measured)
 
     def set_output_device(self, output_device):
-        devices = sd.query_devices()
-        device_id = next((i for i, d in enumerate(devices) if d['name'] == output_device), None)
-        if device_id is not None:
-            try:
-                sd.check_output_settings(device=device_id, samplerate=self.sample_rate, channels=2)
-                sd.default.device[1] = device_id
-            except:
-                self.set_default_devices()
+        device_id = self.devices.index(output_device, 'output')
+        if device_id is not None and self.devices.supports(device_id, 'output', self.sample_rate, 2):
+            self.sd.default.device[1] = device_id
         else:
             self.set_default_devices()
+        self.load_latency()
 
     def set_input_device(self, input_device):
-        devices = sd.query_devices()
-        device_id = next((i for i, d in enumerate(devices) if d['name'] == input_device), None)
-        if device_id is not None:
-            try:
-                sd.check_input_settings(device=device_id, samplerate=self.sample_rate, channels=1)
-                sd.default.device[0] = device_id
-            except:
-                self.set_default_devices()
+        device_id = self.devices.index(input_device, 'input')
+        if device_id is not None and self.devices.supports(device_id, 'input', self.sample_rate, self.input_channels):
+            self.sd.default.device[0] = device_id
         else:
+            self.input_channels = 1
             self.set_default_devices()
+        self.load_latency()
+
+    def set_temperament(self, temperament='equal', root=0, scale_file=None):
+        # Loads (and validates) the table up front
+        get_tuning(440.0, temperament, root, scale_file)
+        self.temperament = temperament
+        self.temperament_root = root
+        self.scale_file = scale_file
+        # Cached guide tones were rendered in the previous tuning
+        self.tone_cache.clear()
+
+    def tuning_for(self, tuning=440.0):
+        return get_tuning(float(tuning), self.temperament, self.temperament_root, self.scale_file)
 
     def note_to_frequency(self, note, tuning=440.0):
-        note_name = note[:-1]
-        octave = int(note[-1])
-        semitone = self.notes[note_name]
-        midi_note = 12 * (octave + 1) + semitone  # Shift up one octave
-        # Use high-precision equal temperament formula
-        frequency = 2.0 ** ((midi_note - 69) / 12.0) * tuning
-        return frequency
+        return self.tuning_for(tuning).frequency(note)
 
     def generate_wave(self, frequency, t, waveform='sine'):
         if waveform == 'triangle':
@@ -70,38 +166,227 @@ class AudioManager:
             audio = np.sin(2 * np.pi * frequency * t)
         return audio
 
-    def play_sine_wave(self, frequency, duration=2.0, waveform='sine'):
+    @traced('render_tone')
+    def render_tone(self, note, tuning, waveform, sample_rate, duration):
+        frequency = self.note_to_frequency(note, tuning)
+        t = np.linspace(0, duration, int(sample_rate * duration), False)
+        audio = 0.98 * self.generate_wave(frequency, t, waveform)
+        # Add octave higher for low notes (below C4, adjusted for octave shift)
+        if frequency < self.note_to_frequency("C4", tuning):
+            audio += 0.98 * self.generate_wave(frequency * 2, t, waveform)
+            audio /= 2
+        return audio.astype(np.float32)
+
+    def get_tone(self, note, tuning=440.0, waveform='sine', duration=2.0, sample_rate=None):
+        return self.tone_cache.get(note, tuning, waveform, sample_rate or self.sample_rate, duration)
+
+    def prewarm_tones(self, notes, tuning=440.0, waveform='sine', duration=2.0):
+        return self.tone_cache.prewarm(notes, tuning, waveform, self.sample_rate, duration)
+
+    def play_sine_wave(self, frequency, duration=2.0, waveform='sine', on_done=None):
         try:
-            t = np.linspace(0, duration, int(self.sample_rate * duration), False)
-            audio = 0.98 * self.generate_wave(frequency, t, waveform)
-            # Add octave higher for low notes (below C4, adjusted for octave shift)
-            if frequency < self.note_to_frequency("C4"):
-                audio += 0.98 * self.generate_wave(frequency * 2, t, waveform)
-                audio /= 2
-            sd.play(audio.astype(np.float32), self.sample_rate, device=sd.default.device[1])
-            sd.wait()
-        except:
-            pass
-
-    def record_audio(self, duration, output_file):
+            with tracer.span('synthesize_sine_wave', frequency=frequency):
+                t = np.linspace(0, duration, int(self.sample_rate * duration), False)
+                audio = 0.98 * self.generate_wave(frequency, t, waveform)
+                # Add octave higher for low notes (below C4, adjusted for octave shift)
+                if frequency < self.note_to_frequency("C4"):
+                    audio += 0.98 * self.generate_wave(frequency * 2, t, waveform)
+                    audio /= 2
+            self.engine.play(audio, self.sample_rate, self.sd.default.device[1], on_done)
+        except Exception:
+            report_error('play_sine_wave')
+            if on_done:
+                on_done()
+
+    def play_note(self, note, tuning=440.0, duration=2.0, waveform='sine', on_done=None):
         try:
-            recording = sd.rec(int(duration * self.sample_rate), samplerate=self.sample_rate, channels=1, device=sd.default.device[0], dtype='float32')
-            sd.wait()
-            threshold = 0.01
-            non_silent_idx = np.where(np.abs(recording) > threshold)[0]
-            if len(non_silent_idx) > 0:
-                recording = recording[non_silent_idx[0]:]
-            recording = recording / max(np.abs(recording).max(), 1e-10)
-            wavfile.write(output_file, self.sample_rate, recording)
-        except:
-            pass
-
-    def play_sample(self, sample_path):
+            self.engine.play(self.get_tone(note, tuning, waveform, duration), self.sample_rate, self.sd.default.device[1], on_done)
+        except Exception:
+            report_error('play_note')
+            if on_done:
+                on_done()
+
+    def make_pipeline(self, sample_rate=None):
+        return SamplePipeline(sample_rate or self.sample_rate, **self.pipeline_settings)
+
+    def take_paths(self, output_file, channels):
+        if channels == 1:
+            return [output_path(output_file, self.output_encoding)]
+        return [output_path(channel_path(output_file, channel + 1), self.output_encoding) for channel in range(channels)]
+
+    def record_audio(self, duration, output_file, on_done=None, on_captured=None):
+        # on_captured receives the paths the takes will be saved under as soon as capture ends; the
+        # buffer is then processed and written on the work queue (keyed by output_file), and on_done
+        # receives the list of saved takes, one per input channel (empty on failure)
+        capture = tracer.begin('capture', file=os.path.basename(output_file), seconds=duration)
+
+        def captured(recording):
+            capture.end()
+            if on_captured:
+                on_captured(self.take_paths(output_file, recording.shape[1] if recording.ndim == 2 else 1))
+            self.work_queue.submit(self.save_channels, recording, output_file, on_done=saved, key=output_file)
+
+        def saved(saved_files):
+            if on_done:
+                on_done(saved_files or [])
+
+        def streamed(path):
+            # The capture file is complete; processing and encoding follow on the work queue
+            capture.end(error=path is None)
+            if path is None:
+                if on_captured:
+                    on_captured([])
+                saved([])
+                return
+            self.work_queue.submit(self.finish_streamed_recording, output_file, on_done=saved, key=output_file)
+            if on_captured:
+                on_captured(self.take_paths(output_file, channels))
+
+        try:
+            frames = int(duration * self.sample_rate)
+            channels = self.input_channels
+            if duration >= self.stream_to_disk_after:
+                self.engine.record_to_file(output_file, frames, self.sample_rate, self.sd.default.device[0], channels, streamed)
+            else:
+                self.engine.record(frames, self.sample_rate, self.sd.default.device[0], self.input_channels, captured)
+        except Exception:
+            report_error('record_audio')
+            capture.end(error=True)
+            if on_captured:
+                on_captured([])
+            if on_done:
+                on_done([])
+
+    def discard_takes(self, output_file, saved_files):
+        # Deletes a take's files once its pending write (if any) has finished
+        def remove():
+            self.work_queue.wait(output_file)
+            for saved_file in saved_files:
+                self.previews.discard(saved_file)
+                try:
+                    os.remove(saved_file)
+                except FileNotFoundError:
+                    pass
+
+        self.work_queue.submit(remove)
+
+    def save_channels(self, recording, output_file, sample_rate=None):
+        # Each channel is a strided view into the interleaved buffer, so splitting copies nothing;
+        # the channels are processed and written in parallel (numpy releases the GIL)
+        channels = recording.shape[1] if recording.ndim == 2 else 1
+        if channels == 1:
+            saved_file = self.save_recording(recording, output_file, sample_rate)
+            return [saved_file] if saved_file else []
+        views = [recording[:, channel] for channel in range(channels)]
+        paths = [channel_path(output_file, channel + 1) for channel in range(channels)]
+        with ThreadPoolExecutor(max_workers=channels) as executor:
+            saved_files = list(executor.map(lambda view, path: self.save_recording(view, path, sample_rate), views, paths))
+        return [saved_file for saved_file in saved_files if saved_file]
+
+    def record_runthrough(self, notes, capture_file, take_file, tuning=440.0, waveform='sine', guide_s=2.0, sing_s=2.5, gap_s=0.5, on_done=None):
+        # Plays every guide tone back to back on a full-duplex stream while the capture streams to disk,
+        # then slices it into per-note takes on the writer thread, shifting the schedule by the
+        # calibrated latency. Returns the schedule; on_done gets {note: path}. The continuous capture is
+        # deleted once it has been sliced, and kept if slicing fails.
+        schedule, frames = runthrough.build_schedule(notes, self.sample_rate, guide_s, sing_s, gap_s)
+        guide = runthrough.render_guide(schedule, frames, lambda note: self.get_tone(note, tuning, waveform, guide_s))
+        takes = {}
+
+        def slice_capture(path):
+            takes.update(runthrough.slice_capture(path, schedule, take_file, self.make_pipeline(),
+                                                  self.output_encoding, self.output_dither, self.latency_frames))
+            os.remove(path)
+            return path
+
+        def captured(path):
+            if on_done:
+                on_done(takes)
+
+        frames += self.latency_frames
+        self.engine.play_record(guide, frames, self.sample_rate, self.sd.default.device[0], self.sd.default.device[1], 1, captured,
+                                capture_file, slice_capture)
+        return schedule
+
+    def stop_runthrough(self):
+        self.engine.stop_playback()
+        self.engine.stop_capture()
+
+    def save_recording(self, recording, output_file, sample_rate=None):
+        # Returns the path written (its extension follows output_encoding), or None on failure
+        sample_rate = sample_rate or self.sample_rate
+        try:
+            with tracer.span('postprocess', frames=len(recording)):
+                recording, analysis = self.make_pipeline(sample_rate).process(recording)
+            with tracer.span('write', encoding=self.output_encoding):
+                saved_file = write_sample(output_file, recording, sample_rate, self.output_encoding, self.output_dither)
+            self.previews.put(saved_file, sample_rate, recording)
+            record_loudness({saved_file: (analysis.loudness, gain_to_db(analysis.gain))})
+            return saved_file
+        except Exception:
+            report_error('save_recording')
+            return None
+
+    def finish_streamed_recording(self, output_file):
+        # Returns the list of saved takes
+        sample_rate, data = wavio.open_memmap(output_file)
+        if data.shape[1] > 1:
+            # Split straight from the memory-mapped capture, then drop the interleaved file
+            saved_files = self.split_streamed_channels(data, output_file, sample_rate)
+            del data
+            os.remove(output_file)
+            return saved_files
+        with tracer.span('postprocess', frames=len(data), streamed=True):
+            analysis = self.make_pipeline(sample_rate).process_in_place(data)
+            data.flush()
+        del data
+        wavio.truncate(output_file, analysis.frames)
+        return [self.encode_streamed(output_file, analysis)]
+
+    def split_streamed_channels(self, data, output_file, sample_rate):
+        # Each channel is analyzed and processed chunk by chunk from its strided view of the capture and
+        # written straight to its own float file, so memory stays flat whatever the take length
+        def save_channel(channel):
+            path = channel_path(output_file, channel + 1)
+            try:
+                view = data[:, channel]
+                pipeline = self.make_pipeline(sample_rate)
+                with tracer.span('postprocess', frames=len(view), streamed=True, channel=channel + 1):
+                    analysis = pipeline.analyze(view)
+                    with wavio.WavWriter(path, sample_rate) as writer:
+                        for _, chunk in pipeline.processed_chunks(view, analysis):
+                            writer.write(chunk)
+                return self.encode_streamed(path, analysis)
+            except Exception:
+                report_error('finish_streamed_recording')
+                return None
+
+        channels = data.shape[1]
+        with ThreadPoolExecutor(max_workers=channels) as executor:
+            saved_files = list(executor.map(save_channel, range(channels)))
+        return [saved_file for saved_file in saved_files if saved_file]
+
+    def encode_streamed(self, float_file, analysis):
+        # Re-encodes a processed float take chunk by chunk and swaps it in; returns the final path
+        if self.output_encoding != 'float32':
+            sample_rate, data = wavio.open_memmap(float_file, mode='r')
+            directory, name = os.path.split(float_file)
+            with tracer.span('write', encoding=self.output_encoding, streamed=True):
+                encoded_file = write_sample(os.path.join(directory, "." + name), data, sample_rate, self.output_encoding, self.output_dither)
+            del data
+            final_file = os.path.join(directory, os.path.basename(encoded_file)[1:])
+            os.replace(encoded_file, final_file)
+            if final_file != float_file:
+                os.remove(float_file)
+        else:
+            final_file = float_file
+        record_loudness({final_file: (analysis.loudness, gain_to_db(analysis.gain))})
+        return final_file
+
+    def play_sample(self, sample_path, on_done=None, device=None):
         try:
-            fs, data = scipy.io.wavfile.read(sample_path)
-            if data.dtype != np.float32:
-                data = data.astype(np.float32) / np.iinfo(data.dtype).max
-            sd.play(data, fs, device=sd.default.device[1])
-            sd.wait()
-        except:
-            pass
+            fs, data = self.previews.get(sample_path)
+            self.engine.play(data, fs, self.sd.default.device[1] if device is None else device, on_done)
+        except Exception:
+            report_error('play_sample')
+            if on_done:
+                on_done()
@@ -0,0 +1,222 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from encoding import ENCODINGS, convert_library, read_sample, remove_replaced, write_sample
+from export import LibraryExporter, parse_variant
+from processing import SamplePipeline, gain_to_db
+from library import LibraryIndex, scan_samples
+from loops import find_library_loops
+from monolith import Monolith
+from pitch_detect import check_library, tune_opcodes, write_report
+from keymap import merge_region_opcodes
+from tuning import NOTE_NAMES, TEMPERAMENTS, get_tuning
+from sfz import SFZGenerator
+
+
+def process_file(input_path, output_path, pipeline_settings=None, encoding='float32', prior_gain_db=0.0):
+    # Returns (written path, loudness of the original recording, total gain applied). prior_gain_db is
+    # the gain already in the input take, so reprocessing keeps measuring the take as it was sung.
+    sample_rate, data = read_sample(input_path)
+    recording, analysis = SamplePipeline(sample_rate, **(pipeline_settings or {})).process(data)
+    path = write_sample(output_path, recording, sample_rate, encoding)
+    gain_db = gain_to_db(analysis.gain)
+    return path, analysis.loudness - prior_gain_db, prior_gain_db + gain_db
+
+
+class BatchBuilder:
+    def __init__(self, sample_dir, output_dir=None, workers=None, pipeline_settings=None, encoding='float32'):
+        self.sample_dir = sample_dir
+        self.output_dir = output_dir or sample_dir
+        self.workers = workers
+        self.pipeline_settings = pipeline_settings or {}
+        self.encoding = encoding
+        self.sfz_generator = SFZGenerator()
+
+    def process_samples(self, samples):
+        os.makedirs(self.output_dir, exist_ok=True)
+        processed = {note: [] for note in samples}
+        source = LibraryIndex(self.sample_dir)
+        measurements = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = []
+            for note, sample_list in samples.items():
+                for sample_path in sample_list:
+                    output_path = os.path.join(self.output_dir, os.path.basename(sample_path))
+                    futures.append((note, sample_path, executor.submit(process_file, sample_path, output_path,
+                                                                       self.pipeline_settings, self.encoding,
+                                                                       source.gain_db(sample_path))))
+            for note, sample_path, future in futures:
+                path, loudness, gain_db = future.result()
+                remove_replaced(sample_path, path)
+                processed[note].append(path)
+                measurements[path] = (loudness, gain_db)
+        LibraryIndex(self.output_dir).update_loudness(measurements)
+        return processed
+
+    def build(self, sfz_filename='choir.sfz', sfz_params=None, process=True):
+        samples = scan_samples(self.sample_dir)
+        if process:
+            samples = self.process_samples(samples)
+        region_opcodes = None
+        if sfz_params and sfz_params.get('loop_auto'):
+            region_opcodes = find_library_loops(samples, self.workers)
+        if sfz_params and sfz_params.get('tune_from_pitch'):
+            results = check_library(samples, sfz_params.get('tuning', 440.0), workers=self.workers)
+            region_opcodes = merge_region_opcodes(region_opcodes, tune_opcodes(results))
+        os.makedirs(self.output_dir, exist_ok=True)
+        output_sfz = os.path.join(self.output_dir, sfz_filename)
+        self.sfz_generator.generate_sfz(samples, output_sfz, self.output_dir, sfz_params, incremental=True, region_opcodes=region_opcodes)
+        return output_sfz, samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless tools for Choir Maker sample libraries")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Trim, normalize and map a folder of <note>_<n>.wav takes into an SFZ")
+    build_parser.add_argument('sample_dir')
+    build_parser.add_argument('--output-dir', help="Write processed takes and the SFZ here (default: in place)")
+    build_parser.add_argument('--sfz', default='choir.sfz', help="SFZ filename")
+    build_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    build_parser.add_argument('--onset-db', type=float, default=-40.0, help="Block RMS level that starts a take (dBFS)")
+    build_parser.add_argument('--offset-db', type=float, default=-50.0, help="Block RMS level below which the tail is trimmed (dBFS)")
+    build_parser.add_argument('--target', choices=['peak', 'rms'], default='peak', help="Normalize to a peak or RMS level")
+    build_parser.add_argument('--target-db', type=float, default=0.0, help="Target level (dBFS)")
+    build_parser.add_argument('--fade-in-ms', type=float, default=2.0)
+    build_parser.add_argument('--fade-out-ms', type=float, default=20.0)
+    build_parser.add_argument('--encoding', choices=ENCODINGS, default='float32', help="Output sample format")
+    build_parser.add_argument('--loop-mode', choices=['no_loop', 'one_shot', 'loop_continuous', 'loop_sustain'], default='no_loop')
+    build_parser.add_argument('--auto-loop', action='store_true', help="Find loop_start/loop_end for every sample (looping modes only)")
+    build_parser.add_argument('--channel-layout', choices=['pan_cycle', 'stereo_spread', 'round_robin'], default='pan_cycle',
+                              help="How takes of one note are placed: cycled pans, channels spread across the stereo field, or round robins")
+    build_parser.add_argument('--spread-keys', action='store_true', help="Stretch each note over the unrecorded keys around it")
+    build_parser.add_argument('--max-stretch', type=int, default=None, help="Limit --spread-keys to this many semitones either side")
+    build_parser.add_argument('--tune-from-pitch', action='store_true', help="Add a per-region tune opcode that cancels each take's measured detuning")
+    build_parser.add_argument('--tuning', type=float, default=440.0, help="Reference A4 (Hz) for --tune-from-pitch")
+    build_parser.add_argument('--velocity-layers', type=int, default=0,
+                              help="Split each note's takes into this many velocity layers by measured loudness")
+    build_parser.add_argument('--no-process', action='store_true', help="Only write the SFZ, leave the takes untouched")
+
+    monolith_parser = subparsers.add_parser('monolith', help="Pack every take into one audio file and write an SFZ with offset/end regions")
+    monolith_parser.add_argument('sample_dir')
+    monolith_parser.add_argument('--output', default=None, help="Monolith WAV path (default: <sample_dir>/choir_monolith.wav)")
+    monolith_parser.add_argument('--sfz', default='choir_monolith.sfz', help="SFZ filename, written next to the monolith")
+    monolith_parser.add_argument('--slack', type=float, default=0.25, help="Spare capacity per take for in-place replacement")
+    monolith_parser.add_argument('--spread-keys', action='store_true', help="Stretch each note over the unrecorded keys around it")
+    monolith_parser.add_argument('--max-stretch', type=int, default=None, help="Limit --spread-keys to this many semitones either side")
+    monolith_parser.add_argument('--velocity-layers', type=int, default=0,
+                                 help="Split each note's takes into this many velocity layers by measured loudness")
+    monolith_parser.add_argument('--rebuild', action='store_true', help="Repack from scratch instead of updating changed takes")
+
+    convert_parser = subparsers.add_parser('convert', help="Re-encode a library as 16/24-bit PCM or FLAC and write a matching SFZ")
+    convert_parser.add_argument('sample_dir')
+    convert_parser.add_argument('output_dir')
+    convert_parser.add_argument('--encoding', choices=ENCODINGS, default='pcm24')
+    convert_parser.add_argument('--no-dither', action='store_true', help="Truncate without TPDF dither")
+    convert_parser.add_argument('--sfz', default='choir.sfz', help="SFZ filename, written into output_dir")
+    convert_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+
+    export_parser = subparsers.add_parser('export', help="Resample and re-encode a library into several rate/format variants, each with its own SFZ")
+    export_parser.add_argument('sample_dir')
+    export_parser.add_argument('output_dir')
+    export_parser.add_argument('--variant', action='append', default=None,
+                               help="RATE[:ENCODING], e.g. 48000:pcm24; repeat for each variant (default: 44100:pcm16, 48000:pcm24, 96000:pcm24)")
+    export_parser.add_argument('--no-dither', action='store_true', help="Truncate without TPDF dither")
+    export_parser.add_argument('--sfz', default='choir.sfz', help="SFZ filename, written into every variant folder")
+    export_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    export_parser.add_argument('--loop-mode', choices=['no_loop', 'one_shot', 'loop_continuous', 'loop_sustain'], default='no_loop')
+    export_parser.add_argument('--auto-loop', action='store_true', help="Find loop_start/loop_end for every sample (looping modes only)")
+    export_parser.add_argument('--channel-layout', choices=['pan_cycle', 'stereo_spread', 'round_robin'], default='pan_cycle')
+    export_parser.add_argument('--spread-keys', action='store_true', help="Stretch each note over the unrecorded keys around it")
+    export_parser.add_argument('--max-stretch', type=int, default=None, help="Limit --spread-keys to this many semitones either side")
+    export_parser.add_argument('--tune-from-pitch', action='store_true', help="Add a per-region tune opcode that cancels each take's measured detuning")
+    export_parser.add_argument('--tuning', type=float, default=440.0, help="Reference A4 (Hz) for --tune-from-pitch")
+    export_parser.add_argument('--velocity-layers', type=int, default=0,
+                               help="Split each note's takes into this many velocity layers by loudness")
+
+    pitch_parser = subparsers.add_parser('check-pitch', help="Measure every take's pitch against its note and report off-pitch takes")
+    pitch_parser.add_argument('sample_dir')
+    pitch_parser.add_argument('--tuning', type=float, default=440.0, help="Reference A4 (Hz)")
+    pitch_parser.add_argument('--temperament', choices=list(TEMPERAMENTS), default='equal')
+    pitch_parser.add_argument('--root', choices=NOTE_NAMES, default='C', help="Root pitch class of the temperament")
+    pitch_parser.add_argument('--scala', default=None, help="Scala (.scl) tuning file, mapped from --root upwards")
+    pitch_parser.add_argument('--tolerance', type=float, default=30.0, help="Allowed deviation (cents)")
+    pitch_parser.add_argument('--report', default=None, help="CSV report path (default: <sample_dir>/pitch_report.csv)")
+    pitch_parser.add_argument('--reject', action='store_true', help="Move off-pitch takes into <sample_dir>/rejected")
+    pitch_parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        sfz_filename = args.sfz if args.sfz.endswith('.sfz') else args.sfz + '.sfz'
+        pipeline_settings = {
+            'onset_db': args.onset_db,
+            'offset_db': args.offset_db,
+            'target': args.target,
+            'target_db': args.target_db,
+            'fade_in_ms': args.fade_in_ms,
+            'fade_out_ms': args.fade_out_ms,
+        }
+        builder = BatchBuilder(args.sample_dir, args.output_dir, args.workers, pipeline_settings, args.encoding)
+        sfz_params = dict(builder.sfz_generator.default_params, loop_mode=args.loop_mode, channel_layout=args.channel_layout,
+                          key_spread=args.spread_keys, max_stretch=args.max_stretch, velocity_layers=args.velocity_layers,
+                          tune_from_pitch=args.tune_from_pitch, tuning=args.tuning,
+                          loop_auto=args.auto_loop and args.loop_mode in ['loop_continuous', 'loop_sustain'])
+        output_sfz, samples = builder.build(sfz_filename, sfz_params, process=not args.no_process)
+        print(f"Wrote {output_sfz} ({sum(len(s) for s in samples.values())} regions, {len(samples)} notes)")
+    elif args.command == 'monolith':
+        monolith_file = args.output or os.path.join(args.sample_dir, 'choir_monolith.wav')
+        samples = scan_samples(args.sample_dir)
+        monolith = Monolith(monolith_file, args.slack)
+        if args.rebuild:
+            monolith.build(samples)
+            written = sum(len(s) for s in samples.values())
+        else:
+            written = monolith.update(samples)
+        sfz_filename = args.sfz if args.sfz.endswith('.sfz') else args.sfz + '.sfz'
+        output_sfz = os.path.join(os.path.dirname(monolith_file) or '.', sfz_filename)
+        generator = SFZGenerator()
+        sfz_params = dict(generator.default_params, key_spread=args.spread_keys, max_stretch=args.max_stretch,
+                          velocity_layers=args.velocity_layers)
+        generator.generate_sfz(samples, output_sfz, args.sample_dir, sfz_params, incremental=True,
+                               region_opcodes=monolith.region_opcodes(samples))
+        print(f"Wrote {monolith_file} ({written} takes written) and {output_sfz}")
+    elif args.command == 'convert':
+        samples = convert_library(scan_samples(args.sample_dir), args.output_dir, args.encoding, not args.no_dither, args.workers)
+        sfz_filename = args.sfz if args.sfz.endswith('.sfz') else args.sfz + '.sfz'
+        output_sfz = os.path.join(args.output_dir, sfz_filename)
+        SFZGenerator().generate_sfz(samples, output_sfz, args.output_dir, incremental=True)
+        print(f"Converted {sum(len(s) for s in samples.values())} takes to {args.encoding} in {args.output_dir}; wrote {output_sfz}")
+    elif args.command == 'export':
+        try:
+            variants = [parse_variant(text) for text in args.variant or ['44100:pcm16', '48000:pcm24', '96000:pcm24']]
+        except ValueError as e:
+            parser.error(str(e))
+        sfz_filename = args.sfz if args.sfz.endswith('.sfz') else args.sfz + '.sfz'
+        exporter = LibraryExporter(args.output_dir, variants, args.workers, not args.no_dither)
+        sfz_params = dict(SFZGenerator().default_params, loop_mode=args.loop_mode, channel_layout=args.channel_layout,
+                          key_spread=args.spread_keys, max_stretch=args.max_stretch, velocity_layers=args.velocity_layers,
+                          tune_from_pitch=args.tune_from_pitch, tuning=args.tuning,
+                          loop_auto=args.auto_loop and args.loop_mode in ['loop_continuous', 'loop_sustain'])
+        written_sfz, written = exporter.build(args.sample_dir, sfz_filename, sfz_params)
+        for name, output_sfz in written_sfz:
+            print(f"{name}: {output_sfz}")
+        print(f"Exported {len(written_sfz)} variants ({written} files written, the rest unchanged)")
+    elif args.command == 'check-pitch':
+        tuning = get_tuning(args.tuning, args.temperament, NOTE_NAMES.index(args.root), args.scala)
+        results = check_library(scan_samples(args.sample_dir), tuning, args.tolerance, args.workers)
+        report_file = args.report or os.path.join(args.sample_dir, 'pitch_report.csv')
+        write_report(results, report_file)
+        rejected = [path for path, _, result in results if not result.ok]
+        if args.reject and rejected:
+            reject_dir = os.path.join(args.sample_dir, 'rejected')
+            os.makedirs(reject_dir, exist_ok=True)
+            for path in rejected:
+                os.replace(path, os.path.join(reject_dir, os.path.basename(path)))
+        print(f"Checked {len(results)} takes, {len(rejected)} off pitch; report written to {report_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
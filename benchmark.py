@@ -0,0 +1,551 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# Every suite runs against the simulated sounddevice, never real hardware. It is handed to the audio
+# classes directly; main() also registers it as `sounddevice` for the benchmark process only.
+import fake_sounddevice as sd
+
+import encoding
+import fake_tkinter
+import wavio
+from audio import AudioManager
+from devices import DeviceRegistry
+from engine import AudioEngine, SoundDeviceBackend
+from gui import ChoirRecorderGUI
+from instrument import tracer
+from main import ChoirRecorderApp
+from processing import SamplePipeline
+from sfz import SFZGenerator
+from tuning import note_sequence
+
+SUITES = ['sfz', 'processing', 'encoding', 'tones', 'record', 'session', 'startup']
+
+# Runs in a fresh interpreter so module imports are measured cold
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import numpy
+numpy_loaded = time.perf_counter()
+import fake_sounddevice, fake_tkinter
+sd = fake_sounddevice.install()
+fake_tkinter.install()
+sd.add_interfaces({interfaces})
+sd.QUERY_DELAY, sd.CHECK_DELAY = {query_delay}, {check_delay}
+import main
+imported = time.perf_counter()
+loaded = [name for name in ('scipy', 'soundfile') if name in sys.modules]
+from benchmark import startup_session
+print(json.dumps(dict(startup_session(start, imported, loaded, {tmp!r}), numpy_import_s=numpy_loaded - start)))
+'''
+
+
+def synthetic_library(region_count, first='C2', last='G9'):
+    # Spreads region_count takes as evenly as possible over every note in the range
+    notes = note_sequence(first, last)
+    samples = {note: [] for note in notes}
+    for i in range(region_count):
+        note = notes[i % len(notes)]
+        samples[note].append(f"{note}_{len(samples[note]) + 1}.wav")
+    return {note: takes for note, takes in samples.items() if takes}
+
+
+def legacy_generate_sfz(generator, samples, output_file, sfz_params):
+    # The original whole-string implementation, kept as a baseline
+    sfz_content = generator.render_group(sfz_params)
+    for note, sample_list in samples.items():
+        midi_note = generator.note_to_midi_number(note)
+        for i, sample_path in enumerate(sample_list):
+            pan = generator.pan_values[i % len(generator.pan_values)]
+            sfz_content += f"<region> sample={os.path.basename(sample_path)} key={midi_note} pan={pan}\n"
+        sfz_content += "\n"
+    with open(output_file, 'w') as f:
+        f.write(sfz_content)
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def peak_memory(func, *args, **kwargs):
+    # Peak bytes allocated (Python objects and numpy buffers, on any thread) while func runs. Kept
+    # separate from timed() because tracing slows everything down.
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_sfz(region_counts=(10000, 100000)):
+    generator = SFZGenerator()
+    params = generator.default_params
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in region_counts:
+            samples = synthetic_library(count)
+            output_file = os.path.join(tmp, f"bench_{count}.sfz")
+            legacy_time, _ = timed(legacy_generate_sfz, generator, samples, output_file, params)
+            full_time, _ = timed(generator.generate_sfz, samples, output_file, tmp, params)
+            unchanged_time, _ = timed(generator.generate_sfz, samples, output_file, tmp, params, incremental=True)
+            last_note = list(samples)[-1]
+            samples[last_note] = samples[last_note] + ["extra_take.wav"]
+            tail_time, _ = timed(generator.generate_sfz, samples, output_file, tmp, params, incremental=True)
+            full_peak = peak_memory(generator.generate_sfz, samples, output_file, tmp, params)
+            results.append({
+                'regions': count,
+                'bytes': os.path.getsize(output_file),
+                'legacy_s': legacy_time,
+                'streaming_full_s': full_time,
+                'incremental_unchanged_s': unchanged_time,
+                'incremental_last_note_s': tail_time,
+                'streaming_full_peak_bytes': full_peak,
+            })
+    return results
+
+
+def synthetic_take(seconds, sample_rate=48000, channels=1, seed=0):
+    # Silence, a sung-like tone with vibrato, then a noisy tail
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * sample_rate)
+    t = np.arange(frames) / sample_rate
+    envelope = np.clip((t - 0.2) * 20, 0, 1) * np.clip((seconds - 0.3 - t) * 5, 0, 1)
+    tone = 0.4 * np.sin(2 * np.pi * 220 * t + 0.3 * np.sin(2 * np.pi * 5 * t)) * envelope
+    take = (tone[:, np.newaxis] + rng.normal(0, 1e-3, (frames, channels)) + 0.01).astype(np.float32)
+    return take
+
+
+def legacy_trim_and_normalize(recording, threshold=0.01):
+    # The original inline step from AudioManager.record_audio, kept as a baseline
+    non_silent_idx = np.where(np.abs(recording) > threshold)[0]
+    if len(non_silent_idx) > 0:
+        recording = recording[non_silent_idx[0]:]
+    return recording / max(np.abs(recording).max(), 1e-10)
+
+
+def bench_processing(durations=(2.5, 30.0, 300.0), sample_rate=48000, repeats=3):
+    pipeline = SamplePipeline(sample_rate)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in durations:
+            take = synthetic_take(seconds, sample_rate)
+            frames = len(take)
+            legacy_time = min(timed(legacy_trim_and_normalize, take)[0] for _ in range(repeats))
+            memory_time = min(timed(pipeline.process, take)[0] for _ in range(repeats))
+            path = os.path.join(tmp, "take.wav")
+            mmap_times = []
+            for _ in range(repeats):
+                with wavio.WavWriter(path, sample_rate, 1) as writer:
+                    writer.write(take)
+                _, data = wavio.open_memmap(path)
+                mmap_times.append(timed(pipeline.process_in_place, data)[0])
+                del data
+            memory_peak = peak_memory(pipeline.process, take)
+            results.append({
+                'seconds': seconds,
+                'frames': frames,
+                'legacy_samples_per_s': frames / legacy_time,
+                'pipeline_samples_per_s': frames / memory_time,
+                'pipeline_mmap_samples_per_s': frames / min(mmap_times),
+                'pipeline_peak_bytes': memory_peak,
+            })
+    return results
+
+
+def bench_encoding(take_count=50, seconds=2.5, sample_rate=48000):
+    # Disk size and load (decode to float32) time of the same library in every output encoding
+    takes = [SamplePipeline(sample_rate).process(synthetic_take(seconds, sample_rate, seed=i))[0] for i in range(take_count)]
+    encodings = [e for e in encoding.ENCODINGS if encoding.load_soundfile() is not None or not e.startswith('flac')]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in encodings:
+            directory = os.path.join(tmp, name)
+            os.makedirs(directory)
+            write_time, paths = timed(lambda: [encoding.write_sample(os.path.join(directory, f"C4_{i + 1}.wav"), take, sample_rate, name)
+                                               for i, take in enumerate(takes)])
+            load_time, _ = timed(lambda: [encoding.read_sample(path) for path in paths])
+            results.append({
+                'encoding': name,
+                'bytes': sum(os.path.getsize(path) for path in paths),
+                'write_s': write_time,
+                'load_s': load_time,
+                'write_peak_bytes': peak_memory(lambda: [encoding.write_sample(path, take, sample_rate, name)
+                                                         for path, take in zip(paths, takes)]),
+            })
+    return results
+
+
+def sung_source(frequency=220.0, level=0.4, onset_s=0.1):
+    # Input for the simulated microphone: silence, then a steady tone with vibrato
+    def source(frame, frames, channels, sample_rate):
+        t = (frame + np.arange(frames)) / sample_rate
+        tone = level * np.sin(2 * np.pi * frequency * t + 0.3 * np.sin(2 * np.pi * 5 * t)) * (t >= onset_s)
+        return np.repeat(tone[:, np.newaxis], channels, axis=1)
+    return source
+
+
+def simulated_audio_manager(tmp, dispatch=None, sample_rate=48000):
+    # AudioManager wired to the simulated devices, with its device cache kept out of the home directory
+    devices = DeviceRegistry(sd, cache_path=os.path.join(tmp, "devices.json"))
+    return AudioManager(sample_rate, engine=AudioEngine(SoundDeviceBackend(sd), dispatch=dispatch), devices=devices)
+
+
+def close_audio_manager(audio_manager):
+    audio_manager.work_queue.close()
+    audio_manager.engine.close()
+
+
+def bench_tones(duration=2.0, repeats=5, waveforms=('sine', 'triangle', 'square')):
+    # Guide tone synthesis: generate_wave alone, play_sine_wave (synthesis plus hand-off to the output
+    # stream) and a cached get_tone
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = simulated_audio_manager(tmp)
+        try:
+            t = np.linspace(0, duration, int(manager.sample_rate * duration), False)
+            for waveform in waveforms:
+                frequency = manager.note_to_frequency('A3')
+                manager.get_tone('A3', 440.0, waveform, duration)
+                results.append({
+                    'waveform': waveform,
+                    'frames': len(t),
+                    'generate_wave_s': min(timed(manager.generate_wave, frequency, t, waveform)[0] for _ in range(repeats)),
+                    'play_sine_wave_s': min(timed(manager.play_sine_wave, frequency, duration, waveform)[0] for _ in range(repeats)),
+                    'cached_tone_s': min(timed(manager.get_tone, 'A3', 440.0, waveform, duration)[0] for _ in range(repeats)),
+                    'play_sine_wave_peak_bytes': peak_memory(manager.play_sine_wave, frequency, duration, waveform),
+                })
+        finally:
+            close_audio_manager(manager)
+    return results
+
+
+def record_take(manager, duration, output_file, timeout=600.0):
+    # One record_audio call on the simulated input: returns (seconds until capture ended, seconds until saved)
+    saved = threading.Event()
+    times = {}
+    start = time.perf_counter()
+
+    def on_captured(paths):
+        times['captured'] = time.perf_counter() - start
+
+    def on_done(paths):
+        times['saved'] = time.perf_counter() - start
+        saved.set()
+
+    manager.record_audio(duration, output_file, on_done, on_captured)
+    if not saved.wait(timeout):
+        raise RuntimeError(f"record_audio did not finish within {timeout} s")
+    return times['captured'], times['saved']
+
+
+def bench_record(durations=(2.5, 30.0), channels=1):
+    # record_audio end to end on the simulated input, running faster than real time: capture through the
+    # engine callbacks, then post-processing and the write on the work queue (streamed to disk past
+    # stream_to_disk_after seconds)
+    results = []
+    sd.backend.source = sung_source()
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = simulated_audio_manager(tmp)
+        manager.input_channels = channels
+        try:
+            for i, seconds in enumerate(durations):
+                capture_time, total_time = record_take(manager, seconds, os.path.join(tmp, f"C4_{2 * i + 1}.wav"))
+                peak = peak_memory(record_take, manager, seconds, os.path.join(tmp, f"C4_{2 * i + 2}.wav"))
+                results.append({
+                    'seconds': seconds,
+                    'channels': channels,
+                    'streamed': seconds >= manager.stream_to_disk_after,
+                    'capture_s': capture_time,
+                    'postprocess_s': total_time - capture_time,
+                    'total_s': total_time,
+                    'peak_bytes': peak,
+                })
+        finally:
+            close_audio_manager(manager)
+            sd.backend.source = None
+    return results
+
+
+class HeadlessRoot(fake_tkinter.Tk):
+    # Takes the place of the Tk root: callbacks posted from audio and worker threads run one at a time
+    # on the thread that calls mainloop(), like TkDispatcher, until destroy()
+    def __init__(self):
+        fake_tkinter.Tk.__init__(self)
+        self.pending = queue.SimpleQueue()
+        self.running = True
+
+    def post(self, callback, *args):
+        self.pending.put((callback, args))
+
+    def after(self, ms, callback, *args):
+        self.post(callback, *args)
+
+    def destroy(self):
+        self.running = False
+
+    def mainloop(self, timeout=None):
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while self.running:
+            try:
+                callback, args = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                if deadline is not None and time.perf_counter() > deadline:
+                    raise RuntimeError("simulated session did not finish")
+                continue
+            callback(*args)
+
+
+class HeadlessGUI:
+    # Plays the singer: skips the countdown, keeps every take as soon as it is captured and generates
+    # the SFZ at the end
+    def __init__(self, root, start_callback, recording_complete_callback, app):
+        self.root = root
+        self.app = app
+        self.recording_complete_callback = recording_complete_callback
+        self.waveform = 'sine'
+        self.sfz_params = dict(app.sfz_generator.default_params, filename='choir.sfz')
+        self.pitches = []
+
+    def show_countdown(self, note, callback, countdown_length):
+        self.root.post(callback)
+
+    def show_recording_options(self, note, pitch=None, pending=False):
+        self.root.post(self.recording_complete_callback, "keep", note)
+
+    def show_pitch(self, note, take_file, pitch):
+        self.pitches.append(pitch)
+
+    def show_completion(self, compile_callback):
+        self.root.post(compile_callback, self.sfz_params)
+
+
+def run_session(tmp, note_count, sample_length, timeout=600.0):
+    root = HeadlessRoot()
+    manager = simulated_audio_manager(tmp, root.post)
+    try:
+        app = ChoirRecorderApp(root, manager, HeadlessGUI, os.path.join(tmp, "choir_samples"))
+        app.open_folder_when_done = False
+        app.notes = app.notes[:note_count]
+        root.post(app.start_recording, 440.0, sample_length, manager.sample_rate, 'Simulated Speakers',
+                  'Simulated Microphone', app.notes[0], 0)
+        root.mainloop(timeout)
+        return app
+    finally:
+        close_audio_manager(manager)
+
+
+def bench_session(note_count=12, sample_length=1.0, trace_dir=None):
+    # A complete ChoirRecorderApp session, start_recording to compile_sfz, on the simulated devices: guide
+    # tone, capture, review (keep) and post-processing for every note, then the SFZ. Run once more with
+    # the instrumentation enabled to show its overhead; trace_dir receives that run's trace and summary.
+    sd.backend.source = sung_source()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            session_time, app = timed(run_session, os.path.join(tmp, "timed"), note_count, sample_length)
+            peak = peak_memory(run_session, os.path.join(tmp, "memory"), note_count, sample_length)
+            tracer.enable()
+            try:
+                traced_time, _ = timed(run_session, os.path.join(tmp, "traced"), note_count, sample_length)
+                stages = tracer.summary()['stages']
+                if trace_dir:
+                    tracer.export(trace_dir)
+            finally:
+                tracer.disable()
+            regions = sum(len(takes) for takes in app.recorded_samples.values())
+            sfz_written = os.path.exists(os.path.join(app.output_dir, 'choir.sfz'))
+    finally:
+        sd.backend.source = None
+    return [{
+        'notes': note_count,
+        'sample_length': sample_length,
+        'regions': regions,
+        'sfz_written': sfz_written,
+        'session_s': session_time,
+        'per_note_s': session_time / max(note_count, 1),
+        'peak_bytes': peak,
+        'traced_session_s': traced_time,
+        'stages_ms': {name: stats['total_ms'] for name, stats in stages.items()},
+    }]
+
+
+def startup_session(start, imported, loaded, tmp):
+    # Second half of STARTUP_SCRIPT: builds the app and the real start screen as main.py does (on the
+    # stand-in tkinter; everything up to here runs before the window can paint), then runs the event
+    # loop until the background device scan has filled the menus and enabled the Start button
+    root = HeadlessRoot()
+    manager = simulated_audio_manager(tmp, root.post)
+    try:
+        app = ChoirRecorderApp(root, manager, ChoirRecorderGUI, os.path.join(tmp, "choir_samples"))
+        window = time.perf_counter()
+        devices_ready = app.gui.devices_ready
+
+        def ready_and_stop():
+            devices_ready()
+            root.destroy()
+
+        app.gui.devices_ready = ready_and_stop
+        root.mainloop(120)
+        ready = time.perf_counter()
+        if not app.gui.input_devices or app.gui.start_button['state'] != fake_tkinter.NORMAL:
+            raise RuntimeError("start screen did not finish setting up the devices")
+    finally:
+        close_audio_manager(manager)
+    return {'import_s': imported - start, 'window_s': window - start, 'devices_ready_s': ready - start, 'heavy_modules': loaded}
+
+
+def bench_startup(repeats=3, scenarios=(('laptop', 0, 0.0, 0.0), ('studio', 24, 0.5, 0.02))):
+    # Cold start in fresh interpreters: time until the window can paint, and until the device menus are
+    # filled. 'studio' simulates many interfaces with slow enumeration and settings checks.
+    results = []
+    for name, interfaces, query_delay, check_delay in scenarios:
+        runs = []
+        for _ in range(repeats):
+            with tempfile.TemporaryDirectory() as tmp:
+                script = STARTUP_SCRIPT.format(interfaces=interfaces, query_delay=query_delay, check_delay=check_delay, tmp=tmp)
+                output = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                        capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+        results.append({
+            'scenario': name,
+            'interfaces': len(sd.DEVICES) + interfaces,
+            'import_s': float(np.median([run['import_s'] for run in runs])),
+            'numpy_import_s': float(np.median([run['numpy_import_s'] for run in runs])),
+            'window_s': float(np.median([run['window_s'] for run in runs])),
+            'devices_ready_s': float(np.median([run['devices_ready_s'] for run in runs])),
+            'heavy_modules_at_start': runs[0]['heavy_modules'],
+        })
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, results, threshold=0.25):
+    # Regressions against an earlier --json report: times (*_s) and memory (*_bytes) that grew, or
+    # throughputs (*_per_s) that dropped, by more than `threshold`. Rows are matched on their first field.
+    regressions = []
+    for suite, rows in results.items():
+        old_rows = {str(next(iter(row.values()))): row for row in baseline.get('results', {}).get(suite, [])}
+        for row in rows:
+            key = str(next(iter(row.values())))
+            old = old_rows.get(key)
+            if old is None:
+                continue
+            for field, value in row.items():
+                before = old.get(field)
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not before:
+                    continue
+                if field.endswith('_per_s'):
+                    change = before / value - 1 if value else float('inf')
+                elif field.endswith('_s') or field.endswith('_bytes'):
+                    change = value / before - 1
+                else:
+                    continue
+                if change > threshold:
+                    regressions.append((suite, key, field, before, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Choir Maker benchmarks (simulated audio devices)")
+    parser.add_argument('suites', nargs='*', choices=SUITES, default=SUITES)
+    parser.add_argument('--regions', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--seconds', type=float, nargs='+', default=[2.5, 30.0, 300.0])
+    parser.add_argument('--record-seconds', type=float, nargs='+', default=[2.5, 30.0])
+    parser.add_argument('--session-notes', type=int, default=12)
+    parser.add_argument('--trace', default=None, metavar='DIR', help="Write the traced session's Chrome trace and summary here")
+    parser.add_argument('--json', default=None, help="Write the results to this file")
+    parser.add_argument('--compare', default=None, help="Report regressions against an earlier --json file")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Relative change counted as a regression")
+    args = parser.parse_args(argv)
+    sd.install()
+    results = {}
+    if 'sfz' in args.suites:
+        results['sfz'] = bench_sfz(args.regions)
+        for row in results['sfz']:
+            print(f"sfz {row['regions']:>7} regions ({row['bytes'] / 1e6:.1f} MB): "
+                  f"legacy {row['legacy_s'] * 1000:.1f} ms, streaming {row['streaming_full_s'] * 1000:.1f} ms, "
+                  f"incremental unchanged {row['incremental_unchanged_s'] * 1000:.1f} ms, "
+                  f"incremental last note {row['incremental_last_note_s'] * 1000:.1f} ms, "
+                  f"peak {row['streaming_full_peak_bytes'] / 1e6:.1f} MB")
+    if 'processing' in args.suites:
+        results['processing'] = bench_processing(args.seconds)
+        for row in results['processing']:
+            print(f"processing {row['seconds']:>6.1f} s take: "
+                  f"legacy {row['legacy_samples_per_s'] / 1e6:.1f} M samples/s, "
+                  f"pipeline {row['pipeline_samples_per_s'] / 1e6:.1f} M samples/s, "
+                  f"pipeline on memmap {row['pipeline_mmap_samples_per_s'] / 1e6:.1f} M samples/s, "
+                  f"peak {row['pipeline_peak_bytes'] / 1e6:.1f} MB")
+    if 'encoding' in args.suites:
+        results['encoding'] = rows = bench_encoding()
+        baseline = rows[0]['bytes']
+        for row in rows:
+            print(f"encoding {row['encoding']:>7}: {row['bytes'] / 1e6:.1f} MB ({row['bytes'] / baseline:.0%} of float32), "
+                  f"write {row['write_s'] * 1000:.0f} ms, load {row['load_s'] * 1000:.0f} ms, "
+                  f"peak {row['write_peak_bytes'] / 1e6:.1f} MB")
+    if 'tones' in args.suites:
+        results['tones'] = bench_tones()
+        for row in results['tones']:
+            print(f"tones {row['waveform']:>8}: generate_wave {row['generate_wave_s'] * 1000:.2f} ms, "
+                  f"play_sine_wave {row['play_sine_wave_s'] * 1000:.2f} ms, cached {row['cached_tone_s'] * 1e6:.1f} us, "
+                  f"peak {row['play_sine_wave_peak_bytes'] / 1e6:.1f} MB")
+    if 'record' in args.suites:
+        results['record'] = bench_record(args.record_seconds)
+        for row in results['record']:
+            print(f"record {row['seconds']:>6.1f} s take{' (streamed)' if row['streamed'] else ''}: "
+                  f"capture {row['capture_s'] * 1000:.0f} ms, post-processing {row['postprocess_s'] * 1000:.0f} ms, "
+                  f"peak {row['peak_bytes'] / 1e6:.1f} MB")
+    if 'session' in args.suites:
+        results['session'] = bench_session(args.session_notes, trace_dir=args.trace)
+        for row in results['session']:
+            print(f"session {row['notes']} notes: {row['session_s']:.2f} s ({row['per_note_s'] * 1000:.0f} ms per note), "
+                  f"{row['regions']} regions, peak {row['peak_bytes'] / 1e6:.1f} MB, traced {row['traced_session_s']:.2f} s")
+            print("  " + ", ".join(f"{name} {total:.0f} ms" for name, total in row['stages_ms'].items()))
+    if 'startup' in args.suites:
+        results['startup'] = bench_startup()
+        for row in results['startup']:
+            print(f"startup {row['scenario']} ({row['interfaces']} devices): imports {row['import_s'] * 1000:.0f} ms "
+                  f"(numpy {row['numpy_import_s'] * 1000:.0f} ms), "
+                  f"window {row['window_s'] * 1000:.0f} ms, devices ready {row['devices_ready_s'] * 1000:.0f} ms"
+                  f"{', loaded ' + ', '.join(row['heavy_modules_at_start']) if row['heavy_modules_at_start'] else ''}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for suite, key, field, before, value, change in regressions:
+            print(f"REGRESSION {suite} [{key}] {field}: {before:.4g} -> {value:.4g} ({change:+.0%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
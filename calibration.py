@@ -0,0 +1,67 @@
+import numpy as np
+
+
+def test_signal(sample_rate, duration=0.25, f0=100.0, f1=8000.0, level=0.5):
+    # Exponential sine sweep with 5 ms fades: broadband, so its autocorrelation has one sharp peak
+    n = int(duration * sample_rate)
+    t = np.arange(n) / sample_rate
+    rate = np.log(f1 / f0)
+    sweep = np.sin(2 * np.pi * f0 * duration / rate * (np.exp(t * rate / duration) - 1))
+    fade = min(n // 2, int(0.005 * sample_rate))
+    envelope = np.ones(n)
+    envelope[:fade] = np.linspace(0, 1, fade)
+    envelope[n - fade:] = np.linspace(1, 0, fade)
+    return (level * sweep * envelope).astype(np.float32)
+
+
+def cross_correlation(recorded, reference):
+    # r[k] = sum(recorded[k + i] * reference[i]) for k in [0, len(recorded)), through one FFT pair
+    size = 1 << (len(recorded) + len(reference) - 1).bit_length()
+    spectrum = np.fft.rfft(recorded, size) * np.conj(np.fft.rfft(reference, size))
+    return np.fft.irfft(spectrum, size)[:len(recorded)]
+
+
+def calibration_track(sample_rate, repeats=3, period_s=0.75):
+    # The sweep `repeats` times, one every period_s seconds
+    sweep = test_signal(sample_rate)
+    period = int(period_s * sample_rate)
+    track = np.zeros(period * repeats, dtype=np.float32)
+    for k in range(repeats):
+        track[k * period:k * period + len(sweep)] = sweep
+    return track, sweep, period
+
+
+def find_latency(recorded, sample_rate, repeats=3, period_s=0.75, max_spread=2, min_confidence=8.0):
+    # Locates every sweep repetition in the capture and returns the median delay in frames, or None
+    # when the repetitions disagree by more than max_spread frames or the peaks do not stand out
+    x = np.asarray(recorded, dtype=np.float64)
+    if x.ndim == 2:
+        x = x.mean(axis=1)
+    _, sweep, period = calibration_track(sample_rate, repeats, period_s)
+    r = np.abs(cross_correlation(x, sweep.astype(np.float64)))
+    delays = []
+    for k in range(repeats):
+        window = r[k * period:(k + 1) * period]
+        if len(window) == 0:
+            return None
+        peak = int(np.argmax(window))
+        if window[peak] < min_confidence * (np.median(window) + 1e-12):
+            return None
+        delays.append(peak)
+    if max(delays) - min(delays) > max_spread:
+        return None
+    return int(np.median(delays))
+
+
+def measure_latency(engine, sample_rate, input_device=None, output_device=None, on_done=None,
+                    repeats=3, period_s=0.75, max_latency_s=0.5):
+    # Plays the calibration track through a full-duplex stream while capturing the loopback;
+    # on_done receives the round-trip latency in frames, or None
+    track, _, _ = calibration_track(sample_rate, repeats, period_s)
+
+    def captured(recording):
+        if on_done:
+            on_done(find_latency(recording, sample_rate, repeats, period_s))
+
+    frames = len(track) + int(max_latency_s * sample_rate)
+    engine.play_record(track, frames, sample_rate, input_device, output_device, 1, captured)
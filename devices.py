@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+
+TEST_RATES = [8000, 16000, 22050, 44100, 48000, 96000, 192000]
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".choir_maker", "devices.json")
+
+
+class DeviceRegistry:
+    # Caches sd.query_devices() with name -> index lookups, and persists sample-rate probes per
+    # device identity so known hardware is never re-probed on startup or when switching devices.
+    def __init__(self, sd_module=None, cache_path=CACHE_PATH):
+        self.sd_module = sd_module
+        self.cache_path = cache_path
+        self.devices = None
+        self.hostapis = None
+        self.default_input = None
+        self.default_output = None
+        self.input_index = {}
+        self.output_index = {}
+        self.capabilities = self.load_capabilities()
+        self.lock = threading.RLock()
+
+    @property
+    def sd(self):
+        if self.sd_module is None:
+            import sounddevice
+            self.sd_module = sounddevice
+        return self.sd_module
+
+    def load_capabilities(self):
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_capabilities(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.capabilities, f, indent=1)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+    def refresh(self):
+        with self.lock:
+            devices = list(self.sd.query_devices())
+            try:
+                hostapis = list(self.sd.query_hostapis())
+            except Exception:
+                hostapis = []
+            self.input_index = {}
+            self.output_index = {}
+            for i, d in enumerate(devices):
+                if d['max_input_channels'] > 0:
+                    self.input_index.setdefault(d['name'], i)
+                if d['max_output_channels'] > 0:
+                    self.output_index.setdefault(d['name'], i)
+            self.default_input = self.query_default('input', self.input_index)
+            self.default_output = self.query_default('output', self.output_index)
+            self.hostapis = hostapis
+            self.devices = devices
+        return devices
+
+    def query_default(self, kind, index):
+        try:
+            return index.get(self.sd.query_devices(kind=kind)['name'])
+        except Exception:
+            return None
+
+    def invalidate(self):
+        # Forget the cached enumeration; PortAudio only sees hot-plugged hardware after a re-init
+        with self.lock:
+            self.devices = None
+            try:
+                self.sd._terminate()
+                self.sd._initialize()
+            except Exception:
+                pass
+
+    def query(self):
+        if self.devices is None:
+            self.refresh()
+        return self.devices
+
+    def input_names(self):
+        self.query()
+        return list(self.input_index)
+
+    def output_names(self):
+        self.query()
+        return list(self.output_index)
+
+    def index(self, name, kind=None):
+        self.query()
+        if kind == 'input':
+            return self.input_index.get(name)
+        if kind == 'output':
+            return self.output_index.get(name)
+        return self.input_index.get(name, self.output_index.get(name))
+
+    def name(self, index):
+        devices = self.query()
+        if index is None or not 0 <= index < len(devices):
+            return None
+        return devices[index]['name']
+
+    def default_output_name(self):
+        self.query()
+        return self.name(self.default_output)
+
+    def max_channels(self, index, kind):
+        if index is None:
+            return 0
+        return self.query()[index][f'max_{kind}_channels']
+
+    def identity(self, index):
+        device = self.query()[index]
+        hostapi = device.get('hostapi', 0)
+        hostapi_name = self.hostapis[hostapi]['name'] if self.hostapis and hostapi < len(self.hostapis) else hostapi
+        return f"{hostapi_name}|{device['name']}|{device['max_input_channels']}|{device['max_output_channels']}"
+
+    def supported_rates(self, index, kind, channels):
+        if index is None:
+            return []
+        key = f"{kind}:{channels}"
+        with self.lock:
+            known = self.capabilities.setdefault(self.identity(index), {})
+            if key in known:
+                return known[key]
+            check = self.sd.check_input_settings if kind == 'input' else self.sd.check_output_settings
+            rates = []
+            for rate in TEST_RATES:
+                try:
+                    check(device=index, samplerate=rate, channels=channels)
+                    rates.append(rate)
+                except Exception:
+                    pass
+            known[key] = rates
+            self.save_capabilities()
+            return rates
+
+    def latency(self, input_index, output_index, samplerate):
+        # Calibrated round-trip latency in frames for a device pair, or None if never measured
+        if input_index is None or output_index is None:
+            return None
+        with self.lock:
+            known = self.capabilities.get(self.identity(input_index), {})
+            return known.get(f"latency:{self.identity(output_index)}:{int(samplerate)}")
+
+    def set_latency(self, input_index, output_index, samplerate, frames):
+        with self.lock:
+            known = self.capabilities.setdefault(self.identity(input_index), {})
+            known[f"latency:{self.identity(output_index)}:{int(samplerate)}"] = int(frames)
+            self.save_capabilities()
+
+    def supports(self, index, kind, samplerate, channels):
+        rates = self.supported_rates(index, kind, channels)
+        if int(samplerate) in TEST_RATES:
+            return int(samplerate) in rates
+        check = self.sd.check_input_settings if kind == 'input' else self.sd.check_output_settings
+        try:
+            check(device=index, samplerate=samplerate, channels=channels)
+            return True
+        except Exception:
+            return False
@@ -0,0 +1,110 @@
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import wavio
+from processing import to_float32
+
+ENCODINGS = ['float32', 'pcm24', 'pcm16', 'flac', 'flac16']
+FLAC_SUBTYPES = {'flac': 'PCM_24', 'flac16': 'PCM_16'}
+CHUNK_FRAMES = 1 << 16
+
+
+@functools.lru_cache(maxsize=None)
+def load_wavfile():
+    # scipy and libsndfile take a large share of startup, so both are imported on first use
+    import scipy.io.wavfile
+    return scipy.io.wavfile
+
+
+@functools.lru_cache(maxsize=None)
+def load_soundfile():
+    # The optional soundfile package, or None
+    try:
+        import soundfile
+        return soundfile
+    except ImportError:
+        return None
+
+
+def extension(encoding):
+    return '.flac' if encoding.startswith('flac') else '.wav'
+
+
+def output_path(path, encoding):
+    return os.path.splitext(path)[0] + extension(encoding)
+
+
+def read_sample(path, mmap=False):
+    # Returns (sample_rate, float32 data) for WAV (any PCM/float width) or FLAC
+    if path.lower().endswith('.flac'):
+        soundfile = load_soundfile()
+        if soundfile is None:
+            raise RuntimeError("Reading FLAC needs the optional 'soundfile' package")
+        data, sample_rate = soundfile.read(path, dtype='float32')
+        return sample_rate, data
+    try:
+        sample_rate, data = load_wavfile().read(path, mmap=mmap)
+    except ValueError:
+        if not mmap:
+            raise
+        # wavfile cannot memory-map 24-bit PCM, so those takes are read into memory
+        sample_rate, data = load_wavfile().read(path)
+    return sample_rate, to_float32(data)
+
+
+def write_sample(path, data, sample_rate, encoding='float32', dither=True):
+    # Writes a float take in the requested encoding and returns the path actually written, whose
+    # extension follows the encoding (.flac for FLAC)
+    path = output_path(path, encoding)
+    data = np.asarray(data).reshape(len(data), -1)
+    if encoding.startswith('flac'):
+        soundfile = load_soundfile()
+        if soundfile is None:
+            raise RuntimeError("FLAC output needs the optional 'soundfile' package")
+        with soundfile.SoundFile(path, 'w', sample_rate, data.shape[1], FLAC_SUBTYPES[encoding], format='FLAC') as f:
+            for start in range(0, len(data), CHUNK_FRAMES):
+                f.write(np.asarray(data[start:start + CHUNK_FRAMES], dtype=np.float32))
+        return path
+    with wavio.WavWriter(path, sample_rate, data.shape[1], encoding, dither) as writer:
+        for start in range(0, len(data), CHUNK_FRAMES):
+            writer.write(data[start:start + CHUNK_FRAMES])
+    return path
+
+
+def remove_replaced(input_path, written_path):
+    # Writing in place in a format with another extension leaves X.wav next to X.flac (or the other way
+    # round), and the next scan would map both; the new file replaces the original, so drop it
+    if os.path.abspath(written_path) == os.path.abspath(input_path):
+        return
+    if os.path.abspath(os.path.dirname(written_path)) == os.path.abspath(os.path.dirname(input_path)):
+        os.remove(input_path)
+
+
+def convert_file(input_path, output_dir, encoding, dither=True):
+    sample_rate, data = read_sample(input_path, mmap=True)
+    path = os.path.join(output_dir, os.path.basename(input_path))
+    if os.path.abspath(output_path(path, encoding)) != os.path.abspath(input_path):
+        return write_sample(path, data, sample_rate, encoding, dither)
+    # Converting in place: the source may be memory-mapped, so write beside it and swap the result in
+    directory, name = os.path.split(path)
+    encoded_file = write_sample(os.path.join(directory, "." + name), data, sample_rate, encoding, dither)
+    del data
+    final_file = os.path.join(directory, os.path.basename(encoded_file)[1:])
+    os.replace(encoded_file, final_file)
+    return final_file
+
+
+def convert_library(samples, output_dir, encoding, dither=True, workers=None):
+    # Converts every take in a process pool; returns the same note -> takes mapping with new paths
+    os.makedirs(output_dir, exist_ok=True)
+    converted = {note: [] for note in samples}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(note, path, executor.submit(convert_file, path, output_dir, encoding, dither))
+                   for note, sample_list in samples.items() for path in sample_list]
+        for note, path, future in futures:
+            converted[note].append(future.result())
+            remove_replaced(path, converted[note][-1])
+    return converted
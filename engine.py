@@ -0,0 +1,340 @@
+import os
+import queue
+import threading
+
+import numpy as np
+
+from wavio import WavWriter
+from instrument import report_error, tracer
+
+
+class SoundDeviceBackend:
+    def __init__(self, sd_module=None):
+        if sd_module is None:
+            import sounddevice as sd_module
+        self.sd = sd_module
+
+    def open_output(self, device, samplerate, channels, blocksize, callback):
+        return self.sd.OutputStream(device=device, samplerate=samplerate, channels=channels,
+                                    blocksize=blocksize, dtype='float32', callback=callback)
+
+    def open_input(self, device, samplerate, channels, blocksize, callback):
+        return self.sd.InputStream(device=device, samplerate=samplerate, channels=channels,
+                                   blocksize=blocksize, dtype='float32', callback=callback)
+
+    def open_duplex(self, device, samplerate, channels, blocksize, callback):
+        return self.sd.Stream(device=device, samplerate=samplerate, channels=channels,
+                              blocksize=blocksize, dtype='float32', callback=callback)
+
+
+class TkDispatcher:
+    # Audio callbacks run on PortAudio/worker threads; this hands their completions to the Tk thread
+    def __init__(self, root, interval=10):
+        self.root = root
+        self.interval = interval
+        self.pending = queue.SimpleQueue()
+        self.root.after(self.interval, self.poll)
+
+    def post(self, callback, *args):
+        self.pending.put((callback, args))
+
+    def poll(self):
+        # A failing completion is reported and skipped; the rest still run and polling carries on
+        try:
+            while True:
+                callback, args = self.pending.get_nowait()
+                try:
+                    callback(*args)
+                except Exception:
+                    report_error('dispatch')
+        except queue.Empty:
+            pass
+        finally:
+            self.root.after(self.interval, self.poll)
+
+
+def call_directly(callback, *args):
+    callback(*args)
+
+
+class Playback:
+    def __init__(self, audio, on_done):
+        self.audio = audio
+        self.position = 0
+        self.on_done = on_done
+
+
+class Capture:
+    def __init__(self, frames, channels, on_done):
+        self.buffer = np.zeros((frames, channels), dtype=np.float32)
+        self.position = 0
+        self.on_done = on_done
+
+    def feed(self, indata):
+        n = min(len(indata), len(self.buffer) - self.position)
+        self.buffer[self.position:self.position + n] = indata[:n]
+        self.position += n
+        return self.position >= len(self.buffer)
+
+    def complete(self, finish):
+        finish(self.on_done, self.buffer)
+
+    def cancel(self, finish):
+        pass
+
+
+class FileCapture:
+    # Hands each block to a writer thread that appends it to a WAV file, so memory use does not grow
+    # with the take length. `postprocess(path)` runs on the writer thread before on_done(path); a
+    # cancelled capture deletes its partial file and gets on_done(None).
+    def __init__(self, path, frames, samplerate, channels, on_done, postprocess=None):
+        self.path = path
+        self.frames = frames
+        self.position = 0
+        self.on_done = on_done
+        self.postprocess = postprocess
+        self.blocks = queue.SimpleQueue()
+        self.writer = WavWriter(path, samplerate, channels)
+        self.thread = threading.Thread(target=self.run, name="capture-writer", daemon=True)
+        self.thread.start()
+
+    def feed(self, indata):
+        n = min(len(indata), self.frames - self.position)
+        self.blocks.put(indata[:n].copy())
+        self.position += n
+        return self.position >= self.frames
+
+    def complete(self, finish):
+        self.blocks.put(finish)
+
+    def cancel(self, finish):
+        self.blocks.put((finish,))
+
+    def run(self):
+        try:
+            while True:
+                block = self.blocks.get()
+                if isinstance(block, tuple):
+                    finish, = block
+                    cancelled = True
+                    break
+                if callable(block):
+                    finish = block
+                    cancelled = False
+                    break
+                self.writer.write(block)
+        finally:
+            self.writer.close()
+        if cancelled:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            finish(self.on_done, None)
+            return
+        try:
+            path = self.path
+            if self.postprocess:
+                path = self.postprocess(path) or path
+            finish(self.on_done, path)
+        except Exception:
+            finish(self.on_done, None)
+
+
+class AudioEngine:
+    # Owns one persistent output stream and one persistent input stream. play() and record()
+    # return immediately; their on_done callbacks are delivered through `dispatch`, never while
+    # `lock` is held, so a callback may start the next play or record straight away.
+    def __init__(self, backend=None, dispatch=None, blocksize=512, output_channels=2):
+        self.backend = backend
+        self.dispatch = dispatch or call_directly
+        self.blocksize = blocksize
+        self.output_channels = output_channels
+        self.output_stream = None
+        self.output_config = None
+        self.input_stream = None
+        self.input_config = None
+        self.duplex_stream = None
+        self.playback = None
+        self.capture = None
+        self.input_listeners = []
+        self.lock = threading.Lock()
+
+    def get_backend(self):
+        if self.backend is None:
+            self.backend = SoundDeviceBackend()
+        return self.backend
+
+    def ensure_output(self, device, samplerate):
+        config = (device, int(samplerate), self.output_channels)
+        if self.output_stream is not None and self.output_config == config:
+            return
+        self.close_duplex()
+        self.close_output()
+        with tracer.span('open_output_stream', device=device, samplerate=int(samplerate)):
+            stream = self.get_backend().open_output(device, int(samplerate), self.output_channels,
+                                                    self.blocksize, self.output_callback)
+            stream.start()
+        self.output_stream = stream
+        self.output_config = config
+
+    def ensure_input(self, device, samplerate, channels=1):
+        config = (device, int(samplerate), channels)
+        if self.input_stream is not None and self.input_config == config:
+            return
+        self.close_duplex()
+        self.close_input()
+        with tracer.span('open_input_stream', device=device, samplerate=int(samplerate), channels=channels):
+            stream = self.get_backend().open_input(device, int(samplerate), channels,
+                                                   self.blocksize, self.input_callback)
+            stream.start()
+        self.input_stream = stream
+        self.input_config = config
+
+    def play(self, audio, samplerate, device=None, on_done=None):
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 1:
+            audio = audio[:, np.newaxis]
+        with self.lock:
+            self.ensure_output(device, samplerate)
+            previous, self.playback = self.playback, Playback(audio, on_done)
+        if previous is not None:
+            self.finish(previous.on_done)
+
+    def record(self, frames, samplerate, device=None, channels=1, on_done=None):
+        with self.lock:
+            self.ensure_input(device, samplerate, channels)
+            previous, self.capture = self.capture, Capture(int(frames), channels, on_done)
+        if previous is not None:
+            previous.cancel(self.finish)
+
+    def record_to_file(self, path, frames, samplerate, device=None, channels=1, on_done=None, postprocess=None):
+        with self.lock:
+            self.ensure_input(device, samplerate, channels)
+            previous = self.capture
+            self.capture = FileCapture(path, int(frames), int(samplerate), channels, on_done, postprocess)
+        if previous is not None:
+            previous.cancel(self.finish)
+
+    def play_record(self, audio, frames, samplerate, input_device=None, output_device=None, channels=1, on_done=None,
+                    path=None, postprocess=None):
+        # Plays and captures on one full-duplex stream, starting both in the same callback, so capture
+        # frame i lines up with playback frame i plus the fixed round-trip latency. With `path` the
+        # capture streams to disk like record_to_file.
+        audio = np.asarray(audio, dtype=np.float32)
+        if audio.ndim == 1:
+            audio = audio[:, np.newaxis]
+        with self.lock:
+            previous_playback, previous_capture = self.playback, self.capture
+            self.playback = self.capture = None
+            self.close_duplex()
+            self.close_output()
+            self.close_input()
+            if path is None:
+                capture = Capture(int(frames), channels, on_done)
+            else:
+                capture = FileCapture(path, int(frames), int(samplerate), channels, on_done, postprocess)
+            self.playback, self.capture = Playback(audio, None), capture
+            stream = self.get_backend().open_duplex((input_device, output_device), int(samplerate),
+                                                    (channels, self.output_channels), self.blocksize, self.duplex_callback)
+            stream.start()
+            self.duplex_stream = stream
+        self.end(previous_playback, previous_capture)
+
+    def duplex_callback(self, indata, outdata, frames, time_info, status):
+        if status:
+            tracer.stream_status('duplex', status)
+        self.output_callback(outdata, frames, time_info, None)
+        self.input_callback(indata, frames, time_info, None)
+
+    def end(self, playback, capture):
+        # Completion for a playback and capture already detached under the lock
+        if playback is not None:
+            self.finish(playback.on_done)
+        if capture is not None:
+            capture.cancel(self.finish)
+
+    def cancel_capture(self):
+        with self.lock:
+            previous, self.capture = self.capture, None
+        self.end(None, previous)
+
+    def stop_capture(self):
+        # Ends the capture early and delivers what has been recorded so far
+        with self.lock:
+            previous, self.capture = self.capture, None
+        if previous is not None:
+            previous.complete(self.finish)
+
+    def stop_playback(self):
+        with self.lock:
+            previous, self.playback = self.playback, None
+        self.end(previous, None)
+
+    def finish(self, on_done, *args):
+        if on_done is not None:
+            self.dispatch(on_done, *args)
+
+    def output_callback(self, outdata, frames, time_info, status):
+        if status:
+            tracer.stream_status('output', status)
+        playback = self.playback
+        if playback is None:
+            outdata.fill(0)
+            return
+        chunk = playback.audio[playback.position:playback.position + frames]
+        n = len(chunk)
+        outdata[:n] = chunk
+        outdata[n:] = 0
+        playback.position += n
+        if playback.position >= len(playback.audio) and self.playback is playback:
+            self.playback = None
+            self.finish(playback.on_done)
+
+    def add_input_listener(self, listener):
+        if listener not in self.input_listeners:
+            self.input_listeners = self.input_listeners + [listener]
+
+    def remove_input_listener(self, listener):
+        self.input_listeners = [l for l in self.input_listeners if l != listener]
+
+    def input_callback(self, indata, frames, time_info, status):
+        if status:
+            tracer.stream_status('input', status)
+        for listener in self.input_listeners:
+            listener(indata)
+        capture = self.capture
+        if capture is None:
+            return
+        if capture.feed(indata) and self.capture is capture:
+            self.capture = None
+            capture.complete(self.finish)
+
+    def close_output(self):
+        if self.output_stream is not None:
+            self.output_stream.stop()
+            self.output_stream.close()
+        self.output_stream = None
+        self.output_config = None
+
+    def close_input(self):
+        if self.input_stream is not None:
+            self.input_stream.stop()
+            self.input_stream.close()
+        self.input_stream = None
+        self.input_config = None
+
+    def close_duplex(self):
+        if self.duplex_stream is not None:
+            self.duplex_stream.stop()
+            self.duplex_stream.close()
+        self.duplex_stream = None
+
+    def close(self):
+        with self.lock:
+            playback, capture = self.playback, self.capture
+            self.playback = self.capture = None
+            self.close_duplex()
+            self.close_output()
+            self.close_input()
+        self.end(playback, capture)
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from encoding import ENCODINGS, read_sample, write_sample
+from keymap import merge_region_opcodes
+from library import LibraryIndex, scan_samples
+from loops import find_library_loops
+from pitch_detect import check_library, tune_opcodes
+from sfz import SFZGenerator
+
+SOURCE_CACHE = ".export_sources.json"
+VARIANT_CACHE = ".export_cache.json"
+# Bump when the resampler or its settings change, so cached variants are rebuilt
+RESAMPLER_VERSION = 1
+DIGEST_CHUNK = 1 << 20
+
+
+def parse_variant(text):
+    # '48000:pcm24' -> (48000, 'pcm24'); the encoding defaults to pcm24
+    rate, _, encoding = text.partition(':')
+    encoding = encoding or 'pcm24'
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}' (choose from {', '.join(ENCODINGS)})")
+    return int(rate), encoding
+
+
+def variant_name(rate, encoding):
+    # (44100, 'pcm16') -> '44.1k_pcm16'
+    return f"{rate / 1000:g}k_{encoding}"
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK), b''):
+            digest.update(chunk)
+    return path, digest.hexdigest()
+
+
+def resample(data, source_rate, target_rate):
+    # Polyphase resampling along the time axis (scipy is imported on first use)
+    if source_rate == target_rate:
+        return data
+    from scipy.signal import resample_poly
+    common = math.gcd(int(source_rate), int(target_rate))
+    resampled = resample_poly(data, target_rate // common, source_rate // common, axis=0)
+    return resampled.astype(np.float32)
+
+
+def export_take(input_path, targets, dither=True):
+    # Decodes the take once and writes it for every (output path, rate, encoding) target, resampling once
+    # per rate. Returns the written paths in target order.
+    sample_rate, data = read_sample(input_path, mmap=True)
+    data = np.asarray(data, dtype=np.float32)
+    resampled = {}
+    written = []
+    for output_path, rate, encoding in targets:
+        if rate not in resampled:
+            resampled[rate] = resample(data, sample_rate, rate)
+        written.append(write_sample(output_path, resampled[rate], rate, encoding, dither))
+    return written
+
+
+def load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def save_json(path, data):
+    try:
+        tmp_file = path + ".tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_file, path)
+    except OSError:
+        pass
+
+
+class LibraryExporter:
+    # Writes one library as several sample rate / encoding variants, each into its own folder under
+    # output_dir. Takes are keyed by a content hash, so only new or changed takes are resampled and
+    # re-encoded; the hashes themselves are only recomputed when a take's size or mtime changes.
+    def __init__(self, output_dir, variants, workers=None, dither=True):
+        self.output_dir = output_dir
+        self.variants = [(int(rate), encoding) for rate, encoding in variants]
+        self.workers = workers
+        self.dither = dither
+
+    def variant_dir(self, rate, encoding):
+        return os.path.join(self.output_dir, variant_name(rate, encoding))
+
+    def source_digests(self, paths, executor):
+        cache_file = os.path.join(self.output_dir, SOURCE_CACHE)
+        cache = load_json(cache_file, {})
+        digests, stale = {}, []
+        stats = {}
+        for path in paths:
+            stat = os.stat(path)
+            stats[path] = stat
+            entry = cache.get(os.path.abspath(path))
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                digests[path] = entry['digest']
+            else:
+                stale.append(path)
+        for path, digest in executor.map(file_digest, stale):
+            digests[path] = digest
+        save_json(cache_file, {os.path.abspath(path): {'size': stats[path].st_size, 'mtime_ns': stats[path].st_mtime_ns,
+                                                       'digest': digests[path]} for path in paths})
+        return digests
+
+    def export(self, samples):
+        # Returns ({(rate, encoding): note -> takes in that variant}, number of files written)
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = [path for sample_list in samples.values() for path in sample_list]
+        params, caches = {}, {}
+        for variant in self.variants:
+            os.makedirs(self.variant_dir(*variant), exist_ok=True)
+            params[variant] = {'rate': variant[0], 'encoding': variant[1], 'dither': self.dither, 'resampler': RESAMPLER_VERSION}
+            cache = load_json(os.path.join(self.variant_dir(*variant), VARIANT_CACHE), {})
+            caches[variant] = cache.get('takes', {}) if cache.get('params') == params[variant] else {}
+        outputs = {variant: {} for variant in self.variants}
+        written = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            digests = self.source_digests(paths, executor)
+            jobs = []
+            for path in paths:
+                name = os.path.basename(path)
+                targets = []
+                for variant in self.variants:
+                    entry = caches[variant].get(name)
+                    variant_dir = self.variant_dir(*variant)
+                    if entry and entry['digest'] == digests[path] and os.path.exists(os.path.join(variant_dir, entry['output'])):
+                        outputs[variant][path] = os.path.join(variant_dir, entry['output'])
+                    else:
+                        targets.append((os.path.join(variant_dir, name),) + variant)
+                if targets:
+                    jobs.append((path, targets, executor.submit(export_take, path, targets, self.dither)))
+            for path, targets, future in jobs:
+                for (_, rate, encoding), output in zip(targets, future.result()):
+                    outputs[rate, encoding][path] = output
+                    written += 1
+        entries = source_entries(paths)
+        for variant in self.variants:
+            variant_dir = self.variant_dir(*variant)
+            takes = {os.path.basename(path): {'digest': digests[path], 'output': os.path.basename(output)}
+                     for path, output in outputs[variant].items()}
+            save_json(os.path.join(variant_dir, VARIANT_CACHE), {'params': params[variant], 'takes': takes})
+            # Carry the loudness measured on the originals over, so velocity layers match the source library
+            loudness = {output: (entries[path]['loudness'], entries[path].get('gain_db', 0.0))
+                        for path, output in outputs[variant].items() if entries[path].get('loudness') is not None}
+            if loudness:
+                LibraryIndex(variant_dir).update_loudness(loudness)
+        variants = {variant: {note: [outputs[variant][path] for path in sample_list] for note, sample_list in samples.items()}
+                    for variant in self.variants}
+        return variants, written
+
+    def build(self, sample_dir, sfz_filename='choir.sfz', sfz_params=None):
+        # Exports every variant of sample_dir and writes each one a matching SFZ. Loop points and tune
+        # opcodes are analyzed once on the source takes; loop points are rescaled to each variant's rate.
+        # Returns ([(variant name, sfz path)], number of takes written).
+        samples = scan_samples(sample_dir)
+        variants, written = self.export(samples)
+        region_opcodes = None
+        if sfz_params and sfz_params.get('loop_auto'):
+            region_opcodes = find_library_loops(samples, self.workers)
+        if sfz_params and sfz_params.get('tune_from_pitch'):
+            results = check_library(samples, sfz_params.get('tuning', 440.0), workers=self.workers)
+            region_opcodes = merge_region_opcodes(region_opcodes, tune_opcodes(results))
+        entries = source_entries([path for sample_list in samples.values() for path in sample_list])
+        generator = SFZGenerator()
+        written_sfz = []
+        for (rate, encoding), variant_samples in variants.items():
+            mapping = {path: output for note, sample_list in samples.items()
+                       for path, output in zip(sample_list, variant_samples[note])}
+            output_sfz = os.path.join(self.variant_dir(rate, encoding), sfz_filename)
+            generator.generate_sfz(variant_samples, output_sfz, self.variant_dir(rate, encoding), sfz_params, incremental=True,
+                                   region_opcodes=variant_region_opcodes(region_opcodes, mapping, entries, rate))
+            written_sfz.append((variant_name(rate, encoding), output_sfz))
+        return written_sfz, written
+
+
+def source_entries(paths):
+    # {path: library index entry} for the source takes (sample rate, loudness), read once per directory
+    indexes = {}
+    entries = {}
+    for path in paths:
+        sample_dir = os.path.dirname(path) or '.'
+        if sample_dir not in indexes:
+            indexes[sample_dir] = LibraryIndex(sample_dir)
+        entries[path] = indexes[sample_dir].entries.get(os.path.basename(path), {})
+    return entries
+
+
+def variant_region_opcodes(region_opcodes, mapping, entries, rate):
+    # Moves per-take opcodes onto a variant's files, scaling frame positions by the change in sample rate
+    converted = {}
+    for path, opcodes in (region_opcodes or {}).items():
+        if path not in mapping:
+            continue
+        opcodes = dict(opcodes)
+        source_rate = entries.get(path, {}).get('sample_rate') or rate
+        for key in ('loop_start', 'loop_end', 'offset', 'end'):
+            if key in opcodes:
+                opcodes[key] = int(round(opcodes[key] * rate / source_rate))
+        converted[mapping[path]] = opcodes
+    return converted
@@ -0,0 +1,267 @@
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Stand-in for the parts of the sounddevice module this app uses, for benchmarks and tests. install()
+# registers it as `sounddevice`; streams are FakeStreams driven by `backend`, so set backend.source to
+# feed the inputs and backend.speed to run faster than real time. A FakeBackend can also be handed to
+# engine.AudioEngine directly.
+
+DEVICES = [
+    {'name': 'Simulated Microphone', 'hostapi': 0, 'max_input_channels': 2, 'max_output_channels': 0,
+     'default_samplerate': 48000.0},
+    {'name': 'Simulated Speakers', 'hostapi': 0, 'max_input_channels': 0, 'max_output_channels': 2,
+     'default_samplerate': 48000.0},
+    {'name': 'Simulated Interface', 'hostapi': 0, 'max_input_channels': 8, 'max_output_channels': 8,
+     'default_samplerate': 48000.0},
+]
+HOSTAPIS = [{'name': 'Simulated', 'devices': list(range(len(DEVICES))), 'default_input_device': 0,
+             'default_output_device': 1}]
+SAMPLE_RATES = [44100, 48000, 96000]
+# Seconds each device enumeration and each settings check takes, to mimic a machine with many interfaces
+QUERY_DELAY = 0.0
+CHECK_DELAY = 0.0
+
+
+class FakeStatus:
+    input_underflow = False
+    input_overflow = False
+    output_underflow = False
+    output_overflow = False
+
+    def __init__(self, **flags):
+        self.__dict__.update(flags)
+
+    def __bool__(self):
+        return self.input_underflow or self.input_overflow or self.output_underflow or self.output_overflow
+
+
+class FakeStream:
+    # Drives a stream callback from a worker thread at `speed` times real time (0 = as fast as possible)
+    def __init__(self, backend, kind, device, samplerate, channels, blocksize, callback):
+        self.backend = backend
+        self.kind = kind
+        self.device = device
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize or 512
+        self.callback = callback
+        self.active = False
+        self.thread = None
+        self.frame = 0
+
+    def start(self):
+        self.active = True
+        self.thread = threading.Thread(target=self.run, name=f"fake-{self.kind}", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        quiet = FakeStatus()
+        xrun = FakeStatus(input_overflow=self.kind != 'output', output_underflow=self.kind != 'input')
+        blocks = 0
+        period = self.blocksize / self.samplerate
+        next_time = time.perf_counter()
+        while self.active:
+            blocks += 1
+            status = xrun if self.backend.xrun_every and blocks % self.backend.xrun_every == 0 else quiet
+            if self.kind == 'output':
+                block = np.zeros((self.blocksize, self.channels), dtype=np.float32)
+                self.callback(block, self.blocksize, None, status)
+                self.backend.on_output(self, block)
+            elif self.kind == 'duplex':
+                indata = self.backend.read_input(self, self.blocksize)
+                outdata = np.zeros((self.blocksize, self.channels[1]), dtype=np.float32)
+                self.callback(indata, outdata, self.blocksize, None, status)
+                self.backend.on_output(self, outdata)
+            else:
+                block = self.backend.read_input(self, self.blocksize)
+                self.callback(block, self.blocksize, None, status)
+            self.frame += self.blocksize
+            if self.backend.speed:
+                next_time += period / self.backend.speed
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+            else:
+                time.sleep(0)
+
+    def stop(self):
+        self.active = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def close(self):
+        self.stop()
+
+
+class FakeBackend:
+    # Headless stand-in for sounddevice streams. `source(frame, frames, channels, samplerate)` supplies
+    # input blocks (silence by default); played blocks are counted and optionally kept in `played`.
+    # With loopback_latency set (in frames, at least one block), a duplex stream's input hears its own
+    # output that many frames later, like a cable from the interface's output to its input. xrun_every
+    # flags an overflow/underflow in the callback status every that many blocks.
+    def __init__(self, source=None, speed=1.0, keep_output=False, loopback_latency=None, xrun_every=0):
+        self.source = source
+        self.xrun_every = xrun_every
+        self.speed = speed
+        self.keep_output = keep_output
+        self.loopback_latency = loopback_latency
+        self.played = []
+        self.played_frames = 0
+        self.streams = []
+
+    def open_output(self, device, samplerate, channels, blocksize, callback):
+        stream = FakeStream(self, 'output', device, samplerate, channels, blocksize, callback)
+        self.streams.append(stream)
+        return stream
+
+    def open_input(self, device, samplerate, channels, blocksize, callback):
+        stream = FakeStream(self, 'input', device, samplerate, channels, blocksize, callback)
+        self.streams.append(stream)
+        return stream
+
+    def open_duplex(self, device, samplerate, channels, blocksize, callback):
+        stream = FakeStream(self, 'duplex', device, samplerate, channels, blocksize, callback)
+        stream.delay_line = np.zeros(self.loopback_latency or 0, dtype=np.float32)
+        self.streams.append(stream)
+        return stream
+
+    def on_output(self, stream, block):
+        self.played_frames += len(block)
+        if self.keep_output:
+            self.played.append(block.copy())
+        if stream.kind == 'duplex' and self.loopback_latency is not None:
+            stream.delay_line = np.concatenate((stream.delay_line, block.mean(axis=1)))
+
+    def read_input(self, stream, frames):
+        channels = stream.channels[0] if stream.kind == 'duplex' else stream.channels
+        if stream.kind == 'duplex' and self.loopback_latency is not None:
+            block = np.zeros(frames, dtype=np.float32)
+            heard = stream.delay_line[:frames]
+            block[:len(heard)] = heard
+            stream.delay_line = stream.delay_line[frames:]
+            return np.repeat(block[:, np.newaxis], channels, axis=1)
+        if self.source is None:
+            return np.zeros((frames, channels), dtype=np.float32)
+        block = np.asarray(self.source(stream.frame, frames, channels, stream.samplerate), dtype=np.float32)
+        return block.reshape(frames, -1)
+
+
+backend = FakeBackend(speed=0)
+
+
+class PortAudioError(Exception):
+    pass
+
+
+class Default:
+    def __init__(self):
+        self.device = [0, 1]
+        self.samplerate = None
+        self.channels = [None, None]
+        self.dtype = ['float32', 'float32']
+
+
+default = Default()
+
+
+def install():
+    sys.modules['sounddevice'] = sys.modules[__name__]
+    return sys.modules[__name__]
+
+
+def add_interfaces(count, channels=8):
+    for _ in range(count):
+        DEVICES.append({'name': f"Simulated Interface {len(DEVICES)}", 'hostapi': 0, 'max_input_channels': channels,
+                        'max_output_channels': channels, 'default_samplerate': 48000.0})
+    HOSTAPIS[0]['devices'] = list(range(len(DEVICES)))
+
+
+def _initialize():
+    pass
+
+
+def _terminate():
+    pass
+
+
+def device_info(device, kind):
+    if device is None:
+        device = default.device[0 if kind == 'input' else 1]
+    if not isinstance(device, int):
+        device = next((i for i, d in enumerate(DEVICES) if d['name'] == device), -1)
+    if not 0 <= device < len(DEVICES):
+        raise PortAudioError(f"Error querying device {device}")
+    return dict(DEVICES[device], index=device)
+
+
+def query_devices(device=None, kind=None):
+    if kind is not None:
+        return device_info(device, kind)
+    if device is not None:
+        return device_info(device, None)
+    time.sleep(QUERY_DELAY)
+    return [dict(d, index=i) for i, d in enumerate(DEVICES)]
+
+
+def query_hostapis(index=None):
+    return HOSTAPIS if index is None else HOSTAPIS[index]
+
+
+def check_settings(kind, device, channels, samplerate):
+    time.sleep(CHECK_DELAY)
+    info = device_info(device, kind)
+    if (channels or 1) > info[f'max_{kind}_channels']:
+        raise PortAudioError("Invalid number of channels [PaErrorCode -9998]")
+    if samplerate is not None and int(samplerate) not in SAMPLE_RATES:
+        raise PortAudioError("Invalid sample rate [PaErrorCode -9997]")
+
+
+def check_input_settings(device=None, channels=None, dtype=None, extra_settings=None, samplerate=None):
+    check_settings('input', device, channels, samplerate)
+
+
+def check_output_settings(device=None, channels=None, dtype=None, extra_settings=None, samplerate=None):
+    check_settings('output', device, channels, samplerate)
+
+
+class InputStream(FakeStream):
+    def __init__(self, device=None, samplerate=None, channels=1, blocksize=0, dtype='float32', callback=None, **kwargs):
+        check_input_settings(device, channels, samplerate=samplerate)
+        FakeStream.__init__(self, backend, 'input', device, samplerate or default.samplerate, channels, blocksize, callback)
+        backend.streams.append(self)
+
+
+class OutputStream(FakeStream):
+    def __init__(self, device=None, samplerate=None, channels=2, blocksize=0, dtype='float32', callback=None, **kwargs):
+        check_output_settings(device, channels, samplerate=samplerate)
+        FakeStream.__init__(self, backend, 'output', device, samplerate or default.samplerate, channels, blocksize, callback)
+        backend.streams.append(self)
+
+
+class Stream(FakeStream):
+    def __init__(self, device=(None, None), samplerate=None, channels=(1, 2), blocksize=0, dtype='float32', callback=None,
+                 **kwargs):
+        check_input_settings(device[0], channels[0], samplerate=samplerate)
+        check_output_settings(device[1], channels[1], samplerate=samplerate)
+        FakeStream.__init__(self, backend, 'duplex', device, samplerate or default.samplerate, channels, blocksize, callback)
+        self.delay_line = np.zeros(backend.loopback_latency or 0, dtype=np.float32)
+        backend.streams.append(self)
+
+
+def rec(frames, samplerate=None, channels=1, dtype='float32', device=None, **kwargs):
+    # Blocking-API stand-ins, returning the input source's signal immediately
+    stream = InputStream(device, samplerate, channels)
+    return backend.read_input(stream, int(frames))
+
+
+def play(data, samplerate=None, device=None, **kwargs):
+    backend.played_frames += len(data)
+
+
+def wait():
+    pass
+
+
+def stop():
+    pass
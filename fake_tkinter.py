@@ -0,0 +1,209 @@
+import sys
+import types
+
+# Stand-in for the parts of tkinter the GUI uses, so ChoirRecorderGUI can be built and timed without a
+# display (see benchmark.py's startup suite). install() registers it as `tkinter`, with messagebox and
+# filedialog submodules that answer as if the user cancelled. Widgets remember their options and
+# children but draw nothing.
+
+DISABLED = 'disabled'
+NORMAL = 'normal'
+END = 'end'
+
+
+class Misc:
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.options = options
+        self.children = []
+        self.destroyed = False
+        if master is not None:
+            master.children.append(self)
+
+    def pack(self, **options):
+        pass
+
+    grid = place = pack_forget = pack
+
+    def config(self, **options):
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, option):
+        return self.options.get(option)
+
+    def __getitem__(self, option):
+        return self.options.get(option)
+
+    def __setitem__(self, option, value):
+        self.options[option] = value
+
+    def bind(self, sequence=None, func=None, add=None):
+        pass
+
+    def focus_set(self):
+        pass
+
+    def winfo_children(self):
+        return list(self.children)
+
+    def winfo_exists(self):
+        return not self.destroyed
+
+    def destroy(self):
+        for child in list(self.children):
+            child.destroy()
+        self.destroyed = True
+        if self.master is not None and self in self.master.children:
+            self.master.children.remove(self)
+
+
+class Tk(Misc):
+    def __init__(self):
+        Misc.__init__(self)
+
+    def title(self, text=None):
+        self.options['title'] = text
+
+    def geometry(self, spec=None):
+        self.options['geometry'] = spec
+
+    def after(self, ms, callback=None, *args):
+        pass
+
+    def after_cancel(self, after_id):
+        pass
+
+    def update_idletasks(self):
+        pass
+
+    update = update_idletasks
+
+    def mainloop(self):
+        pass
+
+
+class Label(Misc):
+    pass
+
+
+class Button(Misc):
+    pass
+
+
+class Checkbutton(Misc):
+    pass
+
+
+class Entry(Misc):
+    def __init__(self, master=None, **options):
+        Misc.__init__(self, master, **options)
+        self.text = ""
+
+    def insert(self, index, text):
+        position = len(self.text) if index == END else int(index)
+        self.text = self.text[:position] + str(text) + self.text[position:]
+
+    def delete(self, first, last=None):
+        first = len(self.text) if first == END else int(first)
+        last = first + 1 if last is None else len(self.text) if last == END else int(last)
+        self.text = self.text[:first] + self.text[last:]
+
+    def get(self):
+        return self.text
+
+
+class Canvas(Misc):
+    def __init__(self, master=None, **options):
+        Misc.__init__(self, master, **options)
+        self.items = {}
+
+    def create_rectangle(self, *coords, **options):
+        item = len(self.items) + 1
+        self.items[item] = [list(coords), options]
+        return item
+
+    create_line = create_text = create_oval = create_rectangle
+
+    def coords(self, item, *coords):
+        if coords:
+            self.items[item][0] = list(coords)
+        return self.items[item][0]
+
+    def itemconfig(self, item, **options):
+        self.items[item][1].update(options)
+
+    def delete(self, *items):
+        for item in items:
+            self.items.pop(item, None)
+
+
+class Menu(Misc):
+    def __init__(self, master=None, **options):
+        Misc.__init__(self, master, **options)
+        self.entries = []
+
+    def add_command(self, label=None, command=None, **options):
+        self.entries.append((label, command))
+
+    def delete(self, first, last=None):
+        del self.entries[:]
+
+
+class OptionMenu(Misc):
+    def __init__(self, master, variable, value, *values, command=None, **options):
+        Misc.__init__(self, master, **options)
+        self.options['menu'] = menu = Menu(self)
+        for item in (value,) + values:
+            menu.add_command(label=item, command=lambda item=item: variable.set(item))
+
+
+class Variable:
+    default = ""
+
+    def __init__(self, master=None, value=None, name=None):
+        self.value = self.default if value is None else value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+    def trace_add(self, mode, callback):
+        pass
+
+
+class StringVar(Variable):
+    def get(self):
+        return str(self.value)
+
+
+class BooleanVar(Variable):
+    default = False
+
+    def get(self):
+        return bool(self.value)
+
+
+class IntVar(Variable):
+    default = 0
+
+    def get(self):
+        return int(self.value)
+
+
+messagebox = types.ModuleType('tkinter.messagebox')
+messagebox.showinfo = messagebox.showerror = messagebox.showwarning = lambda *args, **kwargs: 'ok'
+messagebox.askyesno = messagebox.askokcancel = lambda *args, **kwargs: False
+filedialog = types.ModuleType('tkinter.filedialog')
+filedialog.askopenfilename = filedialog.askdirectory = lambda *args, **kwargs: ''
+
+
+def install():
+    module = sys.modules[__name__]
+    sys.modules['tkinter'] = module
+    sys.modules['tkinter.messagebox'] = messagebox
+    sys.modules['tkinter.filedialog'] = filedialog
+    return module
@@ -1,9 +1,10 @@
 import tkinter as tk
-from tkinter import messagebox
-import sounddevice as sd
+from tkinter import messagebox, filedialog
 import numpy as np
-import scipy.io.wavfile
 import os
+from meter import LevelMeter
+from encoding import ENCODINGS
+from tuning import TEMPERAMENTS, NOTE_NAMES, note_sequence
 
 class ChoirRecorderGUI:
     def __init__(self, root, start_callback, recording_complete_callback, app):
@@ -14,17 +15,30 @@ class ChoirRecorderGUI:
         self.root.title("Choir Sample Recorder")
         self.root.geometry("400x700")
         self.monitoring = False
+        self.meter = LevelMeter()
+        self.last_clip_count = 0
         self.tuning = 440.0
         self.waveform = 'triangle'  # Default to triangle wave
+        # Bumped on every device scan, so results from an outdated scan are ignored
+        self.scan_generation = 0
         self.setup_initial_screen()
 
-    def setup_initial_screen(self):
+    def setup_initial_screen(self, refresh_devices=False):
         self.clear_frame()
         tk.Label(self.root, text="Tuning (Hz):").pack(pady=5)
         self.tuning_entry = tk.Entry(self.root)
         self.tuning_entry.insert(0, "440")
         self.tuning_entry.pack(pady=5)
 
+        tk.Label(self.root, text="Temperament:").pack(pady=5)
+        self.temperament_var = tk.StringVar(self.root)
+        self.temperament_var.set(self.app.audio_manager.temperament if not self.app.audio_manager.scale_file else "Scala file...")
+        tk.OptionMenu(self.root, self.temperament_var, *TEMPERAMENTS, "Scala file...", command=self.choose_temperament).pack(pady=5)
+        self.temperament_root_var = tk.StringVar(self.root)
+        self.temperament_root_var.set(NOTE_NAMES[self.app.audio_manager.temperament_root])
+        tk.OptionMenu(self.root, self.temperament_root_var, *NOTE_NAMES).pack(pady=5)
+        self.scale_file = self.app.audio_manager.scale_file
+
         tk.Label(self.root, text="Sample Length (seconds):").pack(pady=5)
         self.sample_length_entry = tk.Entry(self.root)
         self.sample_length_entry.insert(0, "2.5")
@@ -36,15 +50,25 @@ class ChoirRecorderGUI:
         self.countdown_entry.pack(pady=5)
 
         tk.Label(self.root, text="Start Note:").pack(pady=5)
-        self.notes = []
-        for octave in range(2, 5):
-            for note in ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']:
-                self.notes.append(f"{note}{octave}")
-        self.notes.append('C5')
+        self.notes = note_sequence('C2', 'C5')
         self.start_note_var = tk.StringVar(self.root)
         self.start_note_var.set("C2")
+        resume_note = getattr(self.app, 'resume_note', None)
+        if resume_note:
+            # Pick up where the previous session stopped
+            if resume_note not in self.notes:
+                self.notes.append(resume_note)
+            self.start_note_var.set(resume_note)
         self.start_note_menu = tk.OptionMenu(self.root, self.start_note_var, *self.notes)
         self.start_note_menu.pack(pady=5)
+        if resume_note:
+            kept = sum(len(takes) for takes in self.app.recorded_samples.values())
+            tk.Label(self.root, text=f"Resuming session: {kept} takes kept, next note {resume_note}").pack(pady=2)
+
+        tk.Label(self.root, text="Record Every Nth Semitone:").pack(pady=5)
+        self.note_step_var = tk.StringVar(self.root)
+        self.note_step_var.set(str(self.app.note_step))
+        tk.OptionMenu(self.root, self.note_step_var, "1", "2", "3", "4").pack(pady=5)
 
         tk.Label(self.root, text="Waveform:").pack(pady=5)
         self.waveform_var = tk.StringVar(self.root)
@@ -52,121 +76,201 @@ class ChoirRecorderGUI:
         self.waveform_menu = tk.OptionMenu(self.root, self.waveform_var, "sine", "triangle", "square")
         self.waveform_menu.pack(pady=5)
 
+        self.runthrough_var = tk.BooleanVar(self.root, value=self.app.runthrough_mode)
+        tk.Checkbutton(self.root, text="Run-through mode (record all notes in one pass)", variable=self.runthrough_var).pack(pady=5)
+
+        tk.Label(self.root, text="Output Format:").pack(pady=5)
+        self.encoding_var = tk.StringVar(self.root)
+        self.encoding_var.set(self.app.audio_manager.output_encoding)
+        self.encoding_menu = tk.OptionMenu(self.root, self.encoding_var, *ENCODINGS)
+        self.encoding_menu.pack(pady=5)
+
+        # The device menus start empty and are filled by show_devices() once the background scan is done
+        self.device_status = tk.Label(self.root, text="Scanning audio devices...")
+        self.device_status.pack(pady=5)
         tk.Label(self.root, text="Microphone Input:").pack(pady=5)
-        self.input_devices = [d['name'] for d in sd.query_devices() if d['max_input_channels'] > 0]
+        self.input_devices = []
         self.input_var = tk.StringVar(self.root)
-        if self.input_devices:
-            self.input_var.set(self.input_devices[0])
-        self.input_menu = tk.OptionMenu(self.root, self.input_var, *self.input_devices, command=self.update_sample_rates)
+        self.input_menu = tk.OptionMenu(self.root, self.input_var, "")
         self.input_menu.pack(pady=5)
 
+        tk.Label(self.root, text="Input Channels (one singer per channel):").pack(pady=5)
+        self.channels_var = tk.StringVar(self.root)
+        self.channels_var.set(str(self.app.audio_manager.input_channels))
+        self.channels_menu = tk.OptionMenu(self.root, self.channels_var, "1")
+        self.channels_menu.pack(pady=5)
+
         tk.Label(self.root, text="Output Device:").pack(pady=5)
-        self.output_devices = [d['name'] for d in sd.query_devices() if d['max_output_channels'] > 0]
+        self.output_devices = []
         self.output_var = tk.StringVar(self.root)
-        default_output = sd.query_devices(kind='output')['name'] if sd.query_devices(kind='output') else self.output_devices[0] if self.output_devices else ""
-        self.output_var.set(default_output)
-        self.output_menu = tk.OptionMenu(self.root, self.output_var, *self.output_devices)
+        self.output_menu = tk.OptionMenu(self.root, self.output_var, "")
         self.output_menu.pack(pady=5)
 
         tk.Label(self.root, text="Sample Rate (Hz):").pack(pady=5)
         self.sample_rate_var = tk.StringVar(self.root)
         self.sample_rate_menu = tk.OptionMenu(self.root, self.sample_rate_var, "")
         self.sample_rate_menu.pack(pady=5)
-        self.update_sample_rates()
 
         self.volume_canvas = tk.Canvas(self.root, width=200, height=20, bg='white')
         self.volume_canvas.pack(pady=5)
         self.volume_bar = self.volume_canvas.create_rectangle(0, 0, 0, 20, fill='green')
 
-        tk.Button(self.root, text="Test Input", command=self.test_input).pack(pady=5)
-        tk.Button(self.root, text="Test Output", command=self.test_output).pack(pady=5)
-        tk.Button(self.root, text="Start", command=self.start_recording, font=("Arial", 16)).pack(pady=20)
+        # Enabled once the devices and their sample rates are known
+        self.device_buttons = [
+            tk.Button(self.root, text="Test Input", command=self.test_input, state=tk.DISABLED),
+            tk.Button(self.root, text="Test Output", command=self.test_output, state=tk.DISABLED),
+            tk.Button(self.root, text="Calibrate Latency", command=self.calibrate_latency, state=tk.DISABLED),
+        ]
+        for button in self.device_buttons:
+            button.pack(pady=5)
+        tk.Button(self.root, text="Refresh Devices", command=self.refresh_devices).pack(pady=5)
+        self.start_button = tk.Button(self.root, text="Start", command=self.start_recording, font=("Arial", 16), state=tk.DISABLED)
+        self.start_button.pack(pady=20)
+        self.device_buttons.append(self.start_button)
+        self.scan_devices(refresh_devices)
+
+    def fill_menu(self, option_menu, var, values, command=None):
+        menu = option_menu["menu"]
+        menu.delete(0, "end")
+        for value in values:
+            menu.add_command(label=str(value), command=lambda v=value: self.select(var, v, command))
+
+    def select(self, var, value, command=None):
+        var.set(str(value))
+        if command:
+            command(value)
+
+    def scan_devices(self, refresh=False):
+        self.scan_generation += 1
+        generation = self.scan_generation
+        self.app.audio_manager.probe_devices(lambda ok: self.show_devices(generation, ok), refresh)
+
+    def show_devices(self, generation, ok):
+        if generation != self.scan_generation:
+            return
+        devices = self.app.audio_manager.devices
+        self.input_devices = devices.input_names() if ok else []
+        self.output_devices = devices.output_names() if ok else []
+        if not self.input_devices or not self.output_devices:
+            self.device_status.config(text="No audio devices found. Connect one and press Refresh Devices.")
+            return
+        self.device_status.config(text=f"{len(self.input_devices)} inputs, {len(self.output_devices)} outputs")
+        self.input_var.set(self.input_devices[0])
+        self.fill_menu(self.input_menu, self.input_var, self.input_devices, self.update_sample_rates)
+        self.output_var.set(devices.default_output_name() or self.output_devices[0])
+        self.fill_menu(self.output_menu, self.output_var, self.output_devices)
+        self.update_sample_rates(on_ready=self.devices_ready)
+
+    def devices_ready(self):
+        for button in self.device_buttons:
+            button.config(state=tk.NORMAL)
         self.start_volume_monitor()
 
+    def choose_temperament(self, choice):
+        if choice != "Scala file...":
+            self.scale_file = None
+            return
+        scale_file = filedialog.askopenfilename(title="Scala tuning file", filetypes=[("Scala files", "*.scl"), ("All files", "*.*")])
+        if scale_file:
+            self.scale_file = scale_file
+        else:
+            self.temperament_var.set(self.app.audio_manager.temperament)
+
+    def refresh_devices(self):
+        self.monitoring = False
+        self.app.audio_manager.engine.close()
+        self.setup_initial_screen(refresh_devices=True)
+
     def test_input(self):
-        try:
-            self.monitoring = True
-            device_name = self.input_var.get()
-            device_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == device_name), None)
-            if device_id is not None:
-                sd.default.device[0] = device_id
-            sample_rate = int(self.sample_rate_var.get())
-            self.update_volume_meter(sample_rate)
+        self.start_volume_monitor()
+        if self.monitoring:
             self.root.after(5000, lambda: setattr(self, 'monitoring', False))
-        except:
-            self.monitoring = False
 
     def test_output(self):
         try:
             output_device = self.output_var.get()
-            device_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == output_device), None)
+            device_id = self.app.audio_manager.devices.index(output_device, 'output')
             sample_rate = int(self.sample_rate_var.get())
             t = np.linspace(0, 1, int(sample_rate), False)
             audio = 0.5 * np.sin(2 * np.pi * 440 * t)
-            sd.play(audio.astype(np.float32), sample_rate, device=device_id)
-            sd.wait()
+            self.app.audio_manager.engine.play(audio, sample_rate, device_id)
         except:
             pass
 
-    def update_sample_rates(self, *args):
+    def calibrate_latency(self):
+        if not messagebox.askokcancel("Calibrate Latency", "Connect the output to the input (or hold the microphone "
+                                      "close to the speaker), then press OK. A short test signal will play."):
+            return
+        self.monitoring = False
         try:
-            device_name = self.input_var.get()
-            output_name = self.output_var.get()
-            input_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == device_name), None)
-            output_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == output_name), None)
-            self.sample_rates = [44100, 48000, 96000]
-            supported_rates = set()
-            test_rates = [8000, 16000, 22050, 44100, 48000, 96000, 192000]
-            if input_id is not None:
-                for rate in test_rates:
-                    try:
-                        sd.check_input_settings(device=input_id, samplerate=rate, channels=1)
-                        supported_rates.add(rate)
-                    except:
-                        pass
-            if output_id is not None:
-                for rate in test_rates:
-                    try:
-                        sd.check_output_settings(device=output_id, samplerate=rate, channels=2)
-                        supported_rates.add(rate)
-                    except:
-                        pass
-            if supported_rates:
-                self.sample_rates = sorted(supported_rates)
-            self.sample_rate_var.set(str(self.sample_rates[0] if 48000 not in self.sample_rates else 48000))
-            menu = self.sample_rate_menu["menu"]
-            menu.delete(0, "end")
-            for rate in self.sample_rates:
-                menu.add_command(label=str(rate), command=lambda r=rate: self.sample_rate_var.set(str(r)))
-        except:
-            pass
+            audio_manager = self.app.audio_manager
+            audio_manager.set_sample_rate(int(self.sample_rate_var.get()))
+            audio_manager.set_output_device(self.output_var.get())
+            audio_manager.set_input_device(self.input_var.get())
+            audio_manager.calibrate_latency(self.show_latency)
+        except Exception as e:
+            messagebox.showerror("Error", f"Calibration failed: {e}")
+
+    def show_latency(self, frames):
+        if frames is None:
+            messagebox.showerror("Calibrate Latency", "The test signal was not picked up clearly. Check the connection and try again.")
+            return
+        sample_rate = self.app.audio_manager.sample_rate
+        messagebox.showinfo("Calibrate Latency", f"Round-trip latency: {frames} samples ({1000.0 * frames / sample_rate:.1f} ms)")
+
+    def update_sample_rates(self, *args, on_ready=None):
+        # Probing a device nobody has used before opens it at every rate, so it runs in the background
+        generation = self.scan_generation
+        self.app.audio_manager.probe_sample_rates(self.input_var.get(), self.output_var.get(),
+                                                  lambda result: self.show_sample_rates(generation, result, on_ready))
+
+    def show_sample_rates(self, generation, result, on_ready=None):
+        if generation != self.scan_generation or result is None:
+            return
+        self.sample_rates, max_channels = result
+        self.update_input_channels(max_channels)
+        self.sample_rate_var.set(str(self.sample_rates[0] if 48000 not in self.sample_rates else 48000))
+        self.fill_menu(self.sample_rate_menu, self.sample_rate_var, self.sample_rates)
+        if on_ready:
+            on_ready()
+
+    def update_input_channels(self, max_channels):
+        if int(self.channels_var.get()) > max_channels:
+            self.channels_var.set("1")
+        self.fill_menu(self.channels_menu, self.channels_var, range(1, max_channels + 1))
 
     def start_volume_monitor(self, *args):
-        self.monitoring = True
         try:
             device_name = self.input_var.get()
-            device_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == device_name), None)
+            device_id = self.app.audio_manager.devices.index(device_name, 'input')
             if device_id is not None:
-                sd.default.device[0] = device_id
+                self.app.audio_manager.sd.default.device[0] = device_id
             sample_rate = int(self.sample_rate_var.get())
-            self.update_volume_meter(sample_rate)
+            engine = self.app.audio_manager.engine
+            engine.ensure_input(device_id, sample_rate)
+            self.meter.reset()
+            self.last_clip_count = 0
+            engine.add_input_listener(self.meter.process)
+            if not self.monitoring:
+                self.monitoring = True
+                self.update_volume_meter()
         except:
             self.monitoring = False
 
-    def update_volume_meter(self, sample_rate):
+    def update_volume_meter(self):
         if not self.monitoring:
+            self.app.audio_manager.engine.remove_input_listener(self.meter.process)
             return
         try:
-            recording = sd.rec(1024, samplerate=sample_rate, channels=1, blocking=False, dtype='float32')
-            sd.wait()
-            amplitude = np.abs(recording).max()
-            width = min(200, int(amplitude * 400))
+            peak, rms, clips = self.meter.read()
+            width = min(200, int(peak * 400))
             self.volume_canvas.coords(self.volume_bar, 0, 0, width, 20)
-            self.root.update_idletasks()
+            self.volume_canvas.itemconfig(self.volume_bar, fill='red' if clips > self.last_clip_count else 'green')
+            self.last_clip_count = clips
         except:
             self.monitoring = False
             return
-        self.root.after(50, self.update_volume_meter, sample_rate)
+        self.root.after(50, self.update_volume_meter)
 
     def start_recording(self):
         self.monitoring = False
@@ -179,6 +283,14 @@ class ChoirRecorderGUI:
             input_device = self.input_var.get()
             start_note = self.start_note_var.get()
             self.waveform = self.waveform_var.get()
+            self.app.audio_manager.output_encoding = self.encoding_var.get()
+            self.app.runthrough_mode = self.runthrough_var.get()
+            self.app.audio_manager.input_channels = int(self.channels_var.get())
+            self.app.note_step = int(self.note_step_var.get())
+            temperament = self.temperament_var.get()
+            self.app.audio_manager.set_temperament(temperament if temperament in TEMPERAMENTS else 'equal',
+                                                   NOTE_NAMES.index(self.temperament_root_var.get()),
+                                                   self.scale_file if temperament not in TEMPERAMENTS else None)
             if self.tuning <= 0 or sample_length <= 0 or sample_rate <= 0 or countdown_length < 1:
                 raise ValueError
             self.start_callback(self.tuning, sample_length, sample_rate, output_device, input_device, start_note, countdown_length)
@@ -202,9 +314,38 @@ class ChoirRecorderGUI:
             self.root.update_idletasks()
             self.root.after(500, callback)
 
-    def show_recording_options(self, note):
+    def show_runthrough(self, schedule, sample_rate, stop_callback):
+        # Cues follow the schedule of the continuous guide track
+        self.clear_frame()
+        self.runthrough_label = tk.Label(self.root, text="Listen...", font=("Arial", 20))
+        self.runthrough_label.pack(pady=50)
+        tk.Button(self.root, text="Stop", command=stop_callback).pack(pady=10)
+        for note, cue, sing, _ in schedule:
+            self.root.after(int(cue * 1000 / sample_rate), lambda note=note: self.set_runthrough_cue(f"Listen: {note}", 'black'))
+            self.root.after(int(sing * 1000 / sample_rate), lambda note=note: self.set_runthrough_cue(f"Sing: {note}", 'red'))
+        self.root.update_idletasks()
+
+    def set_runthrough_cue(self, text, color):
+        if self.runthrough_label.winfo_exists():
+            self.runthrough_label.config(text=text, fg=color)
+
+    def show_runthrough_summary(self, takes, missing):
+        self.clear_frame()
+        tk.Label(self.root, text=f"Captured {len(takes)} notes", font=("Arial", 16)).pack(pady=20)
+        if missing:
+            shown = ", ".join(missing[:12]) + (" ..." if len(missing) > 12 else "")
+            tk.Label(self.root, text=f"No take found for: {shown}", wraplength=360).pack(pady=5)
+        tk.Button(self.root, text="Record More", command=self.setup_initial_screen).pack(pady=5)
+        tk.Button(self.root, text="Finish", command=lambda: self.confirm_finish()).pack(pady=5)
+        self.root.update_idletasks()
+
+    def show_recording_options(self, note, pitch=None, pending=False):
         self.clear_frame()
         tk.Label(self.root, text=f"Recorded {note}", font=("Arial", 16)).pack(pady=20)
+        self.pitch_label = tk.Label(self.root, text="Checking pitch..." if pending else "")
+        self.pitch_label.pack(pady=5)
+        if pitch is not None:
+            self.show_pitch(note, self.app.last_take_file, pitch)
         tk.Button(self.root, text="Play Back", command=lambda: self.play_sample(note)).pack(pady=5)
         tk.Button(self.root, text="Play Note", command=lambda: self.play_note(note)).pack(pady=5)
         tk.Button(self.root, text="Keep and Proceed", command=lambda: self.recording_complete_callback("keep", note)).pack(pady=5)
@@ -214,6 +355,16 @@ class ChoirRecorderGUI:
         tk.Button(self.root, text="Finish", command=lambda: self.confirm_finish()).pack(pady=5)
         self.root.update_idletasks()
 
+    def show_pitch(self, note, take_file, pitch):
+        # Pitch results arrive from the work queue; ignore them once the review screen has moved on
+        if take_file != self.app.last_take_file or not self.pitch_label.winfo_exists():
+            return
+        if pitch is None:
+            self.pitch_label.config(text="", fg='black')
+            return
+        status = "" if pitch.ok else " - off pitch!"
+        self.pitch_label.config(text=f"Pitch: {pitch.describe()}{status}", fg='black' if pitch.ok else 'red')
+
     def confirm_finish(self):
         if messagebox.askyesno("Confirm", "Are you sure you want to finish and generate the SFZ file?"):
             self.show_sfz_settings()
@@ -263,6 +414,27 @@ class ChoirRecorderGUI:
         self.loop_end_entry.insert(0, "0")
         self.loop_end_entry.pack(pady=5)
 
+        self.loop_auto_var = tk.BooleanVar(self.root, value=False)
+        tk.Checkbutton(self.root, text="Find loop points per sample", variable=self.loop_auto_var).pack(pady=5)
+
+        self.key_spread_var = tk.BooleanVar(self.root, value=self.app.note_step > 1)
+        tk.Checkbutton(self.root, text="Spread notes over unrecorded keys", variable=self.key_spread_var).pack(pady=5)
+        tk.Label(self.root, text="Max Stretch (semitones, blank = no limit):").pack(pady=5)
+        self.max_stretch_entry = tk.Entry(self.root)
+        self.max_stretch_entry.pack(pady=5)
+        self.tune_from_pitch_var = tk.BooleanVar(self.root, value=False)
+        tk.Checkbutton(self.root, text="Fine-tune regions from measured pitch", variable=self.tune_from_pitch_var).pack(pady=5)
+
+        tk.Label(self.root, text="Velocity Layers (by measured loudness, 0 = off):").pack(pady=5)
+        self.velocity_layers_entry = tk.Entry(self.root)
+        self.velocity_layers_entry.insert(0, "0")
+        self.velocity_layers_entry.pack(pady=5)
+
+        tk.Label(self.root, text="Takes / Channels Layout:").pack(pady=5)
+        self.channel_layout_var = tk.StringVar(self.root)
+        self.channel_layout_var.set("pan_cycle")
+        tk.OptionMenu(self.root, self.channel_layout_var, *self.app.sfz_generator.channel_layouts).pack(pady=5)
+
         tk.Button(self.root, text="Generate SFZ", command=self.generate_sfz).pack(pady=20)
         self.root.update_idletasks()
 
@@ -279,6 +451,13 @@ class ChoirRecorderGUI:
                 'loop_mode': self.loop_mode_var.get(),
                 'loop_start': int(self.loop_start_entry.get()),
                 'loop_end': int(self.loop_end_entry.get()),
+                'loop_auto': self.loop_auto_var.get(),
+                'channel_layout': self.channel_layout_var.get(),
+                'key_spread': self.key_spread_var.get(),
+                'max_stretch': int(self.max_stretch_entry.get()) if self.max_stretch_entry.get().strip() else None,
+                'tune_from_pitch': self.tune_from_pitch_var.get(),
+                'velocity_layers': int(self.velocity_layers_entry.get() or 0),
+                'pan_width': self.app.sfz_generator.default_params['pan_width'],
                 'filename': filename
             }
             self.recording_complete_callback("finish", None, sfz_params)
@@ -287,32 +466,27 @@ class ChoirRecorderGUI:
             self.show_sfz_settings()
 
     def play_sample(self, note):
-        sample_path = os.path.join("choir_samples", f"{note}_{len(self.app.recorded_samples.get(note, [])) + 1}.wav")
-        if os.path.exists(sample_path):
+        # Multichannel takes play back their first channel, once it has been written; the write may
+        # still be queued, so playback starts from its completion instead of blocking the UI
+        self.app.audio_manager.work_queue.when_done(self.app.last_take_file, self.play_last_take)
+
+    def play_last_take(self):
+        sample_path = self.app.last_recorded_files[0] if self.app.last_recorded_files else None
+        if sample_path and os.path.exists(sample_path):
             try:
-                fs, data = scipy.io.wavfile.read(sample_path)
-                if data.dtype != np.float32:
-                    data = data.astype(np.float32) / np.iinfo(data.dtype).max
                 output_device = self.output_var.get()
-                device_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == output_device), None)
-                sd.play(data, fs, device=device_id)
-                sd.wait()
+                device_id = self.app.audio_manager.devices.index(output_device, 'output')
+                self.app.audio_manager.play_sample(sample_path, device=device_id)
             except:
                 pass
 
     def play_note(self, note):
         try:
             output_device = self.output_var.get()
-            device_id = next((i for i, d in enumerate(sd.query_devices()) if d['name'] == output_device), None)
+            device_id = self.app.audio_manager.devices.index(output_device, 'output')
             sample_rate = int(self.sample_rate_var.get())
-            t = np.linspace(0, 2.0, int(sample_rate * 2.0), False)
-            frequency = self.app.audio_manager.note_to_frequency(note, self.tuning)
-            audio = 0.98 * self.app.audio_manager.generate_wave(frequency, t, self.waveform)
-            if frequency < self.app.audio_manager.note_to_frequency("C4", self.tuning):
-                audio += 0.98 * self.app.audio_manager.generate_wave(frequency * 2, t, self.waveform)
-                audio /= 2
-            sd.play(audio.astype(np.float32), sample_rate, device=device_id)
-            sd.wait()
+            audio = self.app.audio_manager.get_tone(note, self.tuning, self.waveform, sample_rate=sample_rate)
+            self.app.audio_manager.engine.play(audio, sample_rate, device_id)
         except Exception as e:
             print(f"Failed to play note: {str(e)}")
 
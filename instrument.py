@@ -0,0 +1,206 @@
+import functools
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger("choir_maker")
+
+STATUS_FLAGS = ['input_underflow', 'input_overflow', 'output_underflow', 'output_overflow']
+
+
+class NullSpan:
+    # Shared no-op span handed out while tracing is off
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def end(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = time.perf_counter_ns()
+        self.thread = threading.get_ident()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args, error=exc_type.__name__)
+        self.tracer.add_span(self.name, self.start, time.perf_counter_ns(), self.thread, self.args)
+        return False
+
+
+class AsyncSpan:
+    # A span that starts on one thread and ends in a later callback, possibly on another thread
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.id = next(tracer.ids)
+        self.start = time.perf_counter_ns()
+        self.ended = False
+        tracer.add_event({'name': name, 'cat': 'async', 'ph': 'b', 'id': self.id, 'ts': tracer.us(self.start),
+                          'pid': tracer.pid, 'tid': threading.get_ident(), 'args': args})
+
+    def end(self, **args):
+        if self.ended:
+            return
+        self.ended = True
+        end = time.perf_counter_ns()
+        self.tracer.add_event({'name': self.name, 'cat': 'async', 'ph': 'e', 'id': self.id, 'ts': self.tracer.us(end),
+                               'pid': self.tracer.pid, 'tid': threading.get_ident(), 'args': args})
+        self.tracer.add_duration(self.name, end - self.start)
+
+
+class Tracer:
+    # Spans, async spans and counters for one recording session, exported as Chrome trace-event JSON
+    # (chrome://tracing, ui.perfetto.dev) plus a summary of time per stage. While disabled every call
+    # returns straight away and nothing is kept.
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.pid = os.getpid()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.origin = time.perf_counter_ns()
+            self.started = time.time()
+            self.events = []
+            self.durations = {}
+            self.counters = {}
+            self.threads = {}
+
+    def enable(self, reset=True):
+        if reset:
+            self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def us(self, ns):
+        return (ns - self.origin) / 1000.0
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def begin(self, name, **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return AsyncSpan(self, name, args)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            value = self.counters[name] = self.counters.get(name, 0) + n
+            self.events.append({'name': name, 'ph': 'C', 'ts': self.us(time.perf_counter_ns()), 'pid': self.pid,
+                                'tid': threading.get_ident(), 'args': {'value': value}})
+
+    def stream_status(self, kind, status):
+        # Called from the audio callbacks with a non-empty sounddevice CallbackFlags
+        if not self.enabled:
+            return
+        for flag in STATUS_FLAGS:
+            if getattr(status, flag, False):
+                self.count(f"{kind}.{flag}")
+        self.count(f"{kind}.xruns")
+
+    def add_span(self, name, start, end, thread, args):
+        self.add_event({'name': name, 'cat': 'span', 'ph': 'X', 'ts': self.us(start), 'dur': (end - start) / 1000.0,
+                        'pid': self.pid, 'tid': thread, 'args': args})
+        self.add_duration(name, end - start)
+
+    def add_event(self, event):
+        with self.lock:
+            self.events.append(event)
+            if event['tid'] not in self.threads:
+                self.threads[event['tid']] = threading.current_thread().name
+
+    def add_duration(self, name, ns):
+        with self.lock:
+            stats = self.durations.setdefault(name, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += ns
+            stats[2] = max(stats[2], ns)
+
+    def summary(self):
+        with self.lock:
+            stages = {name: {'count': count, 'total_ms': total / 1e6, 'mean_ms': total / count / 1e6, 'max_ms': peak / 1e6}
+                      for name, (count, total, peak) in self.durations.items()}
+            return {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                    'elapsed_s': (time.perf_counter_ns() - self.origin) / 1e9,
+                    'stages': dict(sorted(stages.items(), key=lambda item: -item[1]['total_ms'])),
+                    'counters': dict(self.counters)}
+
+    def format_summary(self):
+        summary = self.summary()
+        lines = [f"Session {summary['started']}, {summary['elapsed_s']:.1f} s"]
+        for name, stats in summary['stages'].items():
+            lines.append(f"  {name:<28} {stats['count']:>5} x {stats['mean_ms']:>9.2f} ms = {stats['total_ms']:>10.1f} ms"
+                         f" (max {stats['max_ms']:.1f} ms)")
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f"  {name:<28} {value:>5}")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in threads.items()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+
+    def write_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+
+    def export(self, directory):
+        # Writes trace_<time>.json and summary_<time>.json into directory; returns both paths
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))
+        trace_file = os.path.join(directory, f"trace_{stamp}.json")
+        summary_file = os.path.join(directory, f"summary_{stamp}.json")
+        self.export_chrome_trace(trace_file)
+        self.write_summary(summary_file)
+        return trace_file, summary_file
+
+
+tracer = Tracer()
+
+
+def traced(name):
+    # Decorator: wraps every call in a span named `name`
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def report_error(where):
+    # For `except Exception:` blocks that recover: logs the traceback and counts it
+    log.exception("Error in %s", where)
+    tracer.count(f"errors.{where}")
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def key_ranges(centers, max_stretch=None, low=0, high=127):
+    # Splits the keyboard between the recorded keys: every key plays the nearest recorded note
+    # (ties go to the lower one), optionally limited to max_stretch semitones either side.
+    # Returns (lokey, hikey) arrays aligned with the sorted, de-duplicated centers.
+    centers = np.unique(np.asarray(centers, dtype=np.int64))
+    if len(centers) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    splits = (centers[:-1] + centers[1:]) // 2
+    lokey = np.concatenate(([low], splits + 1))
+    hikey = np.concatenate((splits, [high]))
+    if max_stretch is not None:
+        lokey = np.maximum(lokey, centers - max_stretch)
+        hikey = np.minimum(hikey, centers + max_stretch)
+    return np.minimum(lokey, centers), np.maximum(hikey, centers)
+
+
+def note_key_ranges(midi_by_note, max_stretch=None):
+    # {note: midi} -> {note: (lokey, hikey)}
+    centers = np.unique(list(midi_by_note.values()))
+    lokey, hikey = key_ranges(centers, max_stretch)
+    spans = {int(center): (int(lo), int(hi)) for center, lo, hi in zip(centers, lokey, hikey)}
+    return {note: spans[midi] for note, midi in midi_by_note.items()}
+
+
+def merge_region_opcodes(*maps):
+    # Combines several {sample path: {opcode: value}} maps; later maps win on conflicts
+    merged = {}
+    for region_opcodes in maps:
+        for path, opcodes in (region_opcodes or {}).items():
+            merged.setdefault(path, {}).update(opcodes)
+    return merged
+
+
+def velocity_layers(loudness, layers):
+    # Splits one note's takes into up to `layers` velocity bands by measured loudness, quietest first.
+    # loudness: [(path, dBFS)]. Takes sharing a band become round robins; every region gets seq opcodes so
+    # they override any round robin from the channel layout. Returns {path: {opcode: value}}.
+    if not loudness or layers <= 0:
+        return {}
+    order = np.argsort([level for _, level in loudness], kind='stable')
+    groups = np.array_split(order, min(layers, len(order)))
+    opcodes = {}
+    for i, group in enumerate(groups):
+        lovel = 1 + (127 * i) // len(groups)
+        hivel = (127 * (i + 1)) // len(groups)
+        for position, index in enumerate(sorted(group)):
+            opcodes[loudness[index][0]] = {'lovel': lovel, 'hivel': hivel,
+                                           'seq_length': len(group), 'seq_position': position + 1}
+    return opcodes
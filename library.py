@@ -0,0 +1,175 @@
+import json
+import os
+import re
+import threading
+
+import wavio
+from encoding import load_soundfile
+from tuning import NAME_TO_MIDI, note_to_midi
+
+SAMPLE_NAME_RE = re.compile(r'^(?P<note>[A-G]#?)(?P<octave>\d+)_(?P<take>\d+)(_ch(?P<channel>\d+))?\.(wav|flac)$')
+INDEX_FILENAME = ".library_index.json"
+# Serializes read-modify-write of index files by the recorder's writer threads
+index_lock = threading.Lock()
+
+
+def parse_sample_name(filename):
+    match = SAMPLE_NAME_RE.match(os.path.basename(filename))
+    if not match or f"{match['note']}{match['octave']}" not in NAME_TO_MIDI:
+        return None
+    return f"{match['note']}{match['octave']}", int(match['take'])
+
+
+def channel_number(filename):
+    # 1-based input channel of a multichannel take (<note>_<take>_ch<n>), or None for mono takes
+    match = SAMPLE_NAME_RE.match(os.path.basename(filename))
+    return int(match['channel']) if match and match['channel'] else None
+
+
+def channel_path(path, channel):
+    root, ext = os.path.splitext(path)
+    return f"{root}_ch{channel}{ext}"
+
+
+def note_sort_key(note):
+    return note_to_midi(note)
+
+
+def read_take_info(path):
+    # Header-only metadata: (sample_rate, channels, frames)
+    if path.lower().endswith('.flac'):
+        info = load_soundfile().info(path)
+        return info.samplerate, info.channels, info.frames
+    sample_rate, channels, _, _, _, frames = wavio.read_layout(path)
+    return sample_rate, channels, frames
+
+
+class LibraryIndex:
+    # Remembers size, mtime and header metadata for every take in a sample directory, so a rescan
+    # only stats the directory entries and re-reads headers of files that are new or changed
+    def __init__(self, sample_dir):
+        self.sample_dir = sample_dir
+        self.index_file = os.path.join(sample_dir, INDEX_FILENAME)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_file) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def save(self):
+        try:
+            tmp_file = self.index_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            pass
+
+    def make_entry(self, name, parsed, stat, path):
+        try:
+            sample_rate, channels, frames = read_take_info(path)
+        except Exception:
+            sample_rate, channels, frames = None, None, None
+        return {'note': parsed[0], 'take': parsed[1], 'channel': channel_number(name), 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns, 'sample_rate': sample_rate, 'channels': channels, 'frames': frames}
+
+    def rescan(self):
+        entries = {}
+        changed = False
+        with os.scandir(self.sample_dir) as scan:
+            for entry in scan:
+                parsed = parse_sample_name(entry.name)
+                if parsed is None or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                previous = self.entries.get(entry.name)
+                if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+                    entries[entry.name] = previous
+                    continue
+                entries[entry.name] = self.make_entry(entry.name, parsed, stat, entry.path)
+                changed = True
+        if changed or entries.keys() != self.entries.keys():
+            self.entries = entries
+            self.save()
+        return self.entries
+
+    def samples(self):
+        samples = {}
+        for name, entry in self.entries.items():
+            samples.setdefault(entry['note'], []).append((entry['take'], entry.get('channel') or 0, os.path.join(self.sample_dir, name)))
+        return {note: [path for _, _, path in sorted(samples[note])] for note in sorted(samples, key=note_sort_key)}
+
+    def update_loudness(self, measurements):
+        # measurements: {path: (loudness dBFS before processing gain, total gain dB applied)}. Stored
+        # with the file's current size/mtime, so they survive rescans until the file changes again.
+        for path, (loudness, gain_db) in measurements.items():
+            name = os.path.basename(path)
+            parsed = parse_sample_name(name)
+            if parsed is None:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entry = self.entries.get(name)
+            if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                entry = self.entries[name] = self.make_entry(name, parsed, stat, path)
+            entry['loudness'] = float(loudness)
+            entry['gain_db'] = float(gain_db)
+        self.save()
+
+    def loudness(self):
+        # {path: loudness} for every take whose loudness was measured when it was processed
+        return {os.path.join(self.sample_dir, name): entry['loudness']
+                for name, entry in self.entries.items() if entry.get('loudness') is not None}
+
+    def gain_db(self, path):
+        # Total gain already applied to a take, so reprocessing can recover its original loudness
+        entry = self.entries.get(os.path.basename(path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0.0
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry.get('gain_db', 0.0)
+        return 0.0
+
+    def last_take_numbers(self):
+        numbers = {}
+        for entry in self.entries.values():
+            numbers[entry['note']] = max(numbers.get(entry['note'], 0), entry['take'])
+        return numbers
+
+
+def record_loudness(measurements):
+    # {path: (loudness, gain_db)} for freshly written takes, saved into each directory's index
+    by_dir = {}
+    for path, measurement in measurements.items():
+        by_dir.setdefault(os.path.dirname(path) or '.', {})[path] = measurement
+    with index_lock:
+        for sample_dir, group in by_dir.items():
+            LibraryIndex(sample_dir).update_loudness(group)
+
+
+def sample_loudness(paths):
+    # {path: loudness} for the given takes, read from each directory's index; unmeasured takes are left out
+    loudness = {}
+    indexes = {}
+    for path in paths:
+        sample_dir = os.path.dirname(path) or '.'
+        if sample_dir not in indexes:
+            indexes[sample_dir] = LibraryIndex(sample_dir)
+        entry = indexes[sample_dir].entries.get(os.path.basename(path))
+        if entry and entry.get('loudness') is not None:
+            loudness[path] = entry['loudness']
+    return loudness
+
+
+def scan_samples(sample_dir):
+    library = LibraryIndex(sample_dir)
+    library.rescan()
+    return library.samples()
@@ -0,0 +1,89 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from encoding import read_sample
+
+
+def autocorrelation(x):
+    # Normalized (unbiased) autocorrelation through one FFT: O(n log n)
+    n = len(x)
+    size = 1 << (2 * n - 1).bit_length()
+    spectrum = np.fft.rfft(x, size)
+    r = np.fft.irfft(spectrum * np.conj(spectrum), size)[:n]
+    r /= np.arange(n, 0, -1)
+    return r / max(r[0], 1e-20)
+
+
+def zero_crossings(x, start, stop):
+    # Indices i in [start, stop) where x rises through zero between i - 1 and i
+    start, stop = max(1, start), min(len(x), stop)
+    segment = x[start - 1:stop]
+    return start + np.flatnonzero((segment[:-1] < 0) & (segment[1:] >= 0))
+
+
+def find_loop_points(data, sample_rate, min_loop_s=0.2, region=(0.25, 0.85), match_window=64, tolerance=0.01):
+    # Picks the loop length from the strongest autocorrelation peak inside the sustained part of
+    # the take, then snaps both ends to rising zero crossings whose surrounding waveforms match best.
+    # Returns (loop_start, loop_end) with loop_end the last sample played before wrapping, or None.
+    x = np.asarray(data, dtype=np.float64)
+    if x.ndim == 2:
+        x = x.mean(axis=1)
+    n = len(x)
+    lo, hi = int(n * region[0]), int(n * region[1])
+    segment = x[lo:hi]
+    min_lag = int(min_loop_s * sample_rate)
+    if len(segment) < 2 * min_lag or min_lag < 1:
+        return None
+    r = autocorrelation(segment - segment.mean())
+    max_lag = len(segment) // 2
+    # Longer loops hide repetition better, so take the longest lag that is nearly as good as the best
+    candidates = r[min_lag:max_lag + 1]
+    lag = min_lag + int(np.flatnonzero(candidates >= candidates.max() - tolerance)[-1])
+
+    # Fundamental period estimate, used as the search radius around both ends
+    period_search = r[int(sample_rate / 2000):int(sample_rate / 50)]
+    period = int(sample_rate / 2000) + int(np.argmax(period_search)) if len(period_search) else 64
+    end_target = hi - match_window
+    start_target = end_target - lag
+    starts = zero_crossings(x, start_target - period, start_target + period)
+    ends = zero_crossings(x, end_target - period, end_target + period)
+    starts = starts[(starts >= match_window) & (starts + match_window <= n)]
+    ends = ends[(ends >= match_window) & (ends + match_window <= n)]
+    if len(starts) == 0 or len(ends) == 0:
+        return start_target, end_target - 1
+
+    # Compare the waveform just before each candidate end with the waveform just before each
+    # candidate start (what the sampler plays leading into and out of the splice), plus the slopes
+    windows = sliding_window_view(x, 2 * match_window)
+    start_windows = windows[starts - match_window]
+    end_windows = windows[ends - match_window]
+    mismatch = np.sum(np.square(end_windows[:, np.newaxis, :] - start_windows[np.newaxis, :, :]), axis=2)
+    slopes = np.abs((x[ends] - x[ends - 1])[:, np.newaxis] - (x[starts] - x[starts - 1])[np.newaxis, :])
+    lengths = ends[:, np.newaxis] - starts[np.newaxis, :]
+    score = mismatch + slopes * match_window
+    score[lengths < min_lag] = np.inf
+    if not np.isfinite(score).any():
+        return start_target, end_target - 1
+    end_i, start_i = np.unravel_index(np.argmin(score), score.shape)
+    return int(starts[start_i]), int(ends[end_i]) - 1
+
+
+def analyze_file(sample_path, min_loop_s=0.2):
+    sample_rate, data = read_sample(sample_path)
+    return sample_path, find_loop_points(data, sample_rate, min_loop_s)
+
+
+def find_library_loops(samples, workers=None, min_loop_s=0.2):
+    # Runs the analyzer over every take in a process pool; returns per-region loop opcodes
+    sample_paths = [path for sample_list in samples.values() for path in sample_list if os.path.exists(path)]
+    region_opcodes = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(analyze_file, path, min_loop_s) for path in sample_paths]
+        for future in futures:
+            sample_path, points = future.result()
+            if points is not None:
+                region_opcodes[sample_path] = {'loop_start': points[0], 'loop_end': points[1]}
+    return region_opcodes
@@ -1,50 +1,127 @@
+import argparse
+import logging
 import tkinter as tk
 from gui import ChoirRecorderGUI
 from audio import AudioManager
 from sfz import SFZGenerator
+from engine import AudioEngine, TkDispatcher
+from loops import find_library_loops
+from pitch_detect import check_file, check_library, tune_opcodes
+from keymap import merge_region_opcodes
+from library import LibraryIndex
+from session import SessionManifest
+from tuning import note_sequence
+from instrument import NULL_SPAN, tracer, traced, report_error
 import os
 import platform
 import subprocess
 import webbrowser
 
 class ChoirRecorderApp:
-    def __init__(self):
-        self.root = tk.Tk()
-        self.audio_manager = AudioManager()
+    def __init__(self, root=None, audio_manager=None, gui_class=ChoirRecorderGUI, output_dir="choir_samples"):
+        # root, audio_manager and gui_class can be swapped for headless stand-ins (see benchmark.py)
+        self.root = root or tk.Tk()
+        if audio_manager is None:
+            self.dispatcher = TkDispatcher(self.root)
+            audio_manager = AudioManager(engine=AudioEngine(dispatch=self.dispatcher.post))
+        self.audio_manager = audio_manager
         self.sfz_generator = SFZGenerator()
-        self.output_dir = "choir_samples"
+        self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
-        self.gui = ChoirRecorderGUI(self.root, self.start_recording, self.on_recording_complete, self)
+        # Rebuild the previous session (if any) before the GUI picks its start note
+        self.manifest = SessionManifest(self.output_dir)
+        session = self.manifest.replay()
+        self.recorded_samples = session.recorded_samples
+        self.resume_note = session.next_note
+        # Rescanning a large library stats every take, so it runs behind the first paint; next_take_file
+        # waits for it before numbering a new take
+        self.take_numbers = {}
+        self.library_scan = self.audio_manager.in_background(self.load_take_numbers, name="library-scan")
         self.current_note = None
         self.notes = self.generate_note_sequence()
-        self.recorded_samples = {}
         self.countdown_length = 3
-        self.last_recorded_file = None
+        self.last_recorded_files = []
         self.last_recorded_note = None
+        self.last_take_file = None
+        self.pitch_tolerance_cents = 30.0
+        # Run-through mode records the whole note sequence in one continuous take
+        self.runthrough_mode = False
+        self.guide_length = 2.0
+        self.runthrough_gap = 0.5
+        # Record every Nth semitone; the SFZ spreads each take over the keys in between
+        self.note_step = 1
+        self.open_folder_when_done = True
+        # Async trace spans for the countdown and the review of the last take
+        self.countdown_span = NULL_SPAN
+        self.review_span = NULL_SPAN
+        # Last: the start screen reads the settings above
+        self.gui = gui_class(self.root, self.start_recording, self.on_recording_complete, self)
 
-    def generate_note_sequence(self):
-        notes = []
-        octave = 2
-        while True:
-            for note in ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']:
-                notes.append(f"{note}{octave}")
-            octave += 1
-            if octave > 10:
-                break
-        return notes
+    def generate_note_sequence(self, first='C2', step=1):
+        # From `first` up to the top of the MIDI range
+        return note_sequence(first, 'G9')[::step]
 
+    def load_take_numbers(self):
+        # Highest take number per note on disk, so new takes never overwrite earlier ones
+        try:
+            library = LibraryIndex(self.output_dir)
+            library.rescan()
+            self.take_numbers.update(library.last_take_numbers())
+        except Exception:
+            report_error('load_take_numbers')
+
+    def next_take_file(self, note):
+        self.library_scan.join()
+        self.take_numbers[note] = self.take_numbers.get(note, 0) + 1
+        return os.path.join(self.output_dir, f"{note}_{self.take_numbers[note]}.wav")
+
+    def log_event(self, event, **fields):
+        try:
+            self.manifest.append(event, **fields)
+        except OSError:
+            pass
+
+    @traced('start_recording')
     def start_recording(self, tuning, sample_length, sample_rate, output_device, input_device, start_note, countdown_length):
         try:
             self.tuning = float(tuning)
             self.sample_length = float(sample_length)
             self.countdown_length = countdown_length
-            self.audio_manager.set_sample_rate(sample_rate)
-            self.audio_manager.set_output_device(output_device)
-            self.audio_manager.set_input_device(input_device)
+            with tracer.span('device_setup', sample_rate=sample_rate):
+                self.audio_manager.set_sample_rate(sample_rate)
+                self.audio_manager.set_output_device(output_device)
+                self.audio_manager.set_input_device(input_device)
+            if self.note_step > 1:
+                self.notes = self.generate_note_sequence(start_note if start_note in self.notes else 'C2', self.note_step)
             self.current_note_idx = self.notes.index(start_note) if start_note in self.notes else 0
+            self.log_event('start', note=self.notes[self.current_note_idx],
+                           settings={'tuning': self.tuning, 'sample_length': self.sample_length, 'sample_rate': sample_rate,
+                                     'output_device': output_device, 'input_device': input_device})
+            if self.runthrough_mode:
+                self.start_runthrough()
+                return
+            self.audio_manager.prewarm_tones(self.notes[self.current_note_idx:], self.tuning, self.gui.waveform)
             self.process_next_note()
-        except:
-            pass
+        except Exception:
+            report_error('start_recording')
+
+    def start_runthrough(self):
+        notes = self.notes[self.current_note_idx:]
+        capture_file = os.path.join(self.output_dir, f"runthrough_{notes[0]}-{notes[-1]}.wav")
+        schedule = self.audio_manager.record_runthrough(notes, capture_file, self.next_take_file, self.tuning, self.gui.waveform,
+                                                        self.guide_length, self.sample_length, self.runthrough_gap,
+                                                        self.on_runthrough_recorded)
+        self.gui.show_runthrough(schedule, self.audio_manager.sample_rate, self.audio_manager.stop_runthrough)
+
+    def on_runthrough_recorded(self, takes):
+        for note in self.notes:
+            if note in takes:
+                self.recorded_samples.setdefault(note, []).append(takes[note])
+                self.log_event('keep', note=note, file=takes[note], next=self.next_note_after(note, "keep"))
+        missing = [note for note in self.notes[self.current_note_idx:] if note not in takes]
+        # Offer the first missed note as the start of the next pass
+        self.resume_note = missing[0] if missing else None
+        self.gui.show_runthrough_summary(takes, missing)
 
     def process_next_note(self):
         if self.current_note_idx < len(self.notes):
@@ -53,77 +130,146 @@ class ChoirRecorderApp:
         else:
             self.gui.show_completion(self.compile_sfz)
 
+    @traced('play_note_guide')
     def play_note_guide(self):
+        note = self.current_note
+        guide = tracer.begin('guide', note=note)
+
+        def show_countdown():
+            guide.end()
+            self.countdown_span = tracer.begin('countdown', note=note)
+            self.gui.show_countdown(note, self.start_note_recording, self.countdown_length)
+
         try:
-            note_freq = self.audio_manager.note_to_frequency(self.current_note, self.tuning)
-            self.audio_manager.play_sine_wave(note_freq)
-            self.gui.show_countdown(self.current_note, self.start_note_recording, self.countdown_length)
-        except:
-            self.gui.show_countdown(self.current_note, self.start_note_recording, self.countdown_length)
+            self.audio_manager.play_note(note, self.tuning, waveform=self.gui.waveform, on_done=show_countdown)
+        except Exception:
+            report_error('play_note_guide')
+            show_countdown()
 
+    @traced('start_note_recording')
     def start_note_recording(self):
+        self.countdown_span.end()
+        note = self.current_note
+        output_file = None
         try:
-            output_file = os.path.join(self.output_dir, f"{self.current_note}_{len(self.recorded_samples.get(self.current_note, [])) + 1}.wav")
-            self.audio_manager.record_audio(self.sample_length, output_file)
-            self.last_recorded_file = output_file
-            self.last_recorded_note = self.current_note
-            self.gui.show_recording_options(self.current_note)
-        except:
-            self.last_recorded_file = None
-            self.last_recorded_note = None
-            self.gui.show_recording_options(self.current_note)
+            output_file = self.next_take_file(note)
+            self.audio_manager.record_audio(self.sample_length, output_file,
+                                            on_done=lambda paths: self.on_take_saved(note, output_file, paths),
+                                            on_captured=lambda paths: self.on_take_recorded(note, output_file, paths))
+        except Exception:
+            report_error('start_note_recording')
+            self.on_take_recorded(note, output_file, [])
+
+    def on_take_recorded(self, note, output_file, output_files):
+        # Runs as soon as capture ends; output_files (one take per input channel) may still be
+        # being written by the work queue
+        self.last_take_file = output_file
+        self.last_recorded_files = list(output_files)
+        self.last_recorded_note = note if output_files else None
+        for recorded_file in output_files:
+            self.log_event('record', note=note, file=recorded_file)
+        self.review_span = tracer.begin('review', note=note)
+        self.gui.show_recording_options(note, pending=bool(output_files))
+
+    def on_take_saved(self, note, output_file, output_files):
+        if output_file == self.last_take_file and self.last_recorded_note == note:
+            self.last_recorded_files = list(output_files)
+        if output_files:
+            self.audio_manager.work_queue.submit(self.check_takes, note, output_files,
+                                                 on_done=lambda pitch: self.gui.show_pitch(note, output_file, pitch))
+
+    @traced('pitch_check')
+    def check_takes(self, note, output_files):
+        pitch = None
+        for output_file in output_files:
+            try:
+                result = check_file(output_file, note, self.audio_manager.tuning_for(self.tuning), self.pitch_tolerance_cents)[2]
+            except Exception:
+                report_error('check_takes')
+                continue
+            # Show the channel furthest off pitch
+            if pitch is None or (pitch.ok and not result.ok) or (pitch.ok == result.ok and abs(result.cents) > abs(pitch.cents)):
+                pitch = result
+        return pitch
+
+    def next_note_after(self, note, action):
+        if action in ("keep", "skip"):
+            index = self.notes.index(note) + 1 if note in self.notes else len(self.notes)
+            return self.notes[index] if index < len(self.notes) else None
+        return note
+
+    def keep_last_takes(self):
+        if self.last_recorded_note:
+            self.recorded_samples.setdefault(self.last_recorded_note, []).extend(self.last_recorded_files)
+        self.last_recorded_files = []
+        self.last_recorded_note = None
 
     def on_recording_complete(self, action, note, sfz_params=None):
+        self.review_span.end(action=action)
+        with tracer.span('on_recording_complete', action=action, note=note):
+            self.handle_recording_action(action, note, sfz_params)
+
+    def handle_recording_action(self, action, note, sfz_params=None):
         try:
+            if action in ("keep", "keep_again", "finish"):
+                kept = self.last_recorded_files if self.last_recorded_note else []
+                for output_file in kept or [None]:
+                    self.log_event('keep', note=self.last_recorded_note or note, file=output_file, next=self.next_note_after(note, action))
+            elif action == "discard":
+                for output_file in self.last_recorded_files:
+                    self.log_event('discard', note=note, file=output_file, next=note)
+            elif action == "skip":
+                self.log_event('skip', note=note, next=self.next_note_after(note, action))
             if action == "keep":
-                if note not in self.recorded_samples:
-                    self.recorded_samples[note] = []
-                if self.last_recorded_file and self.last_recorded_note == note:
-                    self.recorded_samples[note].append(self.last_recorded_file)
-                self.last_recorded_file = None
-                self.last_recorded_note = None
+                self.keep_last_takes()
                 self.current_note_idx += 1
                 self.process_next_note()
             elif action == "keep_again":
-                if note not in self.recorded_samples:
-                    self.recorded_samples[note] = []
-                if self.last_recorded_file and self.last_recorded_note == note:
-                    self.recorded_samples[note].append(self.last_recorded_file)
-                self.last_recorded_file = None
-                self.last_recorded_note = None
+                self.keep_last_takes()
                 self.play_note_guide()
             elif action == "discard":
-                try:
-                    if self.last_recorded_file:
-                        os.remove(self.last_recorded_file)
-                except FileNotFoundError:
-                    pass
-                self.last_recorded_file = None
+                if self.last_recorded_files:
+                    self.audio_manager.discard_takes(self.last_take_file, self.last_recorded_files)
+                self.last_recorded_files = []
                 self.last_recorded_note = None
                 self.play_note_guide()
             elif action == "skip":
-                self.last_recorded_file = None
+                self.last_recorded_files = []
                 self.last_recorded_note = None
                 self.current_note_idx += 1
                 self.process_next_note()
             elif action == "finish":
-                if self.last_recorded_file and self.last_recorded_note:
-                    if self.last_recorded_note not in self.recorded_samples:
-                        self.recorded_samples[self.last_recorded_note] = []
-                    self.recorded_samples[self.last_recorded_note].append(self.last_recorded_file)
-                self.last_recorded_file = None
-                self.last_recorded_note = None
+                self.keep_last_takes()
                 self.compile_sfz(sfz_params)
-        except:
-            pass
+        except Exception:
+            report_error('on_recording_complete')
 
+    @traced('compile_sfz')
     def compile_sfz(self, sfz_params=None):
         try:
+            # Barrier: every queued take must be on disk before the SFZ refers to it
+            with tracer.span('flush_writes'):
+                self.audio_manager.work_queue.flush()
+            self.recorded_samples = {note: [path for path in takes if os.path.exists(path)]
+                                     for note, takes in self.recorded_samples.items()}
             output_sfz = os.path.join(self.output_dir, sfz_params.get('filename', 'choir.sfz') if sfz_params else 'choir.sfz')
-            self.sfz_generator.generate_sfz(self.recorded_samples, output_sfz, self.output_dir, sfz_params)
-            self.open_output_folder()
+            region_opcodes = None
+            if sfz_params and sfz_params.get('loop_auto') and sfz_params['loop_mode'] in ['loop_continuous', 'loop_sustain']:
+                with tracer.span('find_loops'):
+                    region_opcodes = find_library_loops(self.recorded_samples)
+            if sfz_params and sfz_params.get('tune_from_pitch'):
+                with tracer.span('tune_from_pitch'):
+                    results = check_library(self.recorded_samples, self.audio_manager.tuning_for(getattr(self, 'tuning', 440.0)))
+                    region_opcodes = merge_region_opcodes(region_opcodes, tune_opcodes(results))
+            with tracer.span('generate_sfz', regions=sum(len(takes) for takes in self.recorded_samples.values())):
+                self.sfz_generator.generate_sfz(self.recorded_samples, output_sfz, self.output_dir, sfz_params, region_opcodes=region_opcodes)
+            self.log_event('compile', file=output_sfz)
+            if self.open_folder_when_done:
+                self.open_output_folder()
+            self.audio_manager.engine.close()
             self.root.destroy()
-        except:
+        except Exception:
+            report_error('compile_sfz')
             self.root.destroy()
 
     def open_output_folder(self):
@@ -135,15 +281,26 @@ class ChoirRecorderApp:
                 subprocess.run(["open", folder_path], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             else:
                 subprocess.run(["xdg-open", folder_path], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except:
+        except Exception:
             try:
                 webbrowser.open(f"file://{folder_path}")
-            except:
-                pass
+            except Exception:
+                report_error('open_output_folder')
 
     def run(self):
         self.root.mainloop()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Choir Maker")
+    parser.add_argument('--trace', metavar='DIR', default=os.environ.get('CHOIR_MAKER_TRACE'),
+                        help="Record stage timings and write a Chrome trace and a session summary into DIR on exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.trace:
+        tracer.enable()
     app = ChoirRecorderApp()
     app.run()
+    if args.trace:
+        trace_file, summary_file = tracer.export(args.trace)
+        print(tracer.format_summary())
+        print(f"Wrote {trace_file} and {summary_file}")
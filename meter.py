@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class LevelMeter:
+    # Single-producer ring buffer fed from the input stream callback. The callback only writes
+    # samples and counts clips; readers never block it and keep their own cursor,
+    # so every incoming frame is measured exactly once.
+    def __init__(self, capacity=1 << 16, clip_level=0.999):
+        self.ring = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.clip_level = clip_level
+        self.write_index = 0
+        self.read_index = 0
+        self.clip_count = 0
+
+    def process(self, block):
+        # Meter the loudest channel of each frame
+        block = np.abs(block)
+        if block.ndim == 2:
+            block = block.max(axis=1)
+        n = len(block)
+        if n == 0:
+            return
+        if n > self.capacity:
+            block = block[-self.capacity:]
+        start = self.write_index % self.capacity
+        first = min(len(block), self.capacity - start)
+        self.ring[start:start + first] = block[:first]
+        self.ring[:len(block) - first] = block[first:]
+        self.clip_count += int(np.count_nonzero(block >= self.clip_level))
+        self.write_index += n
+
+    def read(self):
+        # Peak and RMS over every frame written since the previous read, plus the running clip count
+        end = self.write_index
+        start = max(self.read_index, end - self.capacity)
+        self.read_index = end
+        if end == start:
+            return 0.0, 0.0, self.clip_count
+        first, last = start % self.capacity, end % self.capacity
+        if first < last:
+            window = self.ring[first:last]
+        else:
+            window = np.concatenate((self.ring[first:], self.ring[:last]))
+        return float(window.max()), float(np.sqrt(np.mean(np.square(window)))), self.clip_count
+
+    def reset(self):
+        self.read_index = self.write_index
+        self.clip_count = 0
@@ -0,0 +1,129 @@
+import json
+import os
+
+import numpy as np
+
+import wavio
+from encoding import read_sample
+
+
+def index_path(monolith_file):
+    return os.path.splitext(monolith_file)[0] + ".json"
+
+
+def read_take(sample_path, sample_rate, channels):
+    take_rate, data = read_sample(sample_path)
+    data = data.reshape(len(data), -1)
+    if take_rate != sample_rate or data.shape[1] != channels:
+        raise ValueError(f"{sample_path} is {take_rate} Hz / {data.shape[1]} ch, monolith is {sample_rate} Hz / {channels} ch")
+    return data
+
+
+def take_entry(sample_path, note, offset, frames, capacity):
+    stat = os.stat(sample_path)
+    return {'note': note, 'offset': offset, 'frames': frames, 'capacity': capacity,
+            'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class Monolith:
+    # Packs every take into one float32 WAV. Each take gets `slack` extra capacity after it, and the
+    # sidecar JSON index records where each take lives, so a re-recorded take is written in place
+    # (or appended when it no longer fits) instead of rewriting the whole file.
+    def __init__(self, monolith_file, slack=0.25):
+        self.monolith_file = monolith_file
+        self.slack = slack
+        self.index = None
+
+    def load_index(self):
+        try:
+            with open(index_path(self.monolith_file)) as f:
+                self.index = json.load(f)
+            if not os.path.exists(self.monolith_file):
+                self.index = None
+        except (OSError, ValueError):
+            self.index = None
+        return self.index
+
+    def save_index(self):
+        tmp_path = index_path(self.monolith_file) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp_path, index_path(self.monolith_file))
+
+    def build(self, samples):
+        sample_paths = [(note, path) for note, sample_list in samples.items() for path in sample_list]
+        if not sample_paths:
+            raise ValueError("No takes to pack")
+        sample_rate, first = read_sample(sample_paths[0][1], mmap=True)
+        channels = 1 if first.ndim == 1 else first.shape[1]
+        takes = {}
+        offset = 0
+        with wavio.WavWriter(self.monolith_file, sample_rate, channels) as writer:
+            for note, sample_path in sample_paths:
+                data = read_take(sample_path, sample_rate, channels)
+                capacity = len(data) + int(len(data) * self.slack)
+                writer.write(data)
+                writer.write(np.zeros((capacity - len(data), channels), dtype=np.float32))
+                takes[os.path.basename(sample_path)] = take_entry(sample_path, note, offset, len(data), capacity)
+                offset += capacity
+        self.index = {'sample_rate': sample_rate, 'channels': channels, 'takes': takes}
+        self.save_index()
+        return self.index
+
+    def replace_take(self, sample_path, note):
+        name = os.path.basename(sample_path)
+        data = read_take(sample_path, self.index['sample_rate'], self.index['channels'])
+        entry = self.index['takes'].get(name)
+        if entry is not None and len(data) <= entry['capacity']:
+            _, mapped = wavio.open_memmap(self.monolith_file)
+            mapped[entry['offset']:entry['offset'] + len(data)] = data
+            mapped[entry['offset'] + len(data):entry['offset'] + entry['capacity']] = 0
+            mapped.flush()
+            del mapped
+            offset, capacity = entry['offset'], entry['capacity']
+        else:
+            capacity = len(data) + int(len(data) * self.slack)
+            padded = np.zeros((capacity, self.index['channels']), dtype=np.float32)
+            padded[:len(data)] = data
+            offset = wavio.append(self.monolith_file, padded)
+        self.index['takes'][name] = take_entry(sample_path, note, offset, len(data), capacity)
+
+    def update(self, samples):
+        # Builds the monolith on first use; afterwards only new or modified takes are rewritten.
+        # Returns the number of takes written.
+        if self.load_index() is None:
+            self.build(samples)
+            return sum(len(sample_list) for sample_list in samples.values())
+        written = 0
+        present = set()
+        for note, sample_list in samples.items():
+            for sample_path in sample_list:
+                name = os.path.basename(sample_path)
+                present.add(name)
+                entry = self.index['takes'].get(name)
+                stat = os.stat(sample_path)
+                if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                    continue
+                self.replace_take(sample_path, note)
+                written += 1
+        # Deleted takes keep their space in the file but are dropped from the index
+        for name in list(self.index['takes']):
+            if name not in present:
+                del self.index['takes'][name]
+        self.save_index()
+        return written
+
+    def region_opcodes(self, samples, region_opcodes=None):
+        # Points every region at the monolith; per-sample loop points become absolute file positions
+        monolith_name = os.path.basename(self.monolith_file)
+        opcodes = {}
+        for sample_list in samples.values():
+            for sample_path in sample_list:
+                entry = self.index['takes'][os.path.basename(sample_path)]
+                extra = dict((region_opcodes or {}).get(sample_path, {}))
+                for key in ('loop_start', 'loop_end'):
+                    if key in extra:
+                        extra[key] += entry['offset']
+                opcodes[sample_path] = dict(sample=monolith_name, offset=entry['offset'],
+                                            end=entry['offset'] + entry['frames'] - 1, **extra)
+        return opcodes
@@ -0,0 +1,121 @@
+import csv
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from encoding import read_sample
+from tuning import as_tuning
+
+
+def yin(data, sample_rate, fmin=60.0, fmax=1600.0, window=None, hop=None, threshold=0.15):
+    # Frame-wise YIN with the difference function computed for all frames at once through
+    # batched FFTs. Returns (f0 per frame in Hz, aperiodicity per frame); unvoiced frames get 0 Hz.
+    x = np.asarray(data, dtype=np.float64)
+    if x.ndim == 2:
+        x = x.mean(axis=1)
+    tau_min = max(2, int(sample_rate / fmax))
+    tau_max = int(sample_rate / fmin)
+    window = window or 2 * tau_max
+    hop = hop or window // 2
+    frame_length = window + tau_max
+    if len(x) < frame_length:
+        return np.zeros(0), np.zeros(0)
+    frames = sliding_window_view(x, frame_length)[::hop]
+    frames = frames - frames.mean(axis=1, keepdims=True)
+
+    size = 1 << (frame_length + window).bit_length()
+    cross = np.fft.irfft(np.fft.rfft(frames, size) * np.conj(np.fft.rfft(frames[:, :window], size)), size)[:, :tau_max + 1]
+    energy = np.concatenate((np.zeros((len(frames), 1)), np.cumsum(np.square(frames), axis=1)), axis=1)
+    lags = np.arange(tau_max + 1)
+    shifted_energy = energy[:, lags + window] - energy[:, lags]
+    diff = np.maximum(energy[:, window:window + 1] + shifted_energy - 2 * cross, 0.0)
+
+    # Cumulative mean normalized difference
+    cmnd = np.ones_like(diff)
+    running = np.cumsum(diff[:, 1:], axis=1)
+    cmnd[:, 1:] = diff[:, 1:] * lags[1:] / np.maximum(running, 1e-20)
+
+    search = cmnd[:, tau_min:]
+    below = search < threshold
+    # First dip under the threshold, walked forward to its local minimum
+    first = np.where(below.any(axis=1), below.argmax(axis=1), search.argmin(axis=1))
+    rows = np.arange(len(frames))
+    for _ in range(tau_max):
+        nxt = np.minimum(first + 1, search.shape[1] - 1)
+        step = search[rows, nxt] < search[rows, first]
+        if not step.any():
+            break
+        first = np.where(step, nxt, first)
+    tau = first + tau_min
+
+    # Parabolic interpolation around the chosen lag
+    left = cmnd[rows, np.maximum(tau - 1, 0)]
+    center = cmnd[rows, tau]
+    right = cmnd[rows, np.minimum(tau + 1, tau_max)]
+    denom = left - 2 * center + right
+    offset = np.where(np.abs(denom) > 1e-12, 0.5 * (left - right) / np.where(np.abs(denom) > 1e-12, denom, 1), 0.0)
+    f0 = sample_rate / (tau + np.clip(offset, -1, 1))
+    aperiodicity = center
+    f0[aperiodicity >= threshold * 2] = 0.0
+    return f0, aperiodicity
+
+
+class PitchResult:
+    def __init__(self, expected, measured, cents, voiced_ratio, tolerance_cents):
+        self.expected = expected
+        self.measured = measured
+        self.cents = cents
+        self.voiced_ratio = voiced_ratio
+        self.ok = measured > 0 and abs(cents) <= tolerance_cents
+
+    def describe(self):
+        if self.measured <= 0:
+            return "No pitch detected"
+        return f"{self.measured:.1f} Hz ({self.cents:+.0f} cents)"
+
+
+def check_pitch(data, sample_rate, expected, tolerance_cents=30.0):
+    # Median pitch of the voiced frames, searched within a fifth either side of the target
+    f0, _ = yin(data, sample_rate, fmin=expected / 1.5, fmax=expected * 1.5)
+    voiced = f0[f0 > 0]
+    if len(voiced) == 0:
+        return PitchResult(expected, 0.0, 0.0, 0.0, tolerance_cents)
+    measured = float(np.median(voiced))
+    cents = 1200.0 * math.log2(measured / expected)
+    return PitchResult(expected, measured, cents, len(voiced) / len(f0), tolerance_cents)
+
+
+def check_file(sample_path, note, tuning=440.0, tolerance_cents=30.0):
+    # tuning is an A4 reference in Hz or a tuning.Tuning (for other temperaments)
+    sample_rate, data = read_sample(sample_path, mmap=True)
+    return sample_path, note, check_pitch(data, sample_rate, as_tuning(tuning).frequency(note), tolerance_cents)
+
+
+def check_library(samples, tuning=440.0, tolerance_cents=30.0, workers=None):
+    # samples maps note -> list of take paths; returns [(path, note, PitchResult)] in input order
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(check_file, path, note, tuning, tolerance_cents)
+                   for note, sample_list in samples.items() for path in sample_list]
+        return [future.result() for future in futures]
+
+
+def tune_opcodes(results, max_cents=100):
+    # Per-region `tune` that cancels each take's measured deviation from its note (skips takes with
+    # no pitch or more than max_cents off, which are more likely wrong notes than detuned ones)
+    region_opcodes = {}
+    for path, note, result in results:
+        if result.measured > 0 and abs(result.cents) <= max_cents:
+            region_opcodes[path] = {'tune': -int(round(result.cents))}
+    return region_opcodes
+
+
+def write_report(results, report_file):
+    with open(report_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['file', 'note', 'expected_hz', 'measured_hz', 'cents', 'voiced_ratio', 'status'])
+        for path, note, result in results:
+            writer.writerow([os.path.basename(path), note, f"{result.expected:.2f}", f"{result.measured:.2f}",
+                             f"{result.cents:+.1f}", f"{result.voiced_ratio:.2f}", 'ok' if result.ok else 'reject'])
@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from encoding import read_sample
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class PreviewCache:
+    # Bounded LRU of decoded takes for auditioning, keyed by path and checked against the file's
+    # size and mtime. Freshly recorded takes are added straight from memory; anything else is
+    # decoded once through a memory-mapped read and kept as a contiguous float32 buffer.
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.buffers = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        stamp = file_stamp(path)
+        with self.lock:
+            entry = self.buffers.get(path)
+            if entry is not None and entry[0] == stamp:
+                self.buffers.move_to_end(path)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+        sample_rate, data = self.load(path)
+        self.put(path, sample_rate, data, stamp)
+        return sample_rate, data
+
+    def load(self, path):
+        sample_rate, data = read_sample(path, mmap=True)
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        data.setflags(write=False)
+        return sample_rate, data
+
+    def put(self, path, sample_rate, data, stamp=None):
+        # `data` is the buffer just written to `path` (identical up to PCM quantization)
+        try:
+            stamp = stamp or file_stamp(path)
+        except OSError:
+            return
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        data.setflags(write=False)
+        with self.lock:
+            previous = self.buffers.pop(path, None)
+            if previous is not None:
+                self.size -= previous[2].nbytes
+            self.buffers[path] = (stamp, sample_rate, data)
+            self.size += data.nbytes
+            while self.size > self.max_bytes and len(self.buffers) > 1:
+                _, evicted = self.buffers.popitem(last=False)
+                self.size -= evicted[2].nbytes
+
+    def discard(self, path):
+        with self.lock:
+            entry = self.buffers.pop(path, None)
+            if entry is not None:
+                self.size -= entry[2].nbytes
+
+    def clear(self):
+        with self.lock:
+            self.buffers.clear()
+            self.size = 0
@@ -0,0 +1,165 @@
+import numpy as np
+
+
+def to_float32(data):
+    if data.dtype == np.float32:
+        return data
+    if np.issubdtype(data.dtype, np.floating):
+        return data.astype(np.float32)
+    if data.dtype == np.uint8:
+        return (data.astype(np.float32) - 128) / 128
+    return data.astype(np.float32) / np.iinfo(data.dtype).max
+
+
+def db_to_gain(db):
+    return 10.0 ** (db / 20.0)
+
+
+def gain_to_db(gain):
+    return 20.0 * np.log10(max(gain, 1e-10))
+
+
+class Analysis:
+    # loudness is the loudest short-term RMS (dBFS) of the trimmed take, measured before gain
+    def __init__(self, onset, offset, dc, peak, rms, gain, loudness=-200.0):
+        self.onset = onset
+        self.offset = offset
+        self.dc = dc
+        self.peak = peak
+        self.rms = rms
+        self.gain = gain
+        self.loudness = loudness
+
+    @property
+    def frames(self):
+        return self.offset - self.onset
+
+
+class SamplePipeline:
+    # Post-processing for a take: block-RMS onset/offset trim, DC removal, gain to a peak or RMS
+    # target, and short fades. Everything runs over fixed-size chunks, so the same code handles
+    # in-memory arrays, memory-mapped files and batch reprocessing.
+    def __init__(self, sample_rate, block_ms=5.0, onset_db=-40.0, offset_db=-50.0, pre_roll_ms=5.0,
+                 post_roll_ms=50.0, fade_in_ms=2.0, fade_out_ms=20.0, remove_dc=True, target='peak',
+                 target_db=0.0, ceiling_db=0.0, chunk_frames=1 << 16, loudness_window_ms=400.0):
+        self.sample_rate = sample_rate
+        self.block = max(1, int(sample_rate * block_ms / 1000))
+        self.onset_db = onset_db
+        self.offset_db = offset_db
+        self.pre_roll = int(sample_rate * pre_roll_ms / 1000)
+        self.post_roll = int(sample_rate * post_roll_ms / 1000)
+        self.fade_in = int(sample_rate * fade_in_ms / 1000)
+        self.fade_out = int(sample_rate * fade_out_ms / 1000)
+        self.remove_dc = remove_dc
+        self.target = target
+        self.target_db = target_db
+        self.ceiling_db = ceiling_db
+        self.loudness_window = max(1, int(sample_rate * loudness_window_ms / 1000) // self.block)
+        # Chunks hold a whole number of analysis blocks
+        self.chunk_frames = max(self.block, chunk_frames - chunk_frames % self.block)
+
+    def block_stats(self, data):
+        # One chunked pass collecting per-block, per-channel frame counts, sums, sums of squares,
+        # maxima and minima. The last block may be shorter than the others.
+        channels = data.shape[1] if data.ndim == 2 else 1
+        counts, sums, squares, highs, lows = [], [], [], [], []
+        for start in range(0, len(data), self.chunk_frames):
+            chunk = np.asarray(data[start:start + self.chunk_frames], dtype=np.float64).reshape(-1, channels)
+            whole = len(chunk) - len(chunk) % self.block
+            parts = [chunk[:whole].reshape(-1, self.block, channels)]
+            if whole < len(chunk):
+                parts.append(chunk[whole:][np.newaxis])
+            for blocks in parts:
+                if not len(blocks):
+                    continue
+                counts.append(np.full(len(blocks), blocks.shape[1], dtype=np.float64))
+                sums.append(blocks.sum(axis=1))
+                squares.append(np.square(blocks).sum(axis=1))
+                highs.append(blocks.max(axis=1))
+                lows.append(blocks.min(axis=1))
+        if not counts:
+            empty = np.zeros((0, channels))
+            return np.zeros(0), empty, empty, empty, empty
+        return (np.concatenate(counts), np.concatenate(sums), np.concatenate(squares),
+                np.concatenate(highs), np.concatenate(lows))
+
+    def analyze(self, data):
+        length = len(data)
+        counts, sums, squares, highs, lows = self.block_stats(data)
+        if length == 0:
+            return Analysis(0, 0, np.zeros(sums.shape[1]), 0.0, 0.0, 1.0)
+        n = counts[:, np.newaxis]
+        dc = sums.sum(axis=0) / length if self.remove_dc else np.zeros(sums.shape[1])
+        # Mean square around each channel's DC offset, per block: E[x^2] - 2*dc*E[x] + dc^2,
+        # averaged over channels
+        block_ms = np.maximum(squares / n - 2 * dc * sums / n + dc * dc, 0.0).mean(axis=1)
+        block_rms = np.sqrt(block_ms)
+        above = np.flatnonzero(block_rms > db_to_gain(self.onset_db))
+        if len(above) == 0:
+            onset, offset = 0, length
+            first, last = 0, len(counts)
+        else:
+            first = above[0]
+            last = np.flatnonzero(block_rms > db_to_gain(self.offset_db))[-1] + 1
+            onset = max(0, int(first) * self.block - self.pre_roll)
+            offset = min(length, int(last) * self.block + self.post_roll)
+            first, last = onset // self.block, -(-offset // self.block)
+        peak = float(max((highs[first:last] - dc).max(), (dc - lows[first:last]).max()))
+        rms = float(np.sqrt(np.sum(block_ms[first:last] * counts[first:last]) / np.sum(counts[first:last])))
+        if self.target == 'rms':
+            gain = db_to_gain(self.target_db) / max(rms, 1e-10)
+        else:
+            gain = db_to_gain(self.target_db) / max(peak, 1e-10)
+        gain = min(gain, db_to_gain(self.ceiling_db) / max(peak, 1e-10))
+        return Analysis(onset, offset, dc, peak, rms, gain, self.short_term_loudness(block_ms[first:last], counts[first:last]))
+
+    def short_term_loudness(self, block_ms, counts):
+        # Sliding-window mean square over loudness_window blocks, via cumulative sums
+        energy = np.concatenate(([0.0], np.cumsum(block_ms * counts)))
+        frames = np.concatenate(([0.0], np.cumsum(counts)))
+        window = min(self.loudness_window, len(counts))
+        if window == 0:
+            return -200.0
+        mean_square = (energy[window:] - energy[:-window]) / np.maximum(frames[window:] - frames[:-window], 1)
+        return float(10.0 * np.log10(max(mean_square.max(), 1e-20)))
+
+    def fade_envelope(self, start, n, frames):
+        positions = np.arange(start, start + n, dtype=np.float32)
+        envelope = np.ones(n, dtype=np.float32)
+        if self.fade_in and start < self.fade_in:
+            envelope = np.minimum(envelope, positions / self.fade_in)
+        if self.fade_out and start + n > frames - self.fade_out:
+            envelope = np.minimum(envelope, (frames - 1 - positions) / self.fade_out)
+        return np.clip(envelope, 0.0, 1.0)
+
+    def processed_chunks(self, data, analysis):
+        # Yields (destination frame, processed chunk) for the trimmed take, reading each source chunk
+        # only when it is asked for
+        frames = analysis.frames
+        for dst in range(0, frames, self.chunk_frames):
+            n = min(self.chunk_frames, frames - dst)
+            chunk = np.asarray(data[analysis.onset + dst:analysis.onset + dst + n], dtype=np.float32)
+            chunk = (chunk - analysis.dc.astype(np.float32)) * np.float32(analysis.gain)
+            if dst < self.fade_in or dst + n > frames - self.fade_out:
+                envelope = self.fade_envelope(dst, n, frames)
+                chunk *= envelope.reshape(-1, *([1] * (chunk.ndim - 1)))
+            yield dst, chunk
+
+    def apply(self, data, out, analysis):
+        # Writes the processed take to out[0:frames]; out may be data itself, because chunks are
+        # copied forwards and each source chunk is read before its destination is written
+        for dst, chunk in self.processed_chunks(data, analysis):
+            out[dst:dst + len(chunk)] = chunk
+        return analysis.frames
+
+    def process(self, data):
+        analysis = self.analyze(data)
+        out = np.empty((analysis.frames,) + data.shape[1:], dtype=np.float32)
+        self.apply(data, out, analysis)
+        return out, analysis
+
+    def process_in_place(self, data):
+        # For memory-mapped input: returns the analysis; the caller truncates to analysis.frames
+        analysis = self.analyze(data)
+        self.apply(data, data, analysis)
+        return analysis
@@ -0,0 +1,78 @@
+import numpy as np
+
+import wavio
+from encoding import write_sample
+from processing import SamplePipeline, db_to_gain, gain_to_db
+from library import record_loudness
+
+
+def build_schedule(notes, sample_rate, guide_s=2.0, sing_s=2.5, gap_s=0.5):
+    # One entry per note: (note, cue frame, sing frame, window end frame). The guide tone plays from
+    # the cue, the singer holds the note from the sing frame, and the window runs to the next cue.
+    guide, sing, gap = (int(round(s * sample_rate)) for s in (guide_s, sing_s, gap_s))
+    schedule = []
+    position = 0
+    for note in notes:
+        schedule.append((note, position, position + guide, position + guide + sing + gap))
+        position += guide + sing + gap
+    return schedule, position
+
+
+def render_guide(schedule, frames, tone):
+    # tone(note) -> float32 guide tone; places every tone at its cue in one continuous buffer
+    guide = np.zeros(frames, dtype=np.float32)
+    for note, cue, sing, _ in schedule:
+        audio = np.asarray(tone(note), dtype=np.float32)[:sing - cue]
+        guide[cue:cue + len(audio)] = audio
+    return guide
+
+
+def find_takes(data, sample_rate, schedule, latency=0, block_ms=5.0, onset_db=-40.0, offset_db=-50.0,
+               pre_roll_ms=5.0, post_roll_ms=50.0, min_take_s=0.3):
+    # Block RMS of the whole capture is computed once; each window's first block above onset_db and
+    # last block above offset_db are then found for all windows at once by binary search.
+    # Returns [(note, start frame, end frame)] for the windows that contain a take.
+    pipeline = SamplePipeline(sample_rate, block_ms=block_ms)
+    block = pipeline.block
+    counts, sums, squares, _, _ = pipeline.block_stats(data)
+    if len(counts) == 0 or not schedule:
+        return []
+    n = counts[:, np.newaxis]
+    dc = sums.sum(axis=0) / len(data)
+    block_rms = np.sqrt(np.maximum(squares / n - 2 * dc * sums / n + dc * dc, 0.0).mean(axis=1))
+    loud_on = np.flatnonzero(block_rms > db_to_gain(onset_db))
+    loud_off = np.flatnonzero(block_rms > db_to_gain(offset_db))
+    if len(loud_on) == 0:
+        return []
+
+    window_start = np.array([sing for _, _, sing, _ in schedule]) + latency
+    window_end = np.minimum(np.array([end for _, _, _, end in schedule]) + latency, len(data))
+    first_block = -(-window_start // block)
+    last_block = window_end // block
+    i = np.searchsorted(loud_on, first_block)
+    onset = loud_on[np.minimum(i, len(loud_on) - 1)]
+    j = np.searchsorted(loud_off, last_block) - 1
+    offset = loud_off[np.maximum(j, 0)] + 1
+    valid = (i < len(loud_on)) & (onset < last_block) & (j >= 0) & (offset > onset)
+
+    start = np.maximum(onset * block - int(sample_rate * pre_roll_ms / 1000), window_start)
+    end = np.minimum(offset * block + int(sample_rate * post_roll_ms / 1000), window_end)
+    valid &= end - start >= int(sample_rate * min_take_s)
+    return [(schedule[k][0], int(start[k]), int(end[k])) for k in np.flatnonzero(valid)]
+
+
+def slice_capture(capture_file, schedule, take_file, pipeline=None, encoding='float32', dither=True, latency=0):
+    # Cuts a continuous float32 capture into per-note takes; take_file(note) names each new take.
+    # Returns {note: written path}.
+    sample_rate, data = wavio.open_memmap(capture_file, mode='r')
+    pipeline = pipeline or SamplePipeline(sample_rate)
+    takes = {}
+    measurements = {}
+    for note, start, end in find_takes(data, sample_rate, schedule, latency, onset_db=pipeline.onset_db,
+                                       offset_db=pipeline.offset_db):
+        take, analysis = pipeline.process(data[start:end])
+        takes[note] = write_sample(take_file(note), take, sample_rate, encoding, dither)
+        measurements[takes[note]] = (analysis.loudness, gain_to_db(analysis.gain))
+    del data
+    record_loudness(measurements)
+    return takes
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+MANIFEST_FILENAME = "session.jsonl"
+
+
+class SessionState:
+    def __init__(self):
+        self.recorded_samples = {}
+        self.next_note = None
+        self.settings = {}
+        self.events = 0
+
+
+class SessionManifest:
+    # Append-only JSON-lines log of every record/keep/discard/skip decision, fsynced per event, so a
+    # crashed or closed session can be rebuilt and resumed from the note it stopped on. A compile ends
+    # the session: takes kept before it are already in that SFZ and are not carried into the next one.
+    def __init__(self, output_dir, filename=MANIFEST_FILENAME):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, filename)
+
+    def append(self, event, **fields):
+        record = dict(event=event, time=time.time(), **fields)
+        if 'file' in record and record['file']:
+            record['file'] = os.path.basename(record['file'])
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self):
+        state = SessionState()
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return state
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash can leave a torn last line
+                continue
+            state.events += 1
+            event = record.get('event')
+            note = record.get('note')
+            file = record.get('file')
+            path = os.path.join(self.output_dir, file) if file else None
+            if event == 'start':
+                state.settings = record.get('settings', {})
+            elif event == 'keep' and path:
+                takes = state.recorded_samples.setdefault(note, [])
+                if path not in takes:
+                    takes.append(path)
+            elif event == 'discard' and path:
+                takes = state.recorded_samples.get(note, [])
+                if path in takes:
+                    takes.remove(path)
+            elif event == 'compile':
+                state.recorded_samples = {}
+                state.next_note = None
+            if 'next' in record:
+                state.next_note = record['next']
+        # Only keep takes that are still on disk
+        state.recorded_samples = {note: [p for p in takes if os.path.exists(p)]
+                                  for note, takes in state.recorded_samples.items()}
+        state.recorded_samples = {note: takes for note, takes in state.recorded_samples.items() if takes}
+        return state
@@ -1,45 +1,189 @@
+import hashlib
+import json
 import os
+from functools import partial
 
-class SFZGenerator:
-    def __init__(self):
-        self.note_to_midi = {
-            'C': 0, 'C#': 1, 'D': 2, 'D#': 3, 'E': 4, 'F': 5,
-            'F#': 6, 'G': 7, 'G#': 8, 'A': 9, 'A#': 10, 'B': 11
-        }
+import numpy as np
 
-    def note_to_midi_number(self, note):
-        note_name = note[:-1]
-        octave = int(note[-1])
-        return 12 * octave + self.note_to_midi[note_name]
+from library import channel_number, sample_loudness
+from tuning import note_to_midi
+from keymap import merge_region_opcodes, note_key_ranges, velocity_layers
+
+BUFFER_SIZE = 1 << 16
+# Bump when render_group/render_note output changes for the same inputs, so indexed blocks are re-rendered
+INDEX_VERSION = 2
 
-    def generate_sfz(self, samples, output_file, sample_dir, sfz_params=None):
-        sfz_params = sfz_params or {
+class SFZGenerator:
+    def __init__(self):
+        self.default_params = {
             'ampeg_attack': 0.000,
             'ampeg_release': 0.01,
             'ampeg_sustain': 100,
             'amp_veltrack': 100,
             'loop_mode': 'no_loop',
             'loop_start': 0,
-            'loop_end': 0
+            'loop_end': 0,
+            'channel_layout': 'pan_cycle',
+            'pan_width': 60,
+            'key_spread': False,
+            'max_stretch': None,
+            'velocity_layers': 0
         }
-        sfz_content = "<group>\n"
-        sfz_content += f" ampeg_attack={sfz_params['ampeg_attack']:.3f}\n"
-        sfz_content += f" ampeg_release={sfz_params['ampeg_release']:.3f}\n"
-        sfz_content += f" ampeg_sustain={sfz_params['ampeg_sustain']:.1f}\n"
-        sfz_content += f" amp_veltrack={sfz_params['amp_veltrack']:.1f}\n"
-        sfz_content += f" loop_mode={sfz_params['loop_mode']}\n"
-        if sfz_params['loop_mode'] in ['loop_continuous', 'loop_sustain']:
-            sfz_content += f" loop_start={sfz_params['loop_start']}\n"
-            sfz_content += f" loop_end={sfz_params['loop_end']}\n"
-        sfz_content += "\n"
-        pan_values = [-30, -15, 15, 30]
-        for note, sample_list in samples.items():
-            midi_note = self.note_to_midi_number(note)
-            for i, sample_path in enumerate(sample_list):
+        self.pan_values = [-30, -15, 15, 30]
+        self.channel_layouts = ['pan_cycle', 'stereo_spread', 'round_robin']
+
+    def note_to_midi_number(self, note):
+        return note_to_midi(note)
+
+    def render_group(self, sfz_params):
+        lines = ["<group>\n"]
+        lines.append(f" ampeg_attack={sfz_params['ampeg_attack']:.3f}\n")
+        lines.append(f" ampeg_release={sfz_params['ampeg_release']:.3f}\n")
+        lines.append(f" ampeg_sustain={sfz_params['ampeg_sustain']:.1f}\n")
+        lines.append(f" amp_veltrack={sfz_params['amp_veltrack']:.1f}\n")
+        lines.append(f" loop_mode={sfz_params['loop_mode']}\n")
+        if sfz_params['loop_mode'] in ['loop_continuous', 'loop_sustain'] and not sfz_params.get('loop_auto'):
+            lines.append(f" loop_start={sfz_params['loop_start']}\n")
+            lines.append(f" loop_end={sfz_params['loop_end']}\n")
+        lines.append("\n")
+        return "".join(lines)
+
+    def layout_opcodes(self, sample_list, layout='pan_cycle', pan_width=60):
+        # Per-region placement: cycle pan_values, spread the input channels evenly across the stereo
+        # field, or alternate the regions as round robins
+        if layout == 'round_robin':
+            return [{'pan': 0, 'seq_length': len(sample_list), 'seq_position': i + 1} for i in range(len(sample_list))]
+        if layout == 'stereo_spread':
+            channels = [channel_number(path) for path in sample_list]
+            if all(channels):
+                positions, count = [channel - 1 for channel in channels], max(channels)
+            else:
+                positions, count = list(range(len(sample_list))), len(sample_list)
+            if count < 2:
+                return [{'pan': 0} for _ in sample_list]
+            return [{'pan': round(pan_width * (2 * position / (count - 1) - 1))} for position in positions]
+        placements = [{'pan': pan} for pan in self.pan_values]
+        return [placements[i % len(placements)] for i in range(len(sample_list))]
+
+    def layer_opcodes(self, samples, layers):
+        # lovel/hivel bands (and round robins within a band) from the loudness measured when each take
+        # was processed. Unmeasured takes count as the note's median; notes with no measurements stay whole.
+        loudness = sample_loudness([path for sample_list in samples.values() for path in sample_list])
+        opcodes = {}
+        for sample_list in samples.values():
+            measured = [loudness[path] for path in sample_list if path in loudness]
+            if not measured:
+                continue
+            median = float(np.median(measured))
+            opcodes.update(velocity_layers([(path, loudness.get(path, median)) for path in sample_list], layers))
+        return opcodes
+
+    def render_note(self, note, sample_list, region_opcodes=None, layout='pan_cycle', pan_width=60, key_range=None):
+        # key_range (lokey, hikey) spreads the note over neighbouring keys around its own pitch
+        midi_note = self.note_to_midi_number(note)
+        if key_range and key_range != (midi_note, midi_note):
+            keys = f"lokey={key_range[0]} hikey={key_range[1]} pitch_keycenter={midi_note}"
+        else:
+            keys = f"key={midi_note}"
+        region_opcodes = region_opcodes or {}
+        lines = []
+        # Layouts share placement dicts between regions, so each one is formatted once per note
+        placement_text = {}
+        for sample_path, placement in zip(sample_list, self.layout_opcodes(sample_list, layout, pan_width)):
+            overrides = region_opcodes and region_opcodes.get(sample_path)
+            if overrides:
+                opcodes = dict(placement, **overrides)
+                sample_name = opcodes.pop('sample', os.path.basename(sample_path))
+                extra = "".join([f" {opcode}={value}" for opcode, value in opcodes.items()])
+            else:
                 sample_name = os.path.basename(sample_path)
-                pan = pan_values[i % len(pan_values)]
-                sfz_content += f"<region> sample={sample_name} key={midi_note} pan={pan}\n"
-            sfz_content += "\n"
+                extra = placement_text.get(id(placement))
+                if extra is None:
+                    extra = placement_text[id(placement)] = "".join([f" {opcode}={value}" for opcode, value in placement.items()])
+            lines.append(f"<region> sample={sample_name} {keys}{extra}\n")
+        lines.append("\n")
+        return "".join(lines)
+
+    def iter_blocks(self, samples, sfz_params, region_opcodes=None):
+        # Yields (key, digest of the block's inputs, render) so unchanged blocks need not be rendered
+        yield "<group>", input_digest(sfz_params), lambda: self.render_group(sfz_params)
+        layout = sfz_params.get('channel_layout', 'pan_cycle')
+        pan_width = sfz_params.get('pan_width', 60)
+        key_ranges = {}
+        if sfz_params.get('key_spread'):
+            key_ranges = note_key_ranges({note: self.note_to_midi_number(note) for note, sample_list in samples.items() if sample_list},
+                                         sfz_params.get('max_stretch'))
+        if sfz_params.get('velocity_layers'):
+            region_opcodes = merge_region_opcodes(self.layer_opcodes(samples, sfz_params['velocity_layers']), region_opcodes)
+        opcodes = region_opcodes or {}
+        for note, sample_list in samples.items():
+            key_range = key_ranges.get(note)
+            overrides = [opcodes.get(path) for path in sample_list] if opcodes else None
+            digest = input_digest([note, sample_list, overrides, layout, pan_width, key_range, self.pan_values])
+            yield note, digest, partial(self.render_note, note, sample_list, region_opcodes, layout, pan_width, key_range)
+
+    def generate_sfz(self, samples, output_file, sample_dir, sfz_params=None, incremental=False, region_opcodes=None):
+        # region_opcodes maps a sample path to extra opcodes for its <region>, e.g. per-sample loop points;
+        # a 'sample' entry replaces the file name
+        sfz_params = sfz_params or self.default_params
+        return self.write_blocks(self.iter_blocks(samples, sfz_params, region_opcodes), output_file, incremental)
+
+    def index_path(self, output_file):
+        return output_file + ".index"
+
+    def load_index(self, output_file):
+        # The index is only trusted if the .sfz on disk is exactly the file it describes
+        try:
+            with open(self.index_path(output_file)) as f:
+                index = json.load(f)
+            stat = os.stat(output_file)
+            if index.get('version') != INDEX_VERSION:
+                return []
+            if stat.st_size != index['size'] or stat.st_mtime_ns != index['mtime_ns']:
+                return []
+            return index['blocks']
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def write_blocks(self, blocks, output_file, incremental=False):
+        # Streams each block to a buffered handle. In incremental mode, leading blocks whose inputs match
+        # the previous index are neither rendered nor rewritten; the file is only rewritten from the first
+        # changed block. Returns False if the file was already up to date.
+        previous = self.load_index(output_file) if incremental else []
+        index = []
+        offset = 0
+        f = None
+        try:
+            for key, digest, render in blocks:
+                position = len(index)
+                if f is None and position < len(previous) and previous[position][:2] == [key, digest]:
+                    length = previous[position][3]
+                    index.append([key, digest, offset, length])
+                    offset += length
+                    continue
+                data = render().encode('utf-8')
+                index.append([key, digest, offset, len(data)])
+                if f is None:
+                    f = open(output_file, 'r+b' if offset else 'wb', buffering=BUFFER_SIZE)
+                    f.seek(offset)
+                    f.truncate()
+                f.write(data)
+                offset += len(data)
+            if f is None:
+                if len(index) == len(previous):
+                    return False
+                f = open(output_file, 'r+b' if offset else 'wb', buffering=BUFFER_SIZE)
+                f.truncate(offset)
+        finally:
+            if f is not None:
+                f.close()
+        stat = os.stat(output_file)
+        tmp_index = self.index_path(output_file) + ".tmp"
+        with open(tmp_index, 'w') as idx:
+            json.dump({'version': INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'blocks': index}, idx)
+        os.replace(tmp_index, self.index_path(output_file))
+        return True
+
 
-        with open(output_file, 'w') as f:
-            f.write(sfz_content)
+def input_digest(inputs):
+    return hashlib.blake2b(json.dumps(inputs, default=str).encode('utf-8'), digest_size=16).hexdigest()
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import fake_sounddevice
+import wavio
+from audio import AudioManager
+from devices import DeviceRegistry
+from encoding import read_sample
+from engine import AudioEngine
+from fake_sounddevice import FakeBackend
+
+
+def tone(frame, frames, channels, sample_rate):
+    t = (frame + np.arange(frames)) / sample_rate
+    return np.repeat((0.4 * np.sin(2 * np.pi * 220 * t) * (t >= 0.05))[:, np.newaxis], channels, axis=1)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = AudioManager(48000, engine=AudioEngine(FakeBackend(source=tone, speed=0)),
+                           devices=DeviceRegistry(fake_sounddevice, cache_path=str(tmp_path / "devices.json")))
+    yield manager
+    manager.work_queue.close()
+    manager.engine.close()
+
+
+def test_streamed_take_is_reported_captured_before_processing(manager, tmp_path):
+    manager.stream_to_disk_after = 0.5
+    manager.output_encoding = 'pcm24'
+    gate = threading.Event()
+    finish = manager.finish_streamed_recording
+    captured = threading.Event()
+
+    def slow_finish(path):
+        # Processing cannot finish until the test has seen on_captured
+        assert gate.wait(10)
+        return finish(path)
+
+    manager.finish_streamed_recording = slow_finish
+    path = str(tmp_path / "C4_1.wav")
+    events = []
+    done = threading.Event()
+    manager.record_audio(1.0, path, on_done=lambda paths: (events.append(('saved', paths)), done.set()),
+                         on_captured=lambda paths: (events.append(('captured', paths)), captured.set()))
+    assert captured.wait(10)
+    assert events == [('captured', [path])]
+    gate.set()
+    assert done.wait(10)
+    assert events[1] == ('saved', [path])
+
+
+def test_streamed_multichannel_take_matches_in_memory_processing(manager, tmp_path):
+    t = np.arange(48000) / 48000
+    take = np.stack([0.2 * np.sin(2 * np.pi * 220 * t) * (t >= 0.1), 0.5 * np.sin(2 * np.pi * 330 * t) * (t < 0.8)], axis=1)
+    take = take.astype(np.float32)
+    capture_file = str(tmp_path / "streamed" / "C4_1.wav")
+    (tmp_path / "streamed").mkdir()
+    with wavio.WavWriter(capture_file, 48000, 2) as writer:
+        writer.write(take)
+    (tmp_path / "memory").mkdir()
+    expected = manager.save_channels(take, str(tmp_path / "memory" / "C4_1.wav"))
+    saved = manager.finish_streamed_recording(capture_file)
+    assert [os.path.basename(path) for path in saved] == [os.path.basename(path) for path in expected]
+    assert not os.path.exists(capture_file)
+    for streamed, in_memory in zip(saved, expected):
+        np.testing.assert_allclose(read_sample(streamed)[1], read_sample(in_memory)[1], atol=1e-6)
+
+
+def test_runthrough_removes_its_capture_once_sliced(manager, tmp_path):
+    capture_file = str(tmp_path / "runthrough_C4-D4.wav")
+    results = []
+    done = threading.Event()
+    manager.record_runthrough(['C4', 'D4'], capture_file, lambda note: str(tmp_path / f"{note}_1.wav"), guide_s=0.2, sing_s=0.3,
+                              gap_s=0.1, on_done=lambda takes: (results.append(takes), done.set()))
+    assert done.wait(10)
+    assert sorted(results[0]) == ['C4', 'D4']
+    assert all(os.path.exists(path) for path in results[0].values())
+    assert not os.path.exists(capture_file)
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from batch import BatchBuilder
+from encoding import convert_library, read_sample, write_sample
+from library import scan_samples
+
+
+def test_in_place_flac_build_replaces_the_wav_takes(tmp_path):
+    sample_rate = 48000
+    t = np.arange(sample_rate // 2) / sample_rate
+    for note in ('C4', 'D4'):
+        for take in (1, 2):
+            write_sample(str(tmp_path / f"{note}_{take}.wav"), 0.3 * np.sin(2 * np.pi * 300 * t), sample_rate, 'pcm24')
+    output_sfz, samples = BatchBuilder(str(tmp_path), workers=1, encoding='flac').build()
+    assert sum(len(takes) for takes in samples.values()) == 4
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.wav')]
+    assert sum(len(takes) for takes in scan_samples(str(tmp_path)).values()) == 4
+    assert open(output_sfz).read().count('<region>') == 4
+
+
+def test_in_place_convert_of_float_takes(tmp_path):
+    sample_rate = 48000
+    signal = 0.3 * np.sin(2 * np.pi * 300 * np.arange(sample_rate // 2) / sample_rate)
+    write_sample(str(tmp_path / "C4_1.wav"), signal, sample_rate, 'float32')
+    converted = convert_library({'C4': [str(tmp_path / "C4_1.wav")]}, str(tmp_path), 'pcm24', dither=False, workers=1)
+    assert converted == {'C4': [str(tmp_path / "C4_1.wav")]}
+    assert sorted(os.listdir(tmp_path)) == ["C4_1.wav"]
+    rate, data = read_sample(str(tmp_path / "C4_1.wav"))
+    assert rate == sample_rate and np.allclose(data[:, 0] if data.ndim == 2 else data, signal, atol=1e-6)
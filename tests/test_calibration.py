@@ -0,0 +1,58 @@
+import threading
+
+import numpy as np
+import pytest
+
+from calibration import measure_latency
+from engine import AudioEngine
+from fake_sounddevice import FakeBackend
+from runthrough import build_schedule, find_takes
+
+SAMPLE_RATE = 48000
+BLOCKSIZE = 512
+
+
+def loopback_latency(latency):
+    # Runs the calibration on a simulated cable from output to input with `latency` frames of delay
+    engine = AudioEngine(FakeBackend(speed=0, loopback_latency=latency), blocksize=BLOCKSIZE)
+    result = {}
+    done = threading.Event()
+
+    def measured(frames):
+        result['frames'] = frames
+        done.set()
+
+    try:
+        measure_latency(engine, SAMPLE_RATE, on_done=measured)
+        assert done.wait(30)
+    finally:
+        engine.close()
+    return result['frames']
+
+
+@pytest.mark.parametrize('latency', [BLOCKSIZE, 1000, 4800 + 37])
+def test_measure_latency_on_simulated_loopback(latency):
+    frames = loopback_latency(latency)
+    assert frames is not None
+    assert frames == latency
+
+
+def test_runthrough_slices_at_the_measured_offset():
+    # A singer who sings exactly on every cue, heard `latency` frames late. The gap between notes is
+    # shorter than the latency, so only windows shifted by the measured latency hold whole takes.
+    latency = 4800 + 37
+    measured = loopback_latency(latency)
+    schedule, frames = build_schedule(['C4', 'D4', 'E4'], SAMPLE_RATE, guide_s=0.5, sing_s=1.0, gap_s=0.05)
+    capture = np.zeros(frames + latency, dtype=np.float32)
+    sing_frames = int(1.0 * SAMPLE_RATE)
+    for i, (note, cue, sing, end) in enumerate(schedule):
+        t = np.arange(sing_frames) / SAMPLE_RATE
+        capture[sing + latency:sing + latency + sing_frames] = 0.5 * np.sin(2 * np.pi * (262 + 30 * i) * t)
+    takes = find_takes(capture, SAMPLE_RATE, schedule, measured)
+    assert [note for note, _, _ in takes] == ['C4', 'D4', 'E4']
+    tolerance = int(SAMPLE_RATE * 0.005)
+    for (note, start, end), (_, _, sing, _) in zip(takes, schedule):
+        assert sing + latency - tolerance <= start <= sing + latency
+        assert end >= sing + latency + sing_frames - tolerance
+    unaligned = find_takes(capture, SAMPLE_RATE, schedule, 0)
+    assert any(end < sing + latency + sing_frames - tolerance for (_, _, end), (_, _, sing, _) in zip(unaligned, schedule))
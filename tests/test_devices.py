@@ -0,0 +1,62 @@
+import fake_sounddevice
+from devices import DeviceRegistry, TEST_RATES
+
+
+def counting_checks(monkeypatch):
+    checks = []
+    check_settings = fake_sounddevice.check_settings
+
+    def counted(kind, device, channels, samplerate):
+        checks.append((kind, device, samplerate))
+        return check_settings(kind, device, channels, samplerate)
+    monkeypatch.setattr(fake_sounddevice, 'check_settings', counted)
+    return checks
+
+
+def test_probed_rates_are_loaded_from_the_cache(tmp_path, monkeypatch):
+    checks = counting_checks(monkeypatch)
+    cache_path = str(tmp_path / "devices.json")
+    registry = DeviceRegistry(fake_sounddevice, cache_path=cache_path)
+    assert registry.supported_rates(0, 'input', 1) == [44100, 48000, 96000]
+    assert len(checks) == len(TEST_RATES)
+    assert registry.supported_rates(0, 'input', 1) == [44100, 48000, 96000]
+    assert registry.supports(0, 'input', 48000, 1) and not registry.supports(0, 'input', 22050, 1)
+    assert len(checks) == len(TEST_RATES)
+    # A new session with the same hardware reads the probes back instead of re-checking
+    restarted = DeviceRegistry(fake_sounddevice, cache_path=cache_path)
+    assert restarted.supported_rates(0, 'input', 1) == [44100, 48000, 96000]
+    assert len(checks) == len(TEST_RATES)
+    restarted.supported_rates(0, 'input', 2)
+    assert len(checks) == 2 * len(TEST_RATES)
+
+
+def test_latency_is_kept_per_device_pair_and_rate(tmp_path):
+    cache_path = str(tmp_path / "devices.json")
+    DeviceRegistry(fake_sounddevice, cache_path=cache_path).set_latency(2, 2, 48000, 1234)
+    registry = DeviceRegistry(fake_sounddevice, cache_path=cache_path)
+    assert registry.latency(2, 2, 48000) == 1234
+    assert registry.latency(2, 2, 44100) is None and registry.latency(0, 1, 48000) is None
+
+
+def test_enumeration_is_cached_until_invalidated(tmp_path, monkeypatch):
+    monkeypatch.setattr(fake_sounddevice, 'DEVICES', list(fake_sounddevice.DEVICES))
+    queries = []
+    query_devices = fake_sounddevice.query_devices
+
+    def counted(device=None, kind=None):
+        if device is None and kind is None:
+            queries.append(True)
+        return query_devices(device, kind)
+    monkeypatch.setattr(fake_sounddevice, 'query_devices', counted)
+    registry = DeviceRegistry(fake_sounddevice, cache_path=str(tmp_path / "devices.json"))
+    assert registry.input_names() == ['Simulated Microphone', 'Simulated Interface']
+    assert registry.index('Simulated Speakers', 'output') == 1 and registry.index('Simulated Speakers', 'input') is None
+    assert registry.default_output_name() == 'Simulated Speakers'
+    registry.output_names()
+    assert len(queries) == 1
+    fake_sounddevice.DEVICES.append({'name': 'USB Headset', 'hostapi': 0, 'max_input_channels': 1, 'max_output_channels': 2,
+                                     'default_samplerate': 48000.0})
+    assert 'USB Headset' not in registry.input_names()
+    registry.invalidate()
+    assert registry.index('USB Headset', 'input') == 3
+    assert len(queries) == 2
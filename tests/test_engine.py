@@ -0,0 +1,101 @@
+import os
+import threading
+
+import numpy as np
+
+from engine import AudioEngine, TkDispatcher
+from fake_sounddevice import FakeBackend
+
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+    def run_once(self):
+        callback = self.scheduled.pop(0)
+        callback()
+
+
+def test_dispatcher_survives_a_failing_callback():
+    root = FakeRoot()
+    dispatcher = TkDispatcher(root)
+    calls = []
+
+    def fail():
+        raise RuntimeError("bad completion")
+
+    dispatcher.post(fail)
+    dispatcher.post(calls.append, 1)
+    root.run_once()
+    dispatcher.post(calls.append, 2)
+    root.run_once()
+    assert calls == [1, 2]
+    assert root.scheduled == [dispatcher.poll]
+
+
+def test_play_and_record_complete_without_blocking():
+    # Headless run of the non-blocking engine: play() and record() return at once and their
+    # completions arrive through dispatch, with every frame played and captured
+    def ramp(frame, frames, channels, samplerate):
+        return np.repeat(np.arange(frame, frame + frames, dtype=np.float32)[:, np.newaxis], channels, axis=1)
+
+    backend = FakeBackend(source=ramp, speed=0, keep_output=True)
+    done = threading.Semaphore(0)
+
+    def dispatch(callback, *args):
+        callback(*args)
+        done.release()
+
+    engine = AudioEngine(backend, dispatch=dispatch, blocksize=256)
+    recorded = []
+    try:
+        engine.play(np.full(1000, 0.25, dtype=np.float32), 48000)
+        engine.play(np.full(1000, 0.5, dtype=np.float32), 48000, on_done=lambda: None)
+        engine.record(2000, 48000, on_done=recorded.append)
+        assert done.acquire(timeout=10) and done.acquire(timeout=10)
+    finally:
+        engine.close()
+    played = np.concatenate(backend.played)[:, 0]
+    assert np.count_nonzero(played == 0.5) == 1000
+    assert recorded[0].shape == (2000, 1)
+    assert np.all(np.diff(recorded[0][:, 0]) == 1)
+
+
+def test_callbacks_run_outside_the_engine_lock(tmp_path):
+    # With call_directly, an interrupted playback's on_done runs on the caller's thread; starting the
+    # next playback from it must not deadlock on the engine lock
+    engine = AudioEngine(FakeBackend(speed=1))
+    restarted = []
+
+    def interrupted():
+        engine.play(np.zeros(10, dtype=np.float32), 48000)
+        restarted.append(True)
+
+    worker = threading.Thread(target=lambda: (engine.play(np.zeros(48000, dtype=np.float32), 48000, on_done=interrupted),
+                                              engine.play_record(np.zeros(48000, dtype=np.float32), 48000, 48000)),
+                              daemon=True)
+    try:
+        worker.start()
+        worker.join(10)
+        assert not worker.is_alive()
+        assert restarted == [True]
+    finally:
+        engine.close()
+
+
+def test_cancelled_file_capture_reports_and_removes_its_file(tmp_path):
+    engine = AudioEngine(FakeBackend(speed=1))
+    path = str(tmp_path / "take.wav")
+    results = []
+    done = threading.Event()
+    try:
+        engine.record_to_file(path, 48000 * 60, 48000, on_done=lambda result: (results.append(result), done.set()))
+        engine.record(256, 48000)
+        assert done.wait(10)
+    finally:
+        engine.close()
+    assert results == [None]
+    assert not os.path.exists(path)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from encoding import read_sample, write_sample
+from export import LibraryExporter
+from library import scan_samples
+
+
+def write_library(sample_dir, encoding, sample_rate=48000):
+    t = np.arange(sample_rate // 2) / sample_rate
+    for note, freq in [('C4', 261.63), ('A4', 440.0)]:
+        for take in (1, 2):
+            write_sample(str(sample_dir / f"{note}_{take}.wav"), 0.3 * take * np.sin(2 * np.pi * freq * t), sample_rate, encoding)
+
+
+def test_export_pcm24_source(tmp_path):
+    (tmp_path / 'src').mkdir()
+    write_library(tmp_path / 'src', 'pcm24')
+    exporter = LibraryExporter(str(tmp_path / 'out'), [(44100, 'pcm16'), (96000, 'pcm24')], workers=1)
+    written_sfz, written = exporter.build(str(tmp_path / 'src'))
+    assert written == 8
+    assert [name for name, _ in written_sfz] == ['44.1k_pcm16', '96k_pcm24']
+    sample_rate, data = read_sample(str(tmp_path / 'out' / '96k_pcm24' / 'A4_2.wav'))
+    assert sample_rate == 96000 and len(data) == 48000
+    sfz = open(tmp_path / 'out' / '44.1k_pcm16' / 'choir.sfz').read()
+    assert sfz.count('<region>') == 4
+
+
+def test_export_skips_unchanged_takes(tmp_path):
+    (tmp_path / 'src').mkdir()
+    write_library(tmp_path / 'src', 'float32')
+    exporter = LibraryExporter(str(tmp_path / 'out'), [(44100, 'pcm16')], workers=1)
+    assert exporter.build(str(tmp_path / 'src'))[1] == 4
+    assert exporter.build(str(tmp_path / 'src'))[1] == 0
+    write_library(tmp_path / 'src', 'pcm24')
+    variants, written = exporter.export(scan_samples(str(tmp_path / 'src')))
+    assert written == 4
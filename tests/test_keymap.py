@@ -0,0 +1,52 @@
+import numpy as np
+
+from keymap import key_ranges, note_key_ranges, velocity_layers
+
+
+def test_key_ranges_split_between_recorded_keys():
+    lokey, hikey = key_ranges([60, 64, 67])
+    assert lokey.tolist() == [0, 63, 66]
+    assert hikey.tolist() == [62, 65, 127]
+
+
+def test_key_ranges_ties_go_to_the_lower_note():
+    # 62 is as close to 60 as to 64
+    lokey, hikey = key_ranges([64, 60, 64])
+    assert lokey.tolist() == [0, 63] and hikey.tolist() == [62, 127]
+
+
+def test_max_stretch_clips_each_range():
+    lokey, hikey = key_ranges([60, 72], max_stretch=2)
+    assert lokey.tolist() == [58, 70] and hikey.tolist() == [62, 74]
+    lokey, hikey = key_ranges([60], max_stretch=0)
+    assert lokey.tolist() == [60] and hikey.tolist() == [60]
+
+
+def test_note_key_ranges_by_name():
+    assert note_key_ranges({'C4': 60, 'D4': 62}) == {'C4': (0, 61), 'D4': (62, 127)}
+    assert key_ranges([])[0].dtype == np.int64
+
+
+def test_velocity_layer_band_edges():
+    loudness = [(f"take{i}.wav", level) for i, level in enumerate([-12.0, -30.0, -6.0, -20.0])]
+    opcodes = velocity_layers(loudness, 3)
+    # Quietest first; the lowest band takes the spare take: take1 + take3, then take0, then take2
+    assert [(opcodes[f"take{i}.wav"]['lovel'], opcodes[f"take{i}.wav"]['hivel']) for i in range(4)] == [(43, 84), (1, 42), (85, 127), (1, 42)]
+    bands = sorted({(o['lovel'], o['hivel']) for o in opcodes.values()})
+    assert bands[0][0] == 1 and bands[-1][1] == 127
+    assert all(hi + 1 == next_lo for (_, hi), (next_lo, _) in zip(bands, bands[1:]))
+
+
+def test_velocity_layers_round_robin_positions():
+    loudness = [('a.wav', -30.0), ('b.wav', -10.0), ('c.wav', -30.5)]
+    opcodes = velocity_layers(loudness, 2)
+    assert opcodes['b.wav'] == {'lovel': 64, 'hivel': 127, 'seq_length': 1, 'seq_position': 1}
+    # Takes sharing a band keep their recording order as round robins
+    assert (opcodes['a.wav']['seq_position'], opcodes['c.wav']['seq_position']) == (1, 2)
+    assert opcodes['a.wav']['seq_length'] == opcodes['c.wav']['seq_length'] == 2
+
+
+def test_more_layers_than_takes():
+    opcodes = velocity_layers([('a.wav', -10.0), ('b.wav', -20.0)], 4)
+    assert opcodes['b.wav']['hivel'] == 63 and opcodes['a.wav']['lovel'] == 64
+    assert velocity_layers([], 3) == {} and velocity_layers([('a.wav', -10.0)], 0) == {}
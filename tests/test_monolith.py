@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+
+import wavio
+from encoding import read_sample, write_sample
+from monolith import Monolith
+
+
+def write_take(path, frames, value):
+    write_sample(str(path), np.full(frames, value, dtype=np.float32), 48000)
+    return str(path)
+
+
+def take_data(monolith_file, entry):
+    _, data = wavio.open_memmap(monolith_file, mode='r')
+    return np.array(data[entry['offset']:entry['offset'] + entry['frames'], 0])
+
+
+def test_build_lays_takes_out_with_slack(tmp_path):
+    samples = {'C4': [write_take(tmp_path / 'C4_1.wav', 100, 0.1)], 'D4': [write_take(tmp_path / 'D4_1.wav', 200, 0.2)]}
+    monolith = Monolith(str(tmp_path / 'choir.wav'), slack=0.5)
+    monolith.build(samples)
+    takes = monolith.index['takes']
+    assert (takes['C4_1.wav']['offset'], takes['C4_1.wav']['capacity']) == (0, 150)
+    assert (takes['D4_1.wav']['offset'], takes['D4_1.wav']['capacity']) == (150, 300)
+    assert np.all(take_data(monolith.monolith_file, takes['D4_1.wav']) == np.float32(0.2))
+    opcodes = monolith.region_opcodes(samples, {samples['D4'][0]: {'loop_start': 10, 'loop_end': 90}})
+    assert opcodes[samples['D4'][0]] == {'sample': 'choir.wav', 'offset': 150, 'end': 349, 'loop_start': 160, 'loop_end': 240}
+
+
+def test_update_rewrites_in_place_or_appends(tmp_path):
+    samples = {'C4': [write_take(tmp_path / 'C4_1.wav', 100, 0.1)], 'D4': [write_take(tmp_path / 'D4_1.wav', 200, 0.2)]}
+    monolith_file = str(tmp_path / 'choir.wav')
+    assert Monolith(monolith_file, slack=0.5).update(samples) == 2
+    assert Monolith(monolith_file, slack=0.5).update(samples) == 0
+
+    # Still fits its slot: rewritten where it was, the tail of the slot zeroed
+    write_take(tmp_path / 'C4_1.wav', 120, 0.3)
+    monolith = Monolith(monolith_file, slack=0.5)
+    assert monolith.update(samples) == 1
+    entry = monolith.index['takes']['C4_1.wav']
+    assert (entry['offset'], entry['frames'], entry['capacity']) == (0, 120, 150)
+    _, data = read_sample(monolith_file)
+    assert np.all(data[120:150] == 0)
+
+    # Outgrew it: appended after everything else
+    write_take(tmp_path / 'D4_1.wav', 400, 0.4)
+    monolith = Monolith(monolith_file, slack=0.5)
+    assert monolith.update(samples) == 1
+    entry = monolith.index['takes']['D4_1.wav']
+    assert (entry['offset'], entry['frames'], entry['capacity']) == (450, 400, 600)
+    assert wavio.read_layout(monolith_file)[5] == 1050
+    assert np.all(take_data(monolith_file, entry) == np.float32(0.4))
+    assert np.all(take_data(monolith_file, monolith.index['takes']['C4_1.wav']) == np.float32(0.3))
+
+
+def test_update_drops_deleted_takes_from_the_index(tmp_path):
+    samples = {'C4': [write_take(tmp_path / 'C4_1.wav', 100, 0.1), write_take(tmp_path / 'C4_2.wav', 100, 0.2)]}
+    monolith_file = str(tmp_path / 'choir.wav')
+    Monolith(monolith_file).update(samples)
+    os.remove(samples['C4'].pop())
+    monolith = Monolith(monolith_file)
+    assert monolith.update(samples) == 0
+    assert list(monolith.index['takes']) == ['C4_1.wav']
@@ -0,0 +1,47 @@
+import numpy as np
+
+from encoding import write_sample
+from preview import PreviewCache
+
+
+def write_take(path, frames):
+    write_sample(str(path), np.zeros(frames, dtype=np.float32), 48000)
+    return str(path)
+
+
+def test_least_recently_used_take_is_evicted(tmp_path):
+    # Room for two 1000-frame float32 takes
+    cache = PreviewCache(max_bytes=8000)
+    a, b, c = (write_take(tmp_path / f"{name}.wav", 1000) for name in 'abc')
+    cache.get(a)
+    cache.get(b)
+    cache.get(a)
+    cache.get(c)
+    assert list(cache.buffers) == [a, c]
+    assert cache.size == 8000
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_put_reuses_the_recorded_buffer_and_replaces_stale_entries(tmp_path):
+    cache = PreviewCache(max_bytes=8000)
+    a = write_take(tmp_path / "a.wav", 1000)
+    recorded = np.full(1000, 0.5, dtype=np.float32)
+    cache.put(a, 48000, recorded)
+    sample_rate, data = cache.get(a)
+    assert sample_rate == 48000 and np.all(data == 0.5) and not data.flags.writeable
+    assert (cache.hits, cache.misses) == (1, 0)
+    # Re-recorded on disk: the size changes, so the cached buffer is dropped and the file decoded
+    write_take(tmp_path / "a.wav", 500)
+    _, data = cache.get(a)
+    assert len(data) == 500 and np.all(data == 0)
+    assert cache.size == 2000
+
+
+def test_a_take_larger_than_the_cache_is_still_kept_alone(tmp_path):
+    cache = PreviewCache(max_bytes=1000)
+    a, b = write_take(tmp_path / "a.wav", 1000), write_take(tmp_path / "b.wav", 1000)
+    cache.get(a)
+    cache.get(b)
+    assert list(cache.buffers) == [b]
+    cache.discard(b)
+    assert cache.size == 0 and not cache.buffers
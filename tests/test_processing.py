@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from processing import SamplePipeline, db_to_gain
+
+
+def sung_take(sample_rate=48000, seconds=1.0, dc=0.02, channels=1):
+    rng = np.random.default_rng(1)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    voice = 0.3 * np.sin(2 * np.pi * 220 * t) * ((t > 0.25) & (t < 0.8))
+    take = voice[:, np.newaxis] * np.linspace(1.0, 0.5, channels) + rng.normal(0, 1e-4, (len(t), channels)) + dc
+    return take.astype(np.float32)
+
+
+def reference(pipeline, take):
+    # The steps one at a time on the whole take: block-RMS trim, DC removal, peak gain, fades
+    data = take.astype(np.float64)
+    dc = data.mean(axis=0)
+    centered = data - dc
+    blocks = len(data) // pipeline.block
+    block_rms = np.sqrt(np.square(centered[:blocks * pipeline.block]).reshape(blocks, pipeline.block, -1).mean(axis=(1, 2)))
+    first = np.flatnonzero(block_rms > db_to_gain(pipeline.onset_db))[0]
+    last = np.flatnonzero(block_rms > db_to_gain(pipeline.offset_db))[-1] + 1
+    onset = max(0, first * pipeline.block - pipeline.pre_roll)
+    offset = min(len(data), last * pipeline.block + pipeline.post_roll)
+    trimmed = centered[onset:offset]
+    trimmed = trimmed / np.abs(trimmed).max()
+    frames = len(trimmed)
+    positions = np.arange(frames)
+    envelope = np.minimum(np.minimum(positions / pipeline.fade_in, (frames - 1 - positions) / pipeline.fade_out), 1.0)
+    return onset, offset, trimmed * np.clip(envelope, 0.0, 1.0)[:, np.newaxis]
+
+
+@pytest.mark.parametrize('channels', [1, 2])
+def test_pipeline_matches_the_step_by_step_reference(channels):
+    take = sung_take(channels=channels)
+    pipeline = SamplePipeline(48000, chunk_frames=3000)
+    out, analysis = pipeline.process(take)
+    onset, offset, expected = reference(pipeline, take)
+    assert (analysis.onset, analysis.offset) == (onset, offset)
+    np.testing.assert_allclose(out, expected, atol=1e-4)
+    assert np.abs(out).max() == pytest.approx(1.0, abs=1e-3)
+
+
+def test_chunk_size_does_not_change_the_result():
+    take = sung_take(channels=2)
+    whole, _ = SamplePipeline(48000, chunk_frames=1 << 20).process(take)
+    chunked, _ = SamplePipeline(48000, chunk_frames=960).process(take)
+    np.testing.assert_allclose(whole, chunked, atol=1e-6)
+
+
+def test_rms_target_and_ceiling():
+    take = sung_take()
+    out, analysis = SamplePipeline(48000, target='rms', target_db=-20.0, ceiling_db=-1.0).process(take)
+    assert analysis.gain * analysis.rms == pytest.approx(db_to_gain(-20.0), rel=1e-3)
+    _, loud = SamplePipeline(48000, target='rms', target_db=0.0, ceiling_db=-1.0).process(take)
+    assert loud.gain * loud.peak == pytest.approx(db_to_gain(-1.0), rel=1e-6)
+
+
+def test_silent_take_is_kept_whole():
+    take = np.zeros((4800, 1), dtype=np.float32)
+    out, analysis = SamplePipeline(48000).process(take)
+    assert (analysis.onset, analysis.offset) == (0, 4800)
+    assert np.all(out == 0)
@@ -0,0 +1,51 @@
+from session import SessionManifest
+
+
+def take(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'')
+    return str(path)
+
+
+def test_replay_keeps_and_discards(tmp_path):
+    manifest = SessionManifest(str(tmp_path))
+    manifest.append('start', note='C4', settings={'tuning': 442.0})
+    manifest.append('keep', note='C4', file=take(tmp_path, 'C4_1.wav'), next='D4')
+    manifest.append('keep', note='D4', file=take(tmp_path, 'D4_1.wav'), next='E4')
+    manifest.append('discard', note='D4', file=str(tmp_path / 'D4_1.wav'), next='D4')
+    manifest.append('keep', note='D4', file=take(tmp_path, 'D4_2.wav'), next='E4')
+    state = SessionManifest(str(tmp_path)).replay()
+    assert state.recorded_samples == {'C4': [str(tmp_path / 'C4_1.wav')], 'D4': [str(tmp_path / 'D4_2.wav')]}
+    assert state.next_note == 'E4'
+    assert state.settings == {'tuning': 442.0}
+    assert state.events == 5
+
+
+def test_replay_starts_fresh_after_compile(tmp_path):
+    manifest = SessionManifest(str(tmp_path))
+    manifest.append('keep', note='C4', file=take(tmp_path, 'C4_1.wav'), next='D4')
+    manifest.append('compile', file=str(tmp_path / 'choir.sfz'))
+    state = manifest.replay()
+    assert state.recorded_samples == {} and state.next_note is None
+    manifest.append('keep', note='E4', file=take(tmp_path, 'E4_1.wav'), next='F4')
+    state = manifest.replay()
+    assert state.recorded_samples == {'E4': [str(tmp_path / 'E4_1.wav')]}
+    assert state.next_note == 'F4'
+
+
+def test_resume_drops_takes_missing_from_disk(tmp_path):
+    manifest = SessionManifest(str(tmp_path))
+    manifest.append('keep', note='C4', file=take(tmp_path, 'C4_1.wav'), next='C4')
+    manifest.append('keep', note='C4', file=str(tmp_path / 'C4_2.wav'), next='D4')
+    manifest.append('keep', note='D4', file=str(tmp_path / 'D4_1.wav'), next='E4')
+    with open(manifest.path, 'a') as f:
+        f.write('{"event": "keep", "note": "E4", "fi')
+    state = manifest.replay()
+    assert state.recorded_samples == {'C4': [str(tmp_path / 'C4_1.wav')]}
+    assert state.next_note == 'E4'
+    assert state.events == 3
+
+
+def test_replay_without_a_manifest(tmp_path):
+    state = SessionManifest(str(tmp_path / 'missing')).replay()
+    assert state.recorded_samples == {} and state.next_note is None and state.events == 0
@@ -0,0 +1,67 @@
+from sfz import SFZGenerator
+
+
+def library():
+    return {'C4': ['C4_1.wav', 'C4_2.wav'], 'D4': ['D4_1.wav'], 'E4': ['E4_1.wav', 'E4_2.wav']}
+
+
+def rendering(generator):
+    # Records which notes render_note is asked for
+    rendered = []
+    render_note = generator.render_note
+
+    def spy(note, *args):
+        rendered.append(note)
+        return render_note(note, *args)
+    generator.render_note = spy
+    return rendered
+
+
+def full_text(samples, path):
+    SFZGenerator().generate_sfz(samples, str(path), str(path.parent))
+    return path.read_text()
+
+
+def test_incremental_skips_unchanged_notes(tmp_path):
+    output_file = tmp_path / 'choir.sfz'
+    generator = SFZGenerator()
+    samples = library()
+    assert generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    rendered = rendering(generator)
+    assert not generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    assert rendered == []
+
+
+def test_incremental_renders_from_the_changed_note(tmp_path):
+    output_file = tmp_path / 'choir.sfz'
+    generator = SFZGenerator()
+    samples = library()
+    generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    rendered = rendering(generator)
+    samples['D4'] = samples['D4'] + ['D4_2.wav']
+    assert generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    assert rendered == ['D4', 'E4']
+    assert output_file.read_text() == full_text(samples, tmp_path / 'full.sfz')
+
+
+def test_incremental_drops_removed_notes(tmp_path):
+    output_file = tmp_path / 'choir.sfz'
+    generator = SFZGenerator()
+    samples = library()
+    generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    rendered = rendering(generator)
+    del samples['E4']
+    assert generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    assert rendered == []
+    assert output_file.read_text() == full_text(samples, tmp_path / 'full.sfz')
+    assert 'E4_1.wav' not in output_file.read_text()
+
+
+def test_incremental_rewrites_a_file_edited_since(tmp_path):
+    output_file = tmp_path / 'choir.sfz'
+    generator = SFZGenerator()
+    samples = library()
+    generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    output_file.write_text("// edited by hand\n")
+    assert generator.generate_sfz(samples, str(output_file), str(tmp_path), incremental=True)
+    assert output_file.read_text() == full_text(samples, tmp_path / 'full.sfz')
@@ -0,0 +1,9 @@
+from benchmark import bench_startup
+
+
+def test_start_screen_builds_before_devices_and_heavy_modules():
+    # Builds the real start screen on the stand-in tkinter in a fresh interpreter; a slow device scan
+    # must not hold up the window
+    result, = bench_startup(repeats=1, scenarios=(('slow scan', 4, 0.3, 0.0),))
+    assert result['heavy_modules_at_start'] == []
+    assert result['window_s'] < result['devices_ready_s'] - 0.25
@@ -0,0 +1,44 @@
+import pytest
+
+from tuning import Tuning, load_scala, note_sequence, note_to_midi
+
+
+def test_scala_cents_and_ratio_lines(tmp_path):
+    scale_file = tmp_path / "mixed.scl"
+    scale_file.write_text("! mixed.scl\n!\nCents and ratios\n 4\n!\n 200.0\n 5/4 major third\n 701.955\n 2\n")
+    description, pitches = load_scala(str(scale_file))
+    assert description == "Cents and ratios"
+    assert pitches == pytest.approx([200.0, 386.3137, 701.955, 1200.0], abs=1e-4)
+
+
+def test_scala_blank_description(tmp_path):
+    scale_file = tmp_path / "blank.scl"
+    scale_file.write_text("! blank.scl\n\n 1\n 2/1\n")
+    assert load_scala(str(scale_file)) == ("", [1200.0])
+
+
+def test_scala_pitch_count_must_match(tmp_path):
+    scale_file = tmp_path / "short.scl"
+    scale_file.write_text("Too few\n 3\n 100.0\n 2/1\n")
+    with pytest.raises(ValueError):
+        load_scala(str(scale_file))
+
+
+def test_flat_names_match_sharps():
+    assert note_to_midi('Db4') == note_to_midi('C#4') == 61
+    assert note_to_midi('Bb-1') == note_to_midi('A#-1') == 10
+    with pytest.raises(ValueError):
+        note_to_midi('Ab9')
+
+
+def test_octaves_follow_midi_numbering():
+    assert note_to_midi('C-1') == 0 and note_to_midi('C4') == 60 and note_to_midi('A4') == 69
+    sequence = note_sequence()
+    assert sequence[0] == 'C2' and sequence[-1] == 'G9'
+    assert len(sequence) == 128 - 36
+
+
+def test_scala_scale_repeats_at_its_period():
+    tuning = Tuning(440.0, scale=[700.0, 1200.0], root=60)
+    assert tuning.frequency('A4') == pytest.approx(440.0)
+    assert tuning.frequency(62) / tuning.frequency(60) == pytest.approx(2.0)
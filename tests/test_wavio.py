@@ -0,0 +1,43 @@
+import numpy as np
+
+import wavio
+from encoding import read_sample
+from processing import SamplePipeline
+
+
+def write_take(path, data, sample_rate=48000):
+    data = np.asarray(data, dtype=np.float32).reshape(len(data), -1)
+    with wavio.WavWriter(str(path), sample_rate, data.shape[1]) as writer:
+        writer.write(data)
+
+
+def test_truncate_and_append(tmp_path):
+    path = tmp_path / "take.wav"
+    frames = np.arange(1000, dtype=np.float32).reshape(500, 2) / 1000
+    write_take(path, frames)
+    wavio.truncate(str(path), 300)
+    sample_rate, data = read_sample(str(path))
+    assert sample_rate == 48000
+    np.testing.assert_array_equal(data, frames[:300])
+    assert wavio.append(str(path), frames[:50]) == 300
+    _, data = read_sample(str(path))
+    np.testing.assert_array_equal(data, np.concatenate((frames[:300], frames[:50])))
+    assert wavio.read_layout(str(path))[5] == 350
+
+
+def test_process_in_place_on_a_memmap(tmp_path):
+    sample_rate = 48000
+    t = np.arange(sample_rate) / sample_rate
+    take = (0.3 * np.sin(2 * np.pi * 220 * t) * ((t > 0.2) & (t < 0.7)) + 0.01).astype(np.float32)
+    path = tmp_path / "take.wav"
+    write_take(path, take)
+    pipeline = SamplePipeline(sample_rate, chunk_frames=4096)
+    expected, expected_analysis = pipeline.process(take[:, np.newaxis])
+    _, mapped = wavio.open_memmap(str(path))
+    analysis = pipeline.process_in_place(mapped)
+    mapped.flush()
+    del mapped
+    wavio.truncate(str(path), analysis.frames)
+    assert (analysis.onset, analysis.offset) == (expected_analysis.onset, expected_analysis.offset)
+    _, data = read_sample(str(path))
+    np.testing.assert_allclose(data, expected[:, 0], atol=1e-6)
@@ -0,0 +1,28 @@
+import threading
+
+from workqueue import WorkQueue
+
+
+def test_when_done_runs_after_the_keyed_job_without_blocking():
+    dispatched = []
+    posted = threading.Event()
+
+    def dispatch(callback, *args):
+        dispatched.append(callback)
+        posted.set()
+
+    queue = WorkQueue(workers=1, dispatch=dispatch)
+    release = threading.Event()
+    finished = []
+    queue.submit(lambda: (release.wait(5), finished.append('take.wav')), key='take.wav')
+    calls = []
+    queue.when_done('take.wav', lambda: calls.append(list(finished)))
+    assert dispatched == []
+    release.set()
+    assert posted.wait(5)
+    for callback in dispatched:
+        callback()
+    assert calls == [['take.wav']]
+    queue.when_done('other.wav', lambda: calls.append('now'))
+    assert calls[-1] == 'now'
+    queue.close()
@@ -0,0 +1,67 @@
+import threading
+from collections import OrderedDict
+
+
+class ToneCache:
+    # Bounded LRU of ready-to-play float32 guide buffers keyed by
+    # (note, tuning, waveform, sample_rate, duration)
+    def __init__(self, render, max_bytes=64 * 1024 * 1024):
+        self.render = render
+        self.max_bytes = max_bytes
+        self.buffers = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.prewarm_thread = None
+        self.prewarm_cancel = threading.Event()
+
+    def get(self, note, tuning, waveform, sample_rate, duration):
+        key = (note, float(tuning), waveform, int(sample_rate), float(duration))
+        with self.lock:
+            audio = self.buffers.get(key)
+            if audio is not None:
+                self.buffers.move_to_end(key)
+                self.hits += 1
+                return audio
+            self.misses += 1
+        audio = self.render(*key)
+        audio.setflags(write=False)
+        self.put(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        with self.lock:
+            if key in self.buffers:
+                return
+            self.buffers[key] = audio
+            self.size += audio.nbytes
+            while self.size > self.max_bytes and len(self.buffers) > 1:
+                _, evicted = self.buffers.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def prewarm(self, notes, tuning, waveform, sample_rate, duration):
+        # Renders every note in a background thread; a new call cancels the previous one
+        self.cancel_prewarm()
+        self.prewarm_cancel = cancel = threading.Event()
+
+        def run():
+            for note in notes:
+                if cancel.is_set():
+                    return
+                try:
+                    self.get(note, tuning, waveform, sample_rate, duration)
+                except Exception:
+                    continue
+
+        self.prewarm_thread = threading.Thread(target=run, name="tone-prewarm", daemon=True)
+        self.prewarm_thread.start()
+        return self.prewarm_thread
+
+    def cancel_prewarm(self):
+        self.prewarm_cancel.set()
+
+    def clear(self):
+        with self.lock:
+            self.buffers.clear()
+            self.size = 0
@@ -0,0 +1,100 @@
+import functools
+
+import numpy as np
+
+NOTE_NAMES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+FLAT_NAMES = {'Db': 'C#', 'Eb': 'D#', 'Gb': 'F#', 'Ab': 'G#', 'Bb': 'A#'}
+A4 = 69
+
+# Standard MIDI numbering: C-1 = 0, C4 = 60, A4 = 69, G9 = 127
+MIDI_NOTES = np.arange(128)
+MIDI_NAMES = [f"{NOTE_NAMES[midi % 12]}{midi // 12 - 1}" for midi in range(128)]
+NAME_TO_MIDI = {name: midi for midi, name in enumerate(MIDI_NAMES)}
+NAME_TO_MIDI.update({f"{flat}{name[len(sharp):]}": NAME_TO_MIDI[name]
+                     for flat, sharp in FLAT_NAMES.items() for name in MIDI_NAMES if name.startswith(sharp)})
+
+# Cents of each pitch class above the root, one octave of 12
+TEMPERAMENTS = {
+    'equal': [100.0 * i for i in range(12)],
+    'pythagorean': [0.0, 90.225, 203.910, 294.135, 407.820, 498.045, 588.270, 701.955, 792.180, 905.865, 996.090, 1109.775],
+    'just': [0.0, 111.731, 203.910, 315.641, 386.314, 498.045, 590.224, 701.955, 813.686, 884.359, 1017.596, 1088.269],
+    'meantone': [0.0, 76.049, 193.157, 310.265, 386.314, 503.422, 579.471, 696.578, 772.627, 889.735, 1006.843, 1082.892],
+    'werckmeister3': [0.0, 90.225, 192.180, 294.135, 390.225, 498.045, 588.270, 696.090, 792.180, 888.270, 996.090, 1092.180],
+}
+
+
+def note_to_midi(note):
+    # 'C#4' / 'Db4' -> 61; MIDI numbers pass through
+    if isinstance(note, (int, np.integer)):
+        return int(note)
+    try:
+        return NAME_TO_MIDI[note]
+    except KeyError:
+        raise ValueError(f"Unknown note name or outside MIDI range: {note}")
+
+
+def note_sequence(first='C2', last='G9'):
+    # Chromatic note names from first to last inclusive, clamped to the MIDI range
+    return MIDI_NAMES[note_to_midi(first):note_to_midi(last) + 1]
+
+
+def parse_scala_pitch(text):
+    # Scala pitch lines hold cents when they contain a '.', otherwise a ratio ('3/2' or '2')
+    value = text.split()[0]
+    if '.' in value:
+        return float(value)
+    numerator, _, denominator = value.partition('/')
+    return 1200.0 * np.log2(int(numerator) / int(denominator or 1))
+
+
+def load_scala(path):
+    # Returns (description, [cents of each degree above the root, ending with the period])
+    with open(path, encoding='latin-1') as f:
+        lines = [line.strip() for line in f if not line.lstrip().startswith('!')]
+    description, count = lines[0], int(lines[1].split()[0])
+    pitches = [parse_scala_pitch(line) for line in lines[2:2 + count]]
+    if len(pitches) != count or count == 0:
+        raise ValueError(f"{path}: expected {count} pitches, found {len(pitches)}")
+    return description, pitches
+
+
+class Tuning:
+    # Precomputed frequency table for all 128 MIDI notes. A temperament gives the cents of each of the
+    # 12 pitch classes above `root`; a Scala scale maps its degrees consecutively from MIDI note `root`
+    # and repeats at its period. Either way A4 sounds at `reference` Hz.
+    def __init__(self, reference=440.0, temperament='equal', root=0, scale=None):
+        self.reference = float(reference)
+        self.temperament = temperament
+        self.root = root
+        if scale is not None:
+            steps = np.concatenate(([0.0], np.asarray(scale[:-1], dtype=np.float64)))
+            octave, degree = np.divmod(MIDI_NOTES - root, len(steps))
+            cents = octave * scale[-1] + steps[degree] + 100.0 * root
+        else:
+            steps = np.asarray(TEMPERAMENTS[temperament], dtype=np.float64)
+            deviation = steps - 100.0 * np.arange(12)
+            cents = 100.0 * MIDI_NOTES + deviation[(MIDI_NOTES - root) % 12]
+        self.frequencies = self.reference * 2.0 ** ((cents - cents[A4]) / 1200.0)
+        self.frequencies.setflags(write=False)
+
+    def frequency(self, note):
+        return float(self.frequencies[note_to_midi(note)])
+
+    def cents(self, note, frequency):
+        # Signed distance of `frequency` from the note's pitch in this tuning
+        return 1200.0 * np.log2(np.asarray(frequency, dtype=np.float64) / self.frequencies[note_to_midi(note)])
+
+
+@functools.lru_cache(maxsize=32)
+def get_tuning(reference=440.0, temperament='equal', root=0, scale_file=None):
+    scale = load_scala(scale_file)[1] if scale_file else None
+    return Tuning(reference, temperament, root, scale)
+
+
+def as_tuning(tuning):
+    # Accepts a Tuning or a plain A4 reference in Hz
+    return tuning if isinstance(tuning, Tuning) else get_tuning(float(tuning))
+
+
+def note_to_frequency(note, tuning=440.0):
+    return as_tuning(tuning).frequency(note)
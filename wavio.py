@@ -0,0 +1,136 @@
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+HEADER_SIZE = 44
+
+
+# encoding -> (format tag, bits per sample)
+WAV_ENCODINGS = {
+    'float32': (WAVE_FORMAT_IEEE_FLOAT, 32),
+    'pcm24': (WAVE_FORMAT_PCM, 24),
+    'pcm16': (WAVE_FORMAT_PCM, 16),
+}
+
+
+def quantize(block, bits, dither=True, rng=None):
+    # Float [-1, 1] -> signed integers, with optional TPDF dither of +/-1 LSB
+    scale = float(2 ** (bits - 1) - 1)
+    scaled = np.asarray(block, dtype=np.float64) * scale
+    if dither:
+        rng = rng or np.random.default_rng()
+        scaled += rng.random(scaled.shape) - rng.random(scaled.shape)
+    return np.clip(np.rint(scaled), -scale - 1, scale).astype(np.int32)
+
+
+def encode_block(block, encoding, dither=True, rng=None):
+    if encoding == 'float32':
+        return np.ascontiguousarray(block, dtype='<f4').tobytes()
+    if encoding == 'pcm16':
+        return quantize(block, 16, dither, rng).astype('<i2').tobytes()
+    if encoding == 'pcm24':
+        # Keep the low three bytes of each little-endian int32
+        samples = quantize(block, 24, dither, rng).astype('<i4').reshape(-1)
+        return samples.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    raise ValueError(f"Unsupported WAV encoding: {encoding}")
+
+
+class WavWriter:
+    # Appends frames to a WAV file as they arrive; the RIFF/data sizes are patched on close
+    def __init__(self, path, sample_rate, channels=1, encoding='float32', dither=True):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.encoding = encoding
+        self.format_tag, self.bits = WAV_ENCODINGS[encoding]
+        self.dither = dither
+        self.rng = np.random.default_rng()
+        self.frames = 0
+        self.file = open(path, 'wb')
+        self.file.write(wav_header(sample_rate, channels, 0, self.format_tag, self.bits))
+
+    def write(self, block):
+        self.file.write(encode_block(block, self.encoding, self.dither, self.rng))
+        self.frames += len(block)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.seek(0)
+        self.file.write(wav_header(self.sample_rate, self.channels, self.frames, self.format_tag, self.bits))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def wav_header(sample_rate, channels, frames, format_tag=WAVE_FORMAT_IEEE_FLOAT, bits=32):
+    block_align = channels * bits // 8
+    data_size = frames * block_align
+    return (b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, format_tag, channels, sample_rate,
+                                    sample_rate * block_align, block_align, bits)
+            + b'data' + struct.pack('<I', data_size))
+
+
+def read_layout(path):
+    # Returns (sample_rate, channels, format_tag, bits, data_offset, frames) by walking the RIFF chunks
+    with open(path, 'rb') as f:
+        riff = f.read(12)
+        if riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError(f"{path} is not a WAV file")
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(size - 16 + (size & 1), 1)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path} has data before fmt")
+                format_tag, channels, sample_rate, _, block_align, bits = fmt
+                return sample_rate, channels, format_tag, bits, f.tell(), size // block_align
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+def open_memmap(path, mode='r+'):
+    sample_rate, channels, format_tag, bits, offset, frames = read_layout(path)
+    if format_tag != WAVE_FORMAT_IEEE_FLOAT or bits != 32:
+        raise ValueError(f"{path} is not a 32-bit float WAV")
+    data = np.memmap(path, dtype='<f4', mode=mode, offset=offset, shape=(frames, channels))
+    return sample_rate, data
+
+
+def truncate(path, frames):
+    # Shrinks a float32 WAV written by WavWriter to `frames` frames and fixes its header
+    sample_rate, channels, format_tag, bits, offset, _ = read_layout(path)
+    with open(path, 'r+b') as f:
+        f.truncate(offset + frames * channels * bits // 8)
+        if offset == HEADER_SIZE:
+            f.seek(0)
+            f.write(wav_header(sample_rate, channels, frames, format_tag, bits))
+        else:
+            f.seek(4)
+            f.write(struct.pack('<I', offset - 8 + frames * channels * bits // 8))
+            f.seek(offset - 4)
+            f.write(struct.pack('<I', frames * channels * bits // 8))
+
+
+def append(path, block):
+    # Appends float32 frames after the existing data chunk; returns the frame offset they start at
+    sample_rate, channels, format_tag, bits, offset, frames = read_layout(path)
+    block = np.ascontiguousarray(block, dtype='<f4').reshape(-1, channels)
+    with open(path, 'r+b') as f:
+        f.seek(offset + frames * channels * bits // 8)
+        f.write(block.tobytes())
+    truncate(path, frames + len(block))
+    return frames
@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from engine import call_directly
+from instrument import tracer
+
+
+class WorkQueue:
+    # Bounded pool for take post-processing, encoding and disk writes, so none of it runs on the
+    # interaction path. submit() blocks once max_pending jobs are outstanding (backpressure), and
+    # flush() is a barrier for everything submitted so far. Results reach on_done through `dispatch`.
+    def __init__(self, workers=2, max_pending=8, dispatch=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="take-writer")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.dispatch = dispatch or call_directly
+        self.pending = set()
+        self.keys = {}
+        self.lock = threading.Lock()
+
+    def submit(self, job, *args, on_done=None, key=None):
+        if not self.slots.acquire(blocking=False):
+            # Backpressure: the writers are behind
+            tracer.count('work_queue.full')
+            with tracer.span('work_queue_wait'):
+                self.slots.acquire()
+        future = self.executor.submit(job, *args)
+        with self.lock:
+            self.pending.add(future)
+            if key is not None:
+                self.keys[key] = future
+        future.add_done_callback(lambda future: self.job_done(future, on_done, key))
+        return future
+
+    def job_done(self, future, on_done, key):
+        with self.lock:
+            self.pending.discard(future)
+            if key is not None and self.keys.get(key) is future:
+                del self.keys[key]
+        self.slots.release()
+        if on_done is not None:
+            result = None if future.cancelled() or future.exception() is not None else future.result()
+            self.dispatch(on_done, result)
+
+    def wait(self, key, timeout=None):
+        # Waits for the job submitted under `key`, if it is still running
+        with self.lock:
+            future = self.keys.get(key)
+        if future is not None:
+            wait([future], timeout)
+
+    def when_done(self, key, callback):
+        # Non-blocking wait for the interaction path: callback runs through `dispatch` once the job
+        # submitted under `key` has finished, or straight away if there is none
+        with self.lock:
+            future = self.keys.get(key)
+        if future is None:
+            callback()
+        else:
+            future.add_done_callback(lambda future: self.dispatch(callback))
+
+    def flush(self, timeout=None):
+        with self.lock:
+            futures = list(self.pending)
+        done, not_done = wait(futures, timeout)
+        return not not_done
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()